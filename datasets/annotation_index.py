@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+"""
+VOC标注文件的持久化索引，避免每次启动都重新解析全部xml
+"""
+
+import os
+import numpy as np
+from multiprocessing import Pool
+import xml.etree.cElementTree as ET
+
+
+def parse_voc_annotation(anno_path):
+    """
+    解析单个VOC标注文件
+    :param anno_path: xml路径
+    :return: 字典，包括filename,width,height,objects[(class_name, x1, y1, x2, y2)]，缺少size时宽高为0
+    """
+
+    element = ET.parse(anno_path).getroot()
+
+    # 解析基础图片数据
+    element_filename = element.find('filename').text
+    element_filename = element_filename + '.jpg' if '.jpg' not in element_filename else element_filename
+
+    # 没有size节点时宽高记为0，由图像尺寸索引读取文件头补全
+    element_size = element.find('size')
+    element_width, element_height = 0, 0
+    if element_size is not None:
+        element_width = int(element_size.find('width').text)
+        element_height = int(element_size.find('height').text)
+
+    objects = []
+
+    for element_obj in element.findall('object'):
+
+        class_name = element_obj.find('name').text
+        obj_bbox = element_obj.find('bndbox')
+
+        # voc的坐标格式
+        x1 = int(round(float(obj_bbox.find('xmin').text)))
+        y1 = int(round(float(obj_bbox.find('ymin').text)))
+        x2 = int(round(float(obj_bbox.find('xmax').text)))
+        y2 = int(round(float(obj_bbox.find('ymax').text)))
+
+        objects.append((class_name, x1, y1, x2, y2))
+
+    return {'filename': element_filename,
+            'width': element_width,
+            'height': element_height,
+            'objects': objects}
+
+
+def _parse_voc_annotation_safe(anno_path):
+    """
+    解析失败时返回None，进程池中使用
+    """
+    try:
+        return parse_voc_annotation(anno_path)
+    except Exception as e:
+        print(e)
+        return None
+
+
+def parse_voc_annotations(anno_paths, workers=1, chunksize=None):
+    """
+    批量解析VOC标注文件，workers大于1时使用进程池分块解析
+    :param anno_paths: xml路径列表
+    :param workers: 进程数
+    :param chunksize: 每个进程一次领取的文件数，默认按进程数均分为若干块
+    :return: 与anno_paths顺序一致的记录列表，解析失败的位置为None
+    """
+    workers = max(1, int(workers or 1))
+
+    if workers == 1 or len(anno_paths) < 2:
+        return [_parse_voc_annotation_safe(anno_path) for anno_path in anno_paths]
+
+    if chunksize is None:
+        chunksize = max(1, len(anno_paths) // (workers * 4))
+
+    # imap按输入顺序返回结果，保证与单进程解析的顺序一致
+    with Pool(processes=workers) as pool:
+        return list(pool.imap(_parse_voc_annotation_safe, anno_paths, chunksize=chunksize))
+
+
+class VocAnnotationIndex(object):
+    """
+    标注索引，以xml路径为键，记录mtime和size，只有新增或修改过的文件才会重新解析
+    磁盘上是一个npz文件，所有字段都是定长数组，目标框按CSR的方式用offsets切分
+    """
+
+    # 2: 宽高为0表示xml中没有size节点，由图像尺寸索引读取文件头补全
+    VERSION = 2
+
+    def __init__(self, index_path):
+        """
+        :param index_path: 索引文件路径
+        """
+        self.index_path = index_path
+
+        # path -> (mtime_ns, size, record)
+        self.entries = {}
+
+        # 本次更新中重新解析成功和失败(含无法读取)的文件数，以及索引是否需要写回
+        self.parsed_num = 0
+        self.failed_num = 0
+        self.dirty = False
+
+    def load(self):
+        """
+        从磁盘载入索引，文件不存在或版本不一致时视为空索引
+        :return:
+        """
+        self.entries = {}
+
+        if not os.path.exists(self.index_path):
+            return self
+
+        try:
+            with np.load(self.index_path, allow_pickle=False) as data:
+
+                if int(data['version']) != self.VERSION:
+                    return self
+
+                paths = data['paths']
+                mtimes = data['mtimes']
+                sizes = data['sizes']
+                filenames = data['filenames']
+                widths = data['widths']
+                heights = data['heights']
+                offsets = data['offsets']
+                class_names = data['class_names']
+                boxes = data['boxes']
+
+        except Exception as e:
+            print('标注索引损坏，将重新生成: {}'.format(e))
+            return self
+
+        for i, path in enumerate(paths.tolist()):
+            start, end = offsets[i], offsets[i + 1]
+            objects = [(class_name, x1, y1, x2, y2)
+                       for class_name, (x1, y1, x2, y2) in zip(class_names[start:end].tolist(), boxes[start:end].tolist())]
+
+            record = {'filename': str(filenames[i]),
+                      'width': int(widths[i]),
+                      'height': int(heights[i]),
+                      'objects': objects}
+
+            self.entries[path] = (int(mtimes[i]), int(sizes[i]), record)
+
+        return self
+
+    def save(self):
+        """
+        写回磁盘，先写临时文件再替换，避免中断时留下半个索引
+        :return:
+        """
+        paths = sorted(self.entries.keys())
+
+        offsets = np.zeros((len(paths) + 1,), dtype=np.int64)
+        mtimes = np.zeros((len(paths),), dtype=np.int64)
+        sizes = np.zeros((len(paths),), dtype=np.int64)
+        widths = np.zeros((len(paths),), dtype=np.int32)
+        heights = np.zeros((len(paths),), dtype=np.int32)
+        filenames, class_names, boxes = [], [], []
+
+        for i, path in enumerate(paths):
+            mtime, size, record = self.entries[path]
+            mtimes[i] = mtime
+            sizes[i] = size
+            widths[i] = record['width']
+            heights[i] = record['height']
+            filenames.append(record['filename'])
+
+            for class_name, x1, y1, x2, y2 in record['objects']:
+                class_names.append(class_name)
+                boxes.append((x1, y1, x2, y2))
+
+            offsets[i + 1] = offsets[i] + len(record['objects'])
+
+        # 临时文件名带进程号，多个进程同时写回时不会互相覆盖临时文件
+        tmp_path = '{}.{}.tmp'.format(self.index_path, os.getpid())
+
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f,
+                         version=np.array(self.VERSION),
+                         paths=np.array(paths, dtype=str),
+                         mtimes=mtimes,
+                         sizes=sizes,
+                         filenames=np.array(filenames, dtype=str),
+                         widths=widths,
+                         heights=heights,
+                         offsets=offsets,
+                         class_names=np.array(class_names, dtype=str),
+                         boxes=np.array(boxes, dtype=np.int32).reshape((-1, 4)))
+            os.replace(tmp_path, self.index_path)
+            self.dirty = False
+
+        except Exception as e:
+            print('标注索引写入失败: {}'.format(e))
+
+        return self
+
+    def update(self, anno_paths, workers=1):
+        """
+        根据xml列表刷新索引，只解析新增或修改过的文件，删除的文件从索引中移除
+        :param anno_paths: xml路径列表
+        :param workers: 解析使用的进程数
+        :return: 与anno_paths顺序一致的记录列表，解析失败的位置为None
+        """
+        records = [None] * len(anno_paths)
+        stats = [None] * len(anno_paths)
+
+        # 需要重新解析的文件下标
+        stale = []
+        parsed_num, failed_num = 0, 0
+
+        for i, anno_path in enumerate(anno_paths):
+
+            try:
+                stat = os.stat(anno_path)
+            except OSError as e:
+                print(e)
+                failed_num += 1
+                continue
+
+            stats[i] = (stat.st_mtime_ns, stat.st_size)
+            entry = self.entries.get(anno_path)
+
+            if entry is not None and entry[:2] == stats[i]:
+                records[i] = entry[2]
+            else:
+                stale.append(i)
+
+        parsed = parse_voc_annotations([anno_paths[i] for i in stale], workers=workers)
+
+        for i, record in zip(stale, parsed):
+
+            if record is None:
+                self.entries.pop(anno_paths[i], None)
+                failed_num += 1
+                continue
+
+            self.entries[anno_paths[i]] = stats[i] + (record,)
+            records[i] = record
+            parsed_num += 1
+
+        self.parsed_num = parsed_num
+        self.failed_num = failed_num
+        self.dirty = self.dirty or len(stale) > 0
+
+        # 删除已经不存在的文件
+        removed = set(self.entries.keys()) - set(anno_paths)
+        for anno_path in removed:
+            del self.entries[anno_path]
+
+        if removed:
+            self.dirty = True
+
+        return records
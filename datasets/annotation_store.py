@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+"""
+列式(struct-of-arrays)标注存储，所有图片的边框放在一个扁平数组里，按offsets切分
+"""
+
+import sys
+import numpy as np
+
+# 图片文件后缀，标注中的filename可能不带后缀
+IMAGE_SUFFIX = '.jpg'
+
+
+def with_image_suffix(path):
+    """
+    没有.jpg后缀时补上，构建存储时统一处理，生成器中不再修改记录
+    """
+    return path if IMAGE_SUFFIX in path else path + IMAGE_SUFFIX
+
+
+class DetectionAnnotationStore(object):
+    """
+    目标检测标注的列式存储
+    boxes:       [M,(y1,x1,y2,x2)] float32，所有图片的边框
+    label_ids:   [M,] int16，类别id
+    offsets:     [N+1,] int64，第i张图片的边框为boxes[offsets[i]:offsets[i+1]]
+    filenames:   文件名，带.jpg后缀，经过sys.intern驻留
+    """
+
+    def __init__(self, label_names):
+        """
+        :param label_names: 类别名数组，下标为类别id
+        """
+        self.label_names = np.asarray(label_names)
+
+        self.boxes = np.zeros((0, 4), dtype=np.float32)
+        self.label_ids = np.zeros((0,), dtype=np.int16)
+        self.offsets = np.zeros((1,), dtype=np.int64)
+
+        self.filenames = []
+        self.filepaths = []
+        self.types = []
+        self.heights = np.zeros((0,), dtype=np.int32)
+        self.widths = np.zeros((0,), dtype=np.int32)
+
+    @classmethod
+    def from_records(cls, records, class_mapping):
+        """
+        由图片字典列表构造
+        :param records: 字典列表，包含filename,filepath,type,height,width,boxes[(y1,x1,y2,x2)],label_ids
+        :param class_mapping: 类别映射 name -> id
+        :return:
+        """
+        label_names = [''] * (max(class_mapping.values()) + 1 if class_mapping else 0)
+        for name, class_id in class_mapping.items():
+            label_names[class_id] = name
+
+        store = cls(np.array(label_names, dtype=str))
+
+        num_images = len(records)
+        num_boxes = sum(len(record['label_ids']) for record in records)
+
+        store.boxes = np.zeros((num_boxes, 4), dtype=np.float32)
+        store.label_ids = np.zeros((num_boxes,), dtype=np.int16)
+        store.offsets = np.zeros((num_images + 1,), dtype=np.int64)
+        store.heights = np.zeros((num_images,), dtype=np.int32)
+        store.widths = np.zeros((num_images,), dtype=np.int32)
+
+        for i, record in enumerate(records):
+            start = store.offsets[i]
+            end = start + len(record['label_ids'])
+
+            if end > start:
+                store.boxes[start:end] = record['boxes']
+                store.label_ids[start:end] = record['label_ids']
+
+            store.offsets[i + 1] = end
+            store.heights[i] = record['height']
+            store.widths[i] = record['width']
+
+            # 驻留字符串，相同目录和类型只保留一份
+            store.filenames.append(sys.intern(with_image_suffix(record['filename'])))
+            store.filepaths.append(sys.intern(with_image_suffix(record['filepath'])))
+            store.types.append(sys.intern(record['type']))
+
+        store.boxes.flags.writeable = False
+        store.label_ids.flags.writeable = False
+
+        return store
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def indices_of_type(self, image_type):
+        """
+        获取某个类型(trainval/test)的图片下标
+        :param image_type:
+        :return: int64数组
+        """
+        return np.array([i for i, t in enumerate(self.types) if t == image_type], dtype=np.int64)
+
+    def get_boxes(self, index):
+        """
+        获取第index张图片的边框，返回只读视图，不拷贝
+        :param index:
+        :return: [n,(y1,x1,y2,x2)]
+        """
+        return self.boxes[self.offsets[index]:self.offsets[index + 1]]
+
+    def get_label_ids(self, index):
+        return self.label_ids[self.offsets[index]:self.offsets[index + 1]]
+
+    def get_labels(self, index):
+        return self.label_names[self.get_label_ids(index)]
+
+    def record(self, index):
+        """
+        按原来的字典格式返回单张图片信息，每次返回新的字典，对字典的修改不会写回存储
+        boxes与原来的字典列表一致：可写的float64拷贝，没有边框时形状为(0,)
+        :param index:
+        :return:
+        """
+        boxes = self.get_boxes(index)
+        boxes = boxes.astype(np.float64) if len(boxes) else np.zeros((0,), dtype=np.float64)
+
+        return {'filename': self.filenames[index],
+                'filepath': self.filepaths[index],
+                'type': self.types[index],
+                'height': int(self.heights[index]),
+                'width': int(self.widths[index]),
+                'boxes': boxes,
+                'labels': self.get_labels(index)}
+
+
+class ImageListView(object):
+    """
+    列式存储上的图片列表视图，训练集和测试集只是不同的下标数组
+    注意: 每次取元素都由store.record新建字典，修改取出的字典不会影响列表，需要修改时先list()拷贝
+    """
+
+    def __init__(self, store, indices=None):
+        """
+        :param store: DetectionAnnotationStore
+        :param indices: 下标数组，None表示全部图片
+        """
+        self.store = store
+        self.indices = np.arange(len(store), dtype=np.int64) if indices is None else np.asarray(indices, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, item):
+
+        if isinstance(item, slice):
+            return ImageListView(self.store, self.indices[item])
+
+        return self.store.record(self.indices[item])
+
+    def __iter__(self):
+        for index in self.indices:
+            yield self.store.record(index)
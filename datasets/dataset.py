@@ -6,8 +6,8 @@
 模型的输入
 """
 
-import numpy as np
 from .pascal_voc import get_voc_dataset
+from .annotation_store import DetectionAnnotationStore, ImageListView
 
 
 class Dataset(object):
@@ -25,6 +25,7 @@ class Dataset(object):
         self.class_mapping = class_mapping
 
         # 图片字典列表，包含的key有boxes,labels,filename,filepath,type等
+        # 检测数据集中为列式存储上的视图，按下标取出的仍是字典
         self.image_list = []
 
     # 获取图片
@@ -88,43 +89,60 @@ class VocDetectionDataset(VocDataset):
     def __init__(self, path, sub_dir, **kwargs):
         super(VocDetectionDataset, self).__init__(path, sub_dir, **kwargs)
 
-    def prepare(self):
+    def prepare(self, use_index=True, workers=1):
+        """
+        解析标注并生成图片字典列表
+        :param use_index: 是否使用磁盘上的标注索引，只重新解析新增或修改过的xml
+        :param workers: 解析xml的进程数，大于1时使用进程池分块解析，结果顺序与单进程一致
+        :return:
+        """
 
-        img_info_list, classes_count, class_mapping = get_voc_dataset(self.path, self.sub_dir, self.class_mapping)
+        img_info_list, classes_count, class_mapping = get_voc_dataset(self.path, self.sub_dir, self.class_mapping,
+                                                                      use_index=use_index,
+                                                                      workers=workers)
+
+        records = []
 
         for img_info in img_info_list:
 
+            # 没有检测目标的标注
+            if not img_info:
+                continue
+
             image_info = {"filename": img_info['filename'],
                           "filepath": img_info['filepath'],
                           "type"    : img_info['imageset'],
                           'height'  : img_info['height'],
                           'width'   : img_info['width']}
             # GT 边框转换
-            boxes, labels = [], []
+            boxes, label_ids = [], []
 
             # 训练阶段加载边框标注信息
             if self.stage == 'train':
                 for bbox in img_info['bboxes']:
                     y1, x1, y2, x2 = bbox['y1'], bbox['x1'], bbox['y2'], bbox['x2']
                     boxes.append([y1, x1, y2, x2])
-                    # labels.append(bbox['class_id'])
-                    labels.append(bbox['class_name'])
+                    label_ids.append(bbox['class_id'])
+
+            image_info['boxes'] = boxes
+            image_info['label_ids'] = label_ids
 
-            image_info['boxes'] = np.array(boxes)
-            image_info['labels'] = np.array(labels)
+            records.append(image_info)
 
-            self.image_list.append(image_info)
+        # 列式存储，labels通过类别id数组和类别名表还原
+        self.store = DetectionAnnotationStore.from_records(records, class_mapping)
+        self.image_list = ImageListView(self.store)
 
         return self
 
     def get_all_data(self):
 
-        return [info for info in self.get_image_list()]
+        return ImageListView(self.store)
 
     def get_train_data(self):
 
-        return [info for info in self.get_image_list() if info['type'] == self.TRAIN_LABEL]
+        return ImageListView(self.store, self.store.indices_of_type(self.TRAIN_LABEL))
 
     def get_test_data(self):
 
-        return [info for info in self.get_image_list() if info['type'] == self.TEST_LABEL]
+        return ImageListView(self.store, self.store.indices_of_type(self.TEST_LABEL))
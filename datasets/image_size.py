@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+"""
+图像尺寸索引，只读取jpeg文件头获取宽高，不解码图像
+"""
+
+import os
+import struct
+import numpy as np
+
+# 图像尺寸索引默认文件名，保存在数据集目录下
+IMAGE_SIZE_INDEX_FILENAME = 'image_sizes.npz'
+
+
+def read_jpeg_size(f):
+    """
+    从jpeg文件头的SOF段读取宽高
+    :param f: 二进制文件对象
+    :return: (width, height)，不是jpeg时返回None
+    """
+    if f.read(2) != b'\xff\xd8':
+        return None
+
+    while True:
+
+        # 跳到下一个marker
+        byte = f.read(1)
+        while byte and byte != b'\xff':
+            byte = f.read(1)
+        while byte == b'\xff':
+            byte = f.read(1)
+
+        if not byte:
+            return None
+
+        marker = ord(byte)
+
+        # 没有长度字段的marker
+        if marker == 0x01 or 0xd0 <= marker <= 0xd8:
+            continue
+
+        length_bytes = f.read(2)
+        if len(length_bytes) != 2:
+            return None
+        length = struct.unpack('>H', length_bytes)[0]
+
+        # SOF0-SOF15，排除DHT(c4)、JPG(c8)、DAC(cc)
+        if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+            data = f.read(5)
+            if len(data) != 5:
+                return None
+            _, height, width = struct.unpack('>BHH', data)
+            return width, height
+
+        f.seek(length - 2, 1)
+
+
+def read_image_size(image_path):
+    """
+    读取图像宽高，jpeg只读文件头，其他格式交给PIL(同样只读文件头)
+    :param image_path: 图像路径
+    :return: (width, height)
+    """
+    with open(image_path, 'rb') as f:
+        size = read_jpeg_size(f)
+
+    if size is None:
+        from PIL import Image
+        with Image.open(image_path) as image:
+            size = image.size
+
+    return size
+
+
+class ImageSizeIndex(object):
+    """
+    图像尺寸索引，以图像路径为键，记录mtime和size，文件没变化时直接返回缓存的宽高
+    训练集和验证集生成器共用同一个索引文件
+    """
+
+    VERSION = 1
+
+    def __init__(self, index_path):
+        """
+        :param index_path: 索引文件路径
+        """
+        self.index_path = index_path
+
+        # path -> (mtime_ns, size, width, height)
+        self.entries = {}
+        self.dirty = False
+
+    def load(self):
+        """
+        从磁盘载入索引，文件不存在或损坏时视为空索引
+        :return:
+        """
+        self.entries = {}
+
+        if not os.path.exists(self.index_path):
+            return self
+
+        try:
+            with np.load(self.index_path, allow_pickle=False) as data:
+
+                if int(data['version']) != self.VERSION:
+                    return self
+
+                paths = data['paths'].tolist()
+                values = data['values'].tolist()
+
+        except Exception as e:
+            print('图像尺寸索引损坏，将重新生成: {}'.format(e))
+            return self
+
+        for path, value in zip(paths, values):
+            self.entries[path] = tuple(value)
+
+        return self
+
+    def save(self):
+        """
+        写回磁盘，先写临时文件再替换
+        :return:
+        """
+        paths = sorted(self.entries.keys())
+        values = np.array([self.entries[path] for path in paths], dtype=np.int64).reshape((-1, 4))
+
+        # 带进程号，训练和验证的生成器在不同进程中写回时不共用临时文件
+        tmp_path = '{}.{}.tmp'.format(self.index_path, os.getpid())
+
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f,
+                         version=np.array(self.VERSION),
+                         paths=np.array(paths, dtype=str),
+                         values=values)
+            os.replace(tmp_path, self.index_path)
+            self.dirty = False
+
+        except Exception as e:
+            print('图像尺寸索引写入失败: {}'.format(e))
+
+        return self
+
+    def get(self, image_path):
+        """
+        获取图像宽高，索引中没有或文件有变化时读取文件头
+        :param image_path: 图像路径
+        :return: (width, height)
+        """
+        stat = os.stat(image_path)
+        entry = self.entries.get(image_path)
+
+        if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            return entry[2], entry[3]
+
+        width, height = read_image_size(image_path)
+
+        self.entries[image_path] = (stat.st_mtime_ns, stat.st_size, width, height)
+        self.dirty = True
+
+        return width, height
@@ -7,13 +7,20 @@
 """
 
 import os
-import xml.etree.cElementTree as ET
+from .annotation_index import VocAnnotationIndex, parse_voc_annotations
+from .image_size import ImageSizeIndex, IMAGE_SIZE_INDEX_FILENAME
 
-def get_voc_dataset(input_path, sub_dir='VOC2007', class_mapping=[]):
+# 标注索引默认保存在数据集目录下
+INDEX_FILENAME = 'annotations_index.npz'
+
+def get_voc_dataset(input_path, sub_dir='VOC2007', class_mapping=[], use_index=True, index_path=None, workers=1):
     """
     获取VOC数据
     :param input_path: voc数据集路径
     :param class_mapping: 类别映射
+    :param use_index: 是否使用标注索引，只重新解析新增或修改过的xml
+    :param index_path: 索引路径，默认为数据集目录下的annotations_index.npz
+    :param workers: 解析xml的进程数，大于1时使用进程池
     :return: 所有图片数组，分类计数，分类映射
     """
 
@@ -61,83 +68,89 @@ def get_voc_dataset(input_path, sub_dir='VOC2007', class_mapping=[]):
             else:
                 print(e)
 
+        # 集合查找，避免每个文件都在列表里线性查找
+        trainval_files = set(trainval_files)
+        test_files = set(test_files)
+
         annos = [os.path.join(anno_path, s) for s in os.listdir(anno_path)]
         annos.sort()
 
-        idx = 0
-
-        # 解析xml
-        for anno in annos:
-
-            try:
-                idx += 1
-
-                et = ET.parse(anno)
-                element = et.getroot()
-
-                # 解析基础图片数据
-                element_objs = element.findall('object')
-                element_filename = element.find('filename').text
-                element_filename = element_filename + '.jpg' if '.jpg' not in element_filename else element_filename
-                element_width = int(element.find('size').find('width').text)
-                element_height = int(element.find('size').find('height').text)
-
-                annotation_data = {}
-
-                # 如果有检测目标，解析目标数据
-                if len(element_objs) > 0:
-                    annotation_data = {'filename': element_filename,
-                                       'filepath': os.path.join(imgs_path, element_filename),
-                                       'width': element_width,
-                                       'height': element_height,
-                                       'bboxes': []}
-
-                    # 划分训练、测试集
-                    if element_filename in trainval_files:
-                        annotation_data['imageset'] = 'trainval'
-                    elif element_filename in test_files:
-                        annotation_data['imageset'] = 'test'
-                    else:
-                        annotation_data['imageset'] = 'trainval'
+        # 通过索引获取解析结果，只有新增或修改过的xml才会重新解析
+        if use_index:
+            index = VocAnnotationIndex(index_path or os.path.join(data_path, INDEX_FILENAME)).load()
+            records = index.update(annos, workers=workers)
+            print('标记文件{}个，重新解析{}个，解析失败{}个'.format(len(annos), index.parsed_num, index.failed_num))
 
-                # 加入类别映射
-                for element_obj in element_objs:
+            if index.dirty:
+                index.save()
+        else:
+            records = parse_voc_annotations(annos, workers=workers)
+            print('标记文件{}个，解析失败{}个'.format(len(annos), records.count(None)))
 
-                    class_name = element_obj.find('name').text
+        # xml中没有size的图片从图像尺寸索引读取文件头
+        size_index = None
 
-                    if class_name not in classes_count:
-                        classes_count[class_name] = 1
-                    else:
-                        classes_count[class_name] += 1
+        for record in records:
 
-                    if class_name not in class_mapping:
-                        # 类别id从1开始，0保留为背景
-                        class_mapping[class_name] = len(class_mapping) + 1
-
-                    obj_bbox = element_obj.find('bndbox')
-
-                    # voc的坐标格式
-                    x1 = int(round(float(obj_bbox.find('xmin').text)))
-                    y1 = int(round(float(obj_bbox.find('ymin').text)))
-                    x2 = int(round(float(obj_bbox.find('xmax').text)))
-                    y2 = int(round(float(obj_bbox.find('ymax').text)))
-                    # difficulty = int(element_obj.find('difficult').text) == 1
-
-                    annotation_data['bboxes'].append(
-                        {'class_name': class_name,
-                         'class_id': class_mapping[class_name],
-                         'x1': x1, 'x2': x2,
-                         'y1': y1, 'y2': y2,
-                         # 'difficult': difficulty
-                         })
-
-                all_imgs.append(annotation_data)
-
-            except Exception as e:
-
-                print(e)
+            if record is None:
                 continue
 
+            element_filename = record['filename']
+
+            annotation_data = {}
+
+            # 如果有检测目标，解析目标数据
+            if len(record['objects']) > 0:
+                element_filepath = os.path.join(imgs_path, element_filename)
+                element_width, element_height = record['width'], record['height']
+
+                if element_width <= 0 or element_height <= 0:
+                    if size_index is None:
+                        size_index = ImageSizeIndex(os.path.join(data_path, IMAGE_SIZE_INDEX_FILENAME)).load()
+                    try:
+                        element_width, element_height = size_index.get(element_filepath)
+                    except Exception as e:
+                        print(e)
+                        continue
+
+                annotation_data = {'filename': element_filename,
+                                   'filepath': element_filepath,
+                                   'width': element_width,
+                                   'height': element_height,
+                                   'bboxes': []}
+
+                # 划分训练、测试集
+                if element_filename in trainval_files:
+                    annotation_data['imageset'] = 'trainval'
+                elif element_filename in test_files:
+                    annotation_data['imageset'] = 'test'
+                else:
+                    annotation_data['imageset'] = 'trainval'
+
+            # 加入类别映射
+            for class_name, x1, y1, x2, y2 in record['objects']:
+
+                if class_name not in classes_count:
+                    classes_count[class_name] = 1
+                else:
+                    classes_count[class_name] += 1
+
+                if class_name not in class_mapping:
+                    # 类别id从1开始，0保留为背景
+                    class_mapping[class_name] = len(class_mapping) + 1
+
+                annotation_data['bboxes'].append(
+                    {'class_name': class_name,
+                     'class_id': class_mapping[class_name],
+                     'x1': x1, 'x2': x2,
+                     'y1': y1, 'y2': y2,
+                     })
+
+            all_imgs.append(annotation_data)
+
+        if size_index is not None and size_index.dirty:
+            size_index.save()
+
     return all_imgs, classes_count, class_mapping
 
 if __name__ == '__main__':
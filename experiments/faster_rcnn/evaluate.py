@@ -14,6 +14,7 @@ if __name__ == '__main__':
     # 预测结果输出到当前目录
     parse = argparse.ArgumentParser()
     parse.add_argument("--weight_path", type=str, default=None, help="weight path")
+    parse.add_argument("--frozen_graph", type=str, default=None, help="frozen graph path, see export.py")
     argments = parse.parse_args(sys.argv[1:])
 
     # 执行评估
@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+import sys
+import argparse
+sys.path.append('../../..')
+
+from taurus_cv.models.faster_rcnn.export import export
+from taurus_cv.models.faster_rcnn.config import current_config as config
+
+if __name__ == '__main__':
+
+    # 导出冻结的推理图，evaluate.py和inference.py通过--frozen_graph直接载入
+    parse = argparse.ArgumentParser()
+    parse.add_argument("--output_path", type=str, default='./faster-rcnn.pb', help="frozen graph path")
+    parse.add_argument("--weight_path", type=str, default=None, help="weight path")
+    parse.add_argument("--stage", type=str, default='rcnn', help="stage: rpn、rcnn")
+    parse.add_argument("--fold_bn", action='store_true', help="fold BatchNormalization into convolutions")
+    argments = parse.parse_args(sys.argv[1:])
+
+    export(config, argments.output_path, weight_path=argments.weight_path, stage=argments.stage, fold_bn=argments.fold_bn)
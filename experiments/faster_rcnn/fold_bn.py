@@ -0,0 +1,21 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+import sys
+import argparse
+sys.path.append('../../..')
+
+from taurus_cv.models.faster_rcnn.fold_bn import benchmark_fold_bn
+from taurus_cv.models.faster_rcnn.config import current_config as config
+
+if __name__ == '__main__':
+
+    # 对比折叠BN前后的输出误差和推理延迟，导出时使用export.py --fold_bn
+    parse = argparse.ArgumentParser()
+    parse.add_argument("--weight_path", type=str, default=None, help="weight path")
+    parse.add_argument("--image_id", type=int, default=0, help="test image index")
+    parse.add_argument("--runs", type=int, default=20, help="timed runs")
+    argments = parse.parse_args(sys.argv[1:])
+
+    benchmark_fold_bn(config, weight_path=argments.weight_path, image_id=argments.image_id, runs=argments.runs)
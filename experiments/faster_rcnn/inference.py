@@ -15,10 +15,11 @@ if __name__ == '__main__':
     # 预测结果输出到当前目录
     parse = argparse.ArgumentParser()
     parse.add_argument("--stages", type=str, nargs='+', default=['rcnn'], help="stages: rpn、rcnn")
+    parse.add_argument("--frozen_graph", type=str, default=None, help="frozen graph path, see export.py")
     argments = parse.parse_args(sys.argv[1:])
 
     if 'rpn' in argments.stages:
-        inference_rpn(config, output_dir='./predicted_images')
+        inference_rpn(config, output_dir='./predicted_images', frozen_graph=argments.frozen_graph)
     else:
-        inference(config, output_dir='./predicted_images')
+        inference(config, output_dir='./predicted_images', frozen_graph=argments.frozen_graph)
 
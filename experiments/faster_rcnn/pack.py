@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+import sys
+import argparse
+sys.path.append('../../..')
+
+from taurus_cv.models.faster_rcnn.io.input import get_prepared_detection_dataset
+from taurus_cv.models.faster_rcnn.preprocessing.shards import pack_shards
+from taurus_cv.models.faster_rcnn.config import current_config as config
+
+if __name__ == '__main__':
+
+    # 将训练集打包为预先缩放的分片，在config.ini中设置shard_path后训练时直接读取分片
+    parse = argparse.ArgumentParser()
+    parse.add_argument("--output_dir", type=str, default=None, help="shard dir, default config.shard_path")
+    parse.add_argument("--shard_size", type=int, default=512, help="images per shard")
+    parse.add_argument("--subset", type=str, default='train', help="subset: train、test、all")
+    argments = parse.parse_args(sys.argv[1:])
+
+    dataset = get_prepared_detection_dataset(config)
+
+    if argments.subset == 'test':
+        image_list = dataset.get_test_data()
+    elif argments.subset == 'all':
+        image_list = dataset.get_all_data()
+    else:
+        image_list = dataset.get_train_data()
+
+    output_dir = argments.output_dir or config.shard_path
+    num = pack_shards(image_list, output_dir, int(config.IMAGE_MAX_DIM), shard_size=argments.shard_size)
+
+    print('打包完成:{}张图片 -> {}'.format(num, output_dir))
@@ -13,9 +13,11 @@ import cv2
 from matplotlib import pyplot as plt
 
 from taurus_cv.models.retinanet.model.pascal_voc import save_annotations
-from taurus_cv.models.retinanet.model.image import read_image_bgr, preprocess_image, resize_image, read_image_rgb
+from taurus_cv.models.retinanet.model.image import read_resized_image_bgr, preprocess_image, read_image_rgb
 from taurus_cv.models.retinanet.model.resnet import resnet_retinanet
 from taurus_cv.models.retinanet.config import Config
+from taurus_cv.utils.frozen_graph import FrozenGraph
+from taurus_cv.utils.quantize_weights import load_quantized_weights
 
 start_time = time.time()
 
@@ -34,20 +36,31 @@ if os.path.isfile(config.pretrained_weights_path):
     wpath = config.pretrained_weights_path
     classes = config.classes
 
-if config.type.startswith('resnet'):
-    model, _ = resnet_retinanet(len(classes), backbone=config.type, weights='imagenet', nms=True)
+# 配置为使用冻结的推理图(export.py导出)时直接载入，不重建网络和载入权重；推理图比权重旧时仍使用权重
+if config.use_frozen_graph and os.path.isfile(config.frozen_graph_path) \
+        and (not os.path.isfile(wpath) or os.path.getmtime(config.frozen_graph_path) >= os.path.getmtime(wpath)):
+    model = FrozenGraph(config.frozen_graph_path)
+    print("冻结推理图", config.frozen_graph_path)
 else:
-    model = None
-    print("模型 ({})".format(config.type))
-    exit(1)
-
-print("backend: ", config.type)
-
-if os.path.isfile(wpath):
-    model.load_weights(wpath, by_name=True, skip_mismatch=True)
-    print("权重" + wname)
-else:
-    print("权重None")
+    if config.type.startswith('resnet'):
+        model, _ = resnet_retinanet(len(classes), backbone=config.type, weights='imagenet', nms=True, uint8_inputs=config.uint8_inputs)
+    else:
+        model = None
+        print("模型 ({})".format(config.type))
+        exit(1)
+
+    print("backend: ", config.type)
+
+    # 配置为使用量化权重(quantize.py导出)时载入并反量化，文件比训练权重旧时仍使用训练权重
+    if config.use_quantized_weights and os.path.isfile(config.quantized_weights_path) \
+            and (not os.path.isfile(wpath) or os.path.getmtime(config.quantized_weights_path) >= os.path.getmtime(wpath)):
+        load_quantized_weights(model, config.quantized_weights_path)
+        print("量化权重", config.quantized_weights_path)
+    elif os.path.isfile(wpath):
+        model.load_weights(wpath, by_name=True, skip_mismatch=True)
+        print("权重" + wname)
+    else:
+        print("权重None")
 
 start_index = config.test_start_index
 font = cv2.FONT_HERSHEY_SIMPLEX
@@ -63,11 +76,12 @@ for nimage, imgf in enumerate(sorted(os.listdir(config.test_images_path))):
     imgfp = os.path.join(config.test_images_path, imgf)
     if os.path.isfile(imgfp):
         try:
-            img = read_image_bgr(imgfp)
+            # 按输入尺寸降低分辨率解码，scale仍是相对原图的比例
+            img, scale = read_resized_image_bgr(imgfp, min_side=config.img_min_size, max_side=config.img_max_size)
         except:
             continue
-        img = preprocess_image(img.copy())
-        img, scale = resize_image(img, min_side=config.img_min_size, max_side=config.img_max_size)
+        if not config.uint8_inputs:
+            img = preprocess_image(img)
 
         orig_image = read_image_rgb(imgfp)
 
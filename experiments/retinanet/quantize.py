@@ -0,0 +1,124 @@
+import sys
+sys.path.append('../../..')
+
+import io
+import os
+import time
+from contextlib import redirect_stdout
+
+import keras
+import numpy as np
+
+from taurus_cv.models.retinanet.config import Config
+from taurus_cv.models.retinanet.model.generator import split_annotation_ids
+from taurus_cv.models.retinanet.model.image import read_resized_image_bgr, preprocess_image
+from taurus_cv.models.retinanet.model.pascal_voc import PascalVocGenerator
+from taurus_cv.models.retinanet.model.resnet import resnet_retinanet
+from taurus_cv.models.faster_rcnn.utils.eval_utils import voc_eval
+from taurus_cv.utils.quantize_weights import quantize_model_weights, load_quantized_weights
+
+# 训练后量化权重，并在验证集的一部分图像上对比量化前后的mAP
+# config中use_quantized_weights为true时inference.py载入量化权重
+config = Config('configRetinaNet.json')
+
+
+def evaluate_map(model, generator, score_threshold=0.05, max_detections=100):
+    """
+    按evaluate.py的预测方式计算mAP，边框为原图坐标(x1,y1,x2,y2)
+    :param model: 带nms的retinanet
+    :param generator: PascalVocGenerator，只用于读取图像路径和标注
+    :return: mAP, 每个类别的ap(只包含有标注的类别)
+    """
+    num_classes = generator.num_classes()
+    all_annotations = []
+    all_detections = []
+
+    for index in range(generator.size()):
+        imgfp = os.path.join(generator.images_path, generator.image_names[index] + '.jpg')
+        img, scale = read_resized_image_bgr(imgfp, min_side=config.img_min_size, max_side=config.img_max_size)
+        if not config.uint8_inputs:
+            img = preprocess_image(img)
+
+        _, _, detections = model.predict_on_batch(np.expand_dims(img, axis=0))
+
+        detections[:, :, 0] = np.maximum(0, detections[:, :, 0])
+        detections[:, :, 1] = np.maximum(0, detections[:, :, 1])
+        detections[:, :, 2] = np.minimum(img.shape[1], detections[:, :, 2])
+        detections[:, :, 3] = np.minimum(img.shape[0], detections[:, :, 3])
+
+        detections[0, :, :4] /= scale
+
+        scores = detections[0, :, 4:]
+        indices = np.where(scores >= score_threshold)
+        scores = scores[indices]
+        scores_sort = np.argsort(-scores)[:max_detections]
+
+        image_boxes = detections[0, indices[0][scores_sort], :4]
+        image_detections = np.append(image_boxes, np.expand_dims(scores[scores_sort], axis=1), axis=1)
+        image_predicted_labels = indices[1][scores_sort]
+
+        annotations = generator.load_annotations(index)
+
+        all_detections.append([image_detections[image_predicted_labels == class_id] for class_id in range(num_classes)])
+        all_annotations.append([annotations[annotations[:, 4] == class_id, :4] for class_id in range(num_classes)])
+
+    # voc_eval逐类别打印召回率和精度，这里只需要ap
+    with redirect_stdout(io.StringIO()):
+        ap = voc_eval(all_annotations, all_detections, iou_threshold=0.5, use_07_metric=True)
+
+    # 校准子集中没有标注的类别ap为0，计入mAP会按缺失类别的比例稀释量化前后的差值
+    gt_nums = [sum(len(annotations[class_id]) for annotations in all_annotations) for class_id in range(num_classes)]
+    ap = {class_id: ap[class_id] for class_id in range(num_classes) if gt_nums[class_id] > 0}
+
+    if not ap:
+        return float('nan'), ap
+
+    return float(np.mean(list(ap.values()))), ap
+
+
+keras.backend.set_learning_phase(0)
+
+wpath = config.trained_weights_path
+if not os.path.isfile(wpath):
+    wpath = config.pretrained_weights_path
+
+if not os.path.isfile(wpath):
+    print("权重不存在({})".format(config.trained_weights_path))
+    exit(1)
+
+if config.type.startswith('resnet'):
+    model, _ = resnet_retinanet(len(config.classes), backbone=config.type, weights=None, nms=True, uint8_inputs=config.uint8_inputs)
+else:
+    print("模型 ({})".format(config.type))
+    exit(1)
+
+start = time.time()
+model.load_weights(wpath, by_name=True, skip_mismatch=True)
+float_load_time = time.time() - start
+
+# 校准子集：验证集的前calibration_images张，不打乱以保证两次评估使用相同的图像
+train_ids, val_ids = split_annotation_ids(config.annotations_path, config.train_val_split, shuffle=False)
+calibration_ids = (val_ids or train_ids)[:config.calibration_images]
+
+generator = PascalVocGenerator(
+    config.annotations_path,
+    config.images_path,
+    calibration_ids,
+    config.classes,
+    image_min_side=config.img_min_size,
+    image_max_side=config.img_max_size,
+    transform_generator=None,
+    batch_size=1
+)
+
+float_map, _ = evaluate_map(model, generator)
+
+stats = quantize_model_weights(model, config.quantized_weights_path, mode=config.quantize_mode)
+
+# 同一个模型载入反量化后的权重再评估
+load_stats = load_quantized_weights(model, config.quantized_weights_path)
+quantized_map, quantized_ap = evaluate_map(model, generator)
+
+print("权重文件: {} 字节 -> {} 字节 ({:.2f}x)".format(os.path.getsize(wpath), stats['file_bytes'], os.path.getsize(wpath) / float(stats['file_bytes'])))
+print("载入时间: {:.3f}s -> {:.3f}s".format(float_load_time, load_stats['load_time']))
+print("mAP({}张, {}个类别): {:.4f} -> {:.4f} 差值:{:+.4f}".format(generator.size(), len(quantized_ap), float_map, quantized_map, quantized_map - float_map))
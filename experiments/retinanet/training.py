@@ -13,17 +13,19 @@ from keras.utils import plot_model
 
 from taurus_cv.models.retinanet.config import Config
 from taurus_cv.models.retinanet.model.callbacks import get_callbacks
-from taurus_cv.models.retinanet.model.generator import get_generators
+from taurus_cv.models.retinanet.model.generator import get_generators, get_sequences
 from taurus_cv.models.retinanet.model.loss import getLoss
 from taurus_cv.models.retinanet.model.optimizer import get_optimizer
 from taurus_cv.models.retinanet.model.resnet import resnet_retinanet
+from taurus_cv.models.retinanet.model.target_cache import precompute_targets
+from taurus_cv.utils.buffer_ring import required_ring_size
 
 # 获取配置
 config = Config('configRetinaNet.json')
 
 # 如果使用resnet
 if config.type.startswith('resnet'):
-    model, bodyLayers = resnet_retinanet(len(config.classes), backbone=config.type, weights='imagenet', nms=True)
+    model, bodyLayers = resnet_retinanet(len(config.classes), backbone=config.type, weights='imagenet', nms=True, uint8_inputs=config.uint8_inputs)
 else:
     model = None
     bodyLayers = None
@@ -53,22 +55,58 @@ if config.do_freeze_layers:
     # model.summary()
 
 # 编译模型
-model.compile(loss=getLoss(), optimizer=get_optimizer(config.base_lr), metrics=['accuracy'])
+# 紧凑编码的分类目标与输出形状不同，不能计算accuracy
+model.compile(loss=getLoss(compact_targets=config.compact_targets),
+              optimizer=get_optimizer(config.base_lr),
+              metrics=None if config.compact_targets else ['accuracy'])
 
 if config.model_image:
     plot_model(model, to_file='model_image.jpg')
 
 
 # 数据生成器
-train_generator, val_generator, n_train_samples, n_val_samples = get_generators(config.images_path,
-                                                                                config.annotations_path,
-                                                                                config.train_val_split,
-                                                                                config.batch_size,
-                                                                                config.classes,
-                                                                                img_min_size=config.img_min_size,
-                                                                                img_max_size=config.img_max_size,
-                                                                                transform=config.augmentation,
-                                                                                debug=False)
+# fit_generator的队列长度，单进程生成器的缓冲环按它和workers计算大小
+max_queue_size = 10
+
+# 多进程时使用Sequence，anchor目标在worker进程中计算
+if config.workers > 1:
+    train_generator, val_generator, n_train_samples, n_val_samples = get_sequences(config.images_path,
+                                                                                   config.annotations_path,
+                                                                                   config.train_val_split,
+                                                                                   config.batch_size,
+                                                                                   config.classes,
+                                                                                   img_min_size=config.img_min_size,
+                                                                                   img_max_size=config.img_max_size,
+                                                                                   transform=config.augmentation,
+                                                                                   reduced_decode=config.reduced_decode,
+                                                                                   uint8_inputs=config.uint8_inputs,
+                                                                                   tf_augmentation=config.tf_augmentation,
+                                                                                   compact_targets=config.compact_targets,
+                                                                                   target_cache_dir=config.target_cache_dir,
+                                                                                   parse_workers=config.parse_workers)
+else:
+    train_generator, val_generator, n_train_samples, n_val_samples = get_generators(config.images_path,
+                                                                                    config.annotations_path,
+                                                                                    config.train_val_split,
+                                                                                    config.batch_size,
+                                                                                    config.classes,
+                                                                                    img_min_size=config.img_min_size,
+                                                                                    img_max_size=config.img_max_size,
+                                                                                    transform=config.augmentation,
+                                                                                    reduced_decode=config.reduced_decode,
+                                                                                    uint8_inputs=config.uint8_inputs,
+                                                                                    tf_augmentation=config.tf_augmentation,
+                                                                                    compact_targets=config.compact_targets,
+                                                                                    target_cache_dir=config.target_cache_dir,
+                                                                                    parse_workers=config.parse_workers,
+                                                                                    ring_size=required_ring_size(max_queue_size, config.workers),
+                                                                                    debug=False)
+
+# 不做数据增强时预先计算所有图像的anchor目标，训练时直接读取缓存
+if config.target_cache_dir and not config.augmentation:
+    for generator in (train_generator, val_generator):
+        if generator is not None:
+            precompute_targets(getattr(generator, 'generator', generator))
 
 callbacks = get_callbacks(config)
 # (1, 512, 512, 3) (1, 196416, 5) (1, 196416, 8)
@@ -81,6 +119,9 @@ model.fit_generator(generator=train_generator,
                     epochs=config.epochs,
                     callbacks=callbacks,
                     validation_data=val_generator,
-                    validation_steps=ceil(n_val_samples / config.batch_size))
+                    validation_steps=ceil(n_val_samples / config.batch_size),
+                    max_queue_size=max_queue_size,
+                    workers=config.workers,
+                    use_multiprocessing=config.workers > 1)
 
 model.save_weights(config.trained_weights_path)
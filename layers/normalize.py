@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+"""
+图像归一化层，输入uint8图像，在图中转为float并减去均值；不给均值时只做类型转换
+"""
+
+import keras
+import numpy as np
+
+
+class NormalizeImage(keras.layers.Layer):
+    """
+    图像归一化层
+    主机端直接喂uint8图像，数据量是float32的1/4，类型转换和减均值作为图中的算子执行，
+    放在哪个设备上由TensorFlow的设备分配决定
+    """
+
+    def __init__(self, mean=None, std=None, **kwargs):
+        """
+        :param mean: 每个通道的均值，通道顺序与输入一致，None表示不减
+        :param std: 每个通道的标准差，None表示不除
+        """
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float32)
+        self.std = None if std is None else np.asarray(std, dtype=np.float32)
+        super(NormalizeImage, self).__init__(**kwargs)
+
+    def call(self, inputs, **kwargs):
+        x = keras.backend.cast(inputs, keras.backend.floatx())
+
+        # channels_first时均值按通道维广播
+        if keras.backend.image_data_format() == 'channels_first':
+            mean = None if self.mean is None else self.mean.reshape((-1, 1, 1))
+            std = None if self.std is None else self.std.reshape((-1, 1, 1))
+        else:
+            mean, std = self.mean, self.std
+
+        if mean is not None:
+            x = x - keras.backend.constant(mean)
+
+        if std is not None:
+            x = x / keras.backend.constant(std)
+
+        return x
+
+    def compute_output_shape(self, input_shape):
+        return input_shape
+
+    def get_config(self):
+        config = {
+            'mean': None if self.mean is None else self.mean.tolist(),
+            'std': None if self.std is None else self.std.tolist(),
+        }
+        base_config = super(NormalizeImage, self).get_config()
+        return dict(list(base_config.items()) + list(config.items()))
@@ -51,6 +51,9 @@ class Config(object):
     RPN_ANCHOR_NUM = len(RPN_ANCHOR_SCALES) * len(RPN_ANCHOR_RATIOS)
     # RPN_ANCHOR_STRIDE = 1
 
+    # 输入尺寸固定时anchors预先用NumPy计算并作为常量嵌入图中，完全在图像外的anchors从rpn输出中删除
+    RPN_STATIC_ANCHORS = False
+
     # 不同数据集这个阈值不同
     RPN_SCORE_THRESHOLD = 0.1
 
@@ -64,6 +67,12 @@ class Config(object):
     RPN_POSITIVE_THRESHOLD=0.2
     RPN_NEGATIVE_THRESHOLD=0.2
 
+    # 训练和预测阶段NMS前每张图像保留前景分数最高的anchors数，None保留全部
+    # 按anchors总数取值：608输入、stride 16、9种anchor共38*38*9=12996个，训练保留约一半，预测保留约四分之一
+    # 修改IMAGE_MAX_DIM、BACKBONE_STRIDE或anchor种类时应按比例调整
+    PRE_NMS_TOP_K_TRAIN = 6000
+    PRE_NMS_TOP_K_INFERENCE = 3000
+
     # 训练和预测阶段NMS后保留的ROIs数
     POST_NMS_ROIS_TRAIN = 2000
     POST_NMS_ROIS_INFERENCE = 1000
@@ -75,6 +84,9 @@ class Config(object):
     # Image mean (RGB)
     MEAN_PIXEL = np.array([123.7, 116.8, 103.9])
 
+    # 输入为uint8图像，在图中转为float；与float输入一样不减MEAN_PIXEL，已有的权重不需要重新训练
+    IMAGE_UINT8_INPUT = False
+
     # Pooled ROIs
     POOL_SIZE = 7
     MASK_POOL_SIZE = 14
@@ -95,6 +107,9 @@ class Config(object):
     # 检测MNS阈值
     DETECTION_NMS_THRESHOLD = 0.3
 
+    # 检测框的类别相关nms整个batch只调用一次nms(边框按图像和类别平移后展平)，否则逐张图像做nms
+    DETECTION_BATCH_NMS = False
+
     # 训练参数
     LEARNING_RATE = 0.001
     LEARNING_MOMENTUM = 0.9
@@ -162,6 +177,16 @@ class VocConfig(Config):
     voc_sub_dir = 'VOC2007'
     log_path = './logs'
 
+    # 预先缩放的图像分片目录，由experiments/faster_rcnn/pack.py生成，为空时读取原始jpeg
+    shard_path = ''
+
+    # 预取深度，0表示不预取；worker数；是否用进程代替线程；是否保持采样顺序；每隔多少batch打印预取统计
+    prefetch_depth = 0
+    prefetch_workers = 4
+    prefetch_use_processes = False
+    prefetch_deterministic = True
+    prefetch_log_every = 0
+
     # 特征提取的层
     backbone_output_layer_name = None
 
@@ -15,6 +15,7 @@ from taurus_cv.models.faster_rcnn.preprocessing import image as image_utils
 from taurus_cv.models.faster_rcnn.utils import np_utils, eval_utils
 from taurus_cv.models.faster_rcnn.layers import network
 from taurus_cv.models.faster_rcnn.training import trainer
+from taurus_cv.utils.frozen_graph import FrozenGraph
 from taurus_cv.utils.spe import spe
 
 
@@ -28,13 +29,16 @@ def evaluate(args, config, image_num=200):
 
     print("测试集图片数量:{}".format(len(test_image_list)))
 
-    # 加载模型
-    model = network.faster_rcnn(config, stage='test')
-
-    if args.weight_path is not None:
-        model.load_weights(args.weight_path, by_name=True)
+    # 加载模型，有冻结的推理图时直接载入，不重建网络
+    if getattr(args, 'frozen_graph', None):
+        model = FrozenGraph(args.frozen_graph)
     else:
-        model.load_weights(config.rcnn_weights, by_name=True)
+        model = network.faster_rcnn(config, stage='test')
+
+        if args.weight_path is not None:
+            model.load_weights(args.weight_path, by_name=True)
+        else:
+            model.load_weights(config.rcnn_weights, by_name=True)
 
     # model.summary()
 
@@ -87,5 +91,6 @@ if __name__ == '__main__':
 
     parse = argparse.ArgumentParser()
     parse.add_argument("--weight_path", type=str, default=None, help="weight path")
+    parse.add_argument("--frozen_graph", type=str, default=None, help="frozen graph path")
     argments = parse.parse_args(sys.argv[1:])
     evaluate(argments)
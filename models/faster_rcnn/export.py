@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+"""
+导出冻结的推理图
+"""
+
+import keras
+
+from taurus_cv.models.faster_rcnn.layers import network
+from taurus_cv.models.faster_rcnn.training import trainer
+from taurus_cv.utils.frozen_graph import freeze_model, missing_weight_layers
+from taurus_cv.utils.fold_batch_norm import fold_batch_norms
+
+
+def export(config, output_path, weight_path=None, stage='rcnn', fold_bn=False):
+    """
+    构建推理网络、载入权重并冻结，推理网络不包括RpnTarget、DetectTarget和损失层
+    :param config:
+    :param output_path: pb文件路径
+    :param weight_path: 权重路径，默认使用config中的权重
+    :param stage: rpn或rcnn
+    :param fold_bn: 把BN折叠进前面的卷积
+    :return:
+    """
+    # 设置运行时环境 / training.trainer模块
+    trainer.set_runtime_environment()
+
+    # 推理模式，BN和Dropout使用推理时的计算
+    keras.backend.set_learning_phase(0)
+
+    if stage == 'rpn':
+        model = network.rpn_net(config, stage='test')
+        weight_path = weight_path or config.rpn_weights
+    else:
+        model = network.faster_rcnn(config, stage='test')
+        weight_path = weight_path or config.rcnn_weights
+
+    # 缺少的层会被by_name静默跳过，导出的图中这些层只有初始权重
+    missing = missing_weight_layers(model, weight_path)
+    if missing:
+        raise ValueError('权重文件中缺少以下层({}): {}'.format(weight_path, ', '.join(missing)))
+
+    model.load_weights(weight_path, by_name=True)
+
+    if fold_bn:
+        model, folded_num = fold_batch_norms(model)
+        print('折叠BN:{}'.format(folded_num))
+
+    node_num = freeze_model(model, output_path)
+
+    print('导出完成:{} 节点数:{}'.format(output_path, node_num))
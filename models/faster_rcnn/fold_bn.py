@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+"""
+BN折叠的误差和延迟评测
+"""
+
+import keras
+import numpy as np
+
+from taurus_cv.models.faster_rcnn.io.input import get_prepared_detection_dataset
+from taurus_cv.models.faster_rcnn.preprocessing import image as image_utils
+from taurus_cv.models.faster_rcnn.layers import network
+from taurus_cv.models.faster_rcnn.training import trainer
+from taurus_cv.utils.fold_batch_norm import fold_and_benchmark
+
+# 对比误差的层，都在检测的nms之前
+COMPARE_LAYERS = ['rpn_class_logits', 'rpn_deltas', 'rcnn_class_logits', 'rcnn_deltas']
+
+
+def benchmark_fold_bn(config, weight_path=None, image_id=0, runs=20):
+    """
+    在一张测试图像上对比折叠BN前后推理网络的输出和延迟
+    对比nms之前的输出：rpn的分类和回归覆盖骨干网络的全部BN；rcnn的分类和回归在rpn的nms之后，
+    只有rpn输出的误差改变了proposal时才会偏大
+    :param config:
+    :param weight_path: 权重路径，默认使用config中的权重
+    :param image_id: 测试图像下标
+    :param runs: 计时次数
+    :return: 统计信息
+    """
+    # 设置运行时环境 / training.trainer模块
+    trainer.set_runtime_environment()
+
+    # 推理模式，BN使用滑动均值和方差
+    keras.backend.set_learning_phase(0)
+
+    test_image_list = get_prepared_detection_dataset(config).get_test_data()
+    image, image_meta, _ = image_utils.load_image_gt(image_id, test_image_list[image_id]['filepath'], config.IMAGE_MAX_DIM, test_image_list[image_id]['boxes'])
+    inputs = [np.expand_dims(image, axis=0), np.expand_dims(image_meta, axis=0)]
+
+    model = network.faster_rcnn(config, stage='test')
+    model.load_weights(weight_path or config.rcnn_weights, by_name=True)
+
+    _, stats = fold_and_benchmark(model, inputs, runs=runs, compare_layers=COMPARE_LAYERS)
+
+    return stats
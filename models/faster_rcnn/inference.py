@@ -19,10 +19,11 @@ from taurus_cv.models.faster_rcnn.layers import network
 from taurus_cv.models.faster_rcnn.utils import visualize, np_utils
 from taurus_cv.models.faster_rcnn.preprocessing.image import load_image_gt
 from taurus_cv.models.faster_rcnn.training import trainer
+from taurus_cv.utils.frozen_graph import FrozenGraph
 from taurus_cv.utils.spe import spe
 
 
-def inference(config, output_dir):
+def inference(config, output_dir, frozen_graph=None):
 
     # 设置运行时环境 / training.trainer模块
     trainer.set_runtime_environment()
@@ -30,9 +31,12 @@ def inference(config, output_dir):
     # 加载数据
     test_img_list = get_prepared_detection_dataset(config).get_test_data()
 
-    # 加载模型
-    model = network.faster_rcnn(config, stage='test')
-    model.load_weights(config.rcnn_weights, by_name=True)
+    # 加载模型，有冻结的推理图时直接载入，不重建网络
+    if frozen_graph:
+        model = FrozenGraph(frozen_graph)
+    else:
+        model = network.faster_rcnn(config, stage='test')
+        model.load_weights(config.rcnn_weights, by_name=True)
 
     # model.summary()
 
@@ -83,7 +87,7 @@ def inference(config, output_dir):
     print('可视化到:{}'.format(save_img_filename))
 
 
-def inference_rpn(config, output_dir):
+def inference_rpn(config, output_dir, frozen_graph=None):
 
     # 设置运行时环境 / training.trainer模块
     trainer.set_runtime_environment()
@@ -92,8 +96,11 @@ def inference_rpn(config, output_dir):
     test_img_list = get_prepared_detection_dataset(config).get_test_data()
 
     # 加载模型
-    model = network.rpn_net(config, stage='test')
-    model.load_weights(config.rpn_weights, by_name=True)
+    if frozen_graph:
+        model = FrozenGraph(frozen_graph)
+    else:
+        model = network.rpn_net(config, stage='test')
+        model.load_weights(config.rpn_weights, by_name=True)
 
     # class map 转为 id map
     id_mapping = class_map_to_id_map(config.CLASS_MAPPING)
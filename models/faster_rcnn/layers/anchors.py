@@ -78,6 +78,88 @@ class Anchor(keras.layers.Layer):
         return (input_shape[0],
                 total, 4)
 
+class StaticAnchor(keras.layers.Layer):
+    """
+    静态Anchor层，输入尺寸固定时anchors是常量，预先用NumPy计算后嵌入图中
+    输出[N,(y1,x1,y2,x2)]，不按batch复制，由后续的批量运算广播
+    """
+
+    def __init__(self, anchors, **kwargs):
+        """
+        :param anchors: static_anchors计算的anchors，[N,(y1,x1,y2,x2)]
+        """
+        self.anchors = np.asarray(anchors, dtype=np.float32)
+        super(StaticAnchor, self).__init__(**kwargs)
+
+    def call(self, inputs, **kwargs):
+        """
+        :param inputs: 卷积层特征，只用于连接计算图
+        :return: [N,4]
+        """
+        return tf.constant(self.anchors, dtype=tf.float32)
+
+    def compute_output_shape(self, input_shape):
+        return self.anchors.shape
+
+
+class SelectAnchors(keras.layers.Layer):
+    """
+    按anchor索引筛选rpn输出，与StaticAnchor删除的anchors对应
+    """
+
+    def __init__(self, indices, **kwargs):
+        """
+        :param indices: 保留的anchor索引，一维
+        """
+        self.indices = np.asarray(indices, dtype=np.int32)
+        super(SelectAnchors, self).__init__(**kwargs)
+
+    def call(self, inputs, **kwargs):
+        """
+        :param inputs: rpn输出列表，每个为[batch_size,anchor_num,C]
+        :return: [batch_size,len(indices),C]列表
+        """
+        return [tf.gather(x, self.indices, axis=1) for x in inputs]
+
+    def compute_output_shape(self, input_shape):
+        return [(shape[0], self.indices.shape[0]) + tuple(shape[2:]) for shape in input_shape]
+
+
+def static_anchors(feature_shape, base_size, ratios, scales, strides, image_shape):
+    """
+    用NumPy计算固定输入尺寸下的所有anchors，与Anchor层加UniqueClipBoxes的结果一致
+    完全在图像外的anchors删除
+    :param feature_shape: 特征图(H,W)
+    :param base_size: anchor的base_size
+    :param ratios: 长宽比
+    :param scales: 缩放比
+    :param strides: 步长
+    :param image_shape: 输入图像形状(H,W,C)或(H,W)
+    :return: anchors [N,(y1,x1,y2,x2)] float32, 保留的anchor在原始顺序中的索引 [N]
+    """
+    base_anchors = generate_anchors(base_size, ratios, scales)
+
+    # 与shift一致的锚点坐标，顺序为(H,W,anchor_num)
+    ctr_x = (np.arange(feature_shape[1], dtype=np.float32) + 0.5) * strides
+    ctr_y = (np.arange(feature_shape[0], dtype=np.float32) + 0.5) * strides
+    ctr_x, ctr_y = np.meshgrid(ctr_x, ctr_y)
+
+    shifts = np.stack([ctr_y.ravel(), ctr_x.ravel(), ctr_y.ravel(), ctr_x.ravel()], axis=1)
+    anchors = (shifts[:, np.newaxis, :] + base_anchors[np.newaxis, :, :].astype(np.float32)).reshape((-1, 4))
+
+    # 完全在图像外的anchors，裁剪后面积为0
+    height, width = float(image_shape[0]), float(image_shape[1])
+    outside = np.logical_or.reduce([anchors[:, 2] <= 0, anchors[:, 3] <= 0, anchors[:, 0] >= height, anchors[:, 1] >= width])
+    indices = np.where(~outside)[0].astype(np.int32)
+
+    # 裁剪到图像内
+    anchors = anchors[indices]
+    anchors[:, [0, 2]] = np.clip(anchors[:, [0, 2]], 0., height)
+    anchors[:, [1, 3]] = np.clip(anchors[:, [1, 3]], 0., width)
+
+    return anchors.astype(np.float32), indices
+
+
 def generate_anchors(base_size, ratios, scales):
     """
     根据基准尺寸、长宽比、缩放比生成边框
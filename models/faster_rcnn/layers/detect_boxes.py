@@ -8,7 +8,21 @@
 
 import keras
 import tensorflow as tf
-from taurus_cv.models.faster_rcnn.utils.tf_utils import apply_regress, pad_to_fixed_size
+from taurus_cv.models.faster_rcnn.utils import tf_utils
+from taurus_cv.models.faster_rcnn.utils.tf_utils import pad_to_fixed_size
+
+
+def offset_boxes_by_class(boxes, class_ids):
+    """
+    按类别平移边框，不同类别的边框互不重叠，一次类别无关的nms等价于按类别nms
+    :param boxes: [...,N,(y1,x1,y2,x2)]
+    :param class_ids: [...,N]
+    :return: 平移后的边框
+    """
+    # 平移量大于所有边框的范围
+    offset = tf.reduce_max(tf.abs(boxes)) * 2. + 1.
+    offsets = tf.cast(class_ids, boxes.dtype) * offset
+    return boxes + tf.expand_dims(offsets, axis=-1)
 
 
 def detect_boxes(boxes, class_logits, max_output_size, iou_threshold=0.5, score_threshold=0.05, name=None):
@@ -33,36 +47,12 @@ def detect_boxes(boxes, class_logits, max_output_size, iou_threshold=0.5, score_
     keep_boxes = tf.gather_nd(boxes, keep)
     keep_class_logits = tf.gather_nd(class_logits, keep)
 
-    # 按类别nms
-    unique_class_ids = tf.unique(class_ids)[0]
-
-    def per_class_nms(class_id):
-
-        # 当前类别的索引
-        idx = tf.where(tf.equal(keep_class_ids, class_id))  # [n,1]
-        cur_class_scores = tf.gather_nd(keep_class_scores, idx)
-        cur_class_boxes = tf.gather_nd(keep_boxes, idx)
-
-        indices = tf.image.non_max_suppression(cur_class_boxes,
-                                               cur_class_scores,
-                                               max_output_size,
-                                               iou_threshold,
-                                               score_threshold)  # 一维索引
-        # 映射索引
-        idx = tf.gather(idx, indices)  # [m,1]
-
-        # padding值为 -1
-        pad_num = tf.maximum(0, max_output_size - tf.shape(idx)[0])
-        return tf.pad(idx, paddings=[[0, pad_num], [0, 0]], mode='constant', constant_values=-1)
-
-    # 经过类别nms后保留的class_id 索引
-    nms_keep = tf.map_fn(fn=per_class_nms, elems=unique_class_ids)  # (s,max_output_size,1)
-
-    # 打平
-    nms_keep = tf.reshape(nms_keep, shape=[-1])  # [s]
-
-    # 去除padding
-    nms_keep = tf.gather_nd(nms_keep, tf.where(nms_keep > -1))  # [s]
+    # 按类别平移后只做一次nms，结果已按评分降序，最多max_output_size个
+    nms_keep = tf.image.non_max_suppression(offset_boxes_by_class(keep_boxes, keep_class_ids),
+                                            keep_class_scores,
+                                            max_output_size,
+                                            iou_threshold,
+                                            score_threshold)  # 一维索引
 
     # 获取类别nms的边框,评分,类别以及logits
     output_boxes = tf.gather(keep_boxes, nms_keep)
@@ -70,14 +60,6 @@ def detect_boxes(boxes, class_logits, max_output_size, iou_threshold=0.5, score_
     output_class_ids = tf.gather(keep_class_ids, nms_keep)
     output_class_logits = tf.gather(keep_class_logits, nms_keep)
 
-    # 保留评分最高的top N
-    top_num = tf.minimum(max_output_size, tf.shape(output_scores)[0])
-    top_idx = tf.nn.top_k(output_scores, k=top_num)[1]  # top_k返回tuple(values,indices)
-    output_boxes = tf.gather(output_boxes, top_idx)
-    output_scores = tf.gather(output_scores, top_idx)
-    output_class_ids = tf.gather(output_class_ids, top_idx)
-    output_class_logits = tf.gather(output_class_logits, top_idx)
-
     # 增加padding,返回最终结果
     return [pad_to_fixed_size(output_boxes, max_output_size),
             pad_to_fixed_size(tf.expand_dims(output_scores, axis=1), max_output_size),
@@ -85,20 +67,56 @@ def detect_boxes(boxes, class_logits, max_output_size, iou_threshold=0.5, score_
             pad_to_fixed_size(output_class_logits, max_output_size)]
 
 
+def batch_detect_boxes(boxes, class_logits, max_output_size, iou_threshold=0.5, score_threshold=0.05):
+    """
+    detect_boxes的批量版本，边框先按类别再按图像平移，整个batch只调用一次nms，再按图像拆分
+    :param boxes: [batch_size,num_boxes,4]
+    :param class_logits: [batch_size,num_boxes,num_classes]
+    :param max_output_size: 每张图像保留的边框数
+    :param iou_threshold:
+    :param score_threshold:
+    :return: 检测边框、边框得分、边框类别、预测的logits，都padding到max_output_size
+    """
+    # 类别得分和预测类别
+    class_scores = tf.reduce_max(tf.nn.softmax(class_logits, axis=-1), axis=-1)  # [batch_size,num_boxes]
+    class_ids = tf.argmax(class_logits, axis=-1)  # [batch_size,num_boxes]
+
+    # 背景类的评分置为-1，低于score_threshold，不会被nms选中
+    nms_scores = tf.where(class_ids > 0, class_scores, -tf.ones_like(class_scores))
+
+    indices, valid_num = tf_utils.flat_batch_nms(offset_boxes_by_class(boxes, class_ids),
+                                                 nms_scores,
+                                                 max_output_size,
+                                                 iou_threshold,
+                                                 score_threshold)
+
+    output_boxes = tf_utils.batch_gather(boxes, indices)
+    output_scores = tf.expand_dims(tf_utils.batch_gather(class_scores, indices), axis=2)
+    output_class_ids = tf.expand_dims(tf_utils.batch_gather(class_ids, indices), axis=2)
+    output_class_logits = tf_utils.batch_gather(class_logits, indices)
+
+    return [tf_utils.batch_pad_to_fixed_size(output_boxes, valid_num, max_output_size),
+            tf_utils.batch_pad_to_fixed_size(output_scores, valid_num, max_output_size),
+            tf_utils.batch_pad_to_fixed_size(output_class_ids, valid_num, max_output_size),
+            tf_utils.batch_pad_to_fixed_size(output_class_logits, valid_num, max_output_size)]
+
+
 class ProposalToDetectBox(keras.layers.Layer):
     """
     根据候选框生成最终的检测框
     """
 
-    def __init__(self, score_threshold=0.7, output_box_num=100, iou_threshold=0.3, **kwargs):
+    def __init__(self, score_threshold=0.7, output_box_num=100, iou_threshold=0.3, batch_nms=False, **kwargs):
         """
         :param score_threshold: 分数阈值
         :param output_box_num: 生成proposal 边框数量
         :param iou_threshold: nms iou阈值; 由于是类别相关的iou值较低
+        :param batch_nms: 整个batch只调用一次nms，否则map_fn逐张图像做nms
         """
         self.score_threshold = score_threshold
         self.output_box_num = output_box_num
         self.iou_threshold = iou_threshold
+        self.batch_nms = batch_nms
         super(ProposalToDetectBox, self).__init__(**kwargs)
 
     def call(self, inputs, **kwargs):
@@ -116,15 +134,16 @@ class ProposalToDetectBox(keras.layers.Layer):
         proposals = inputs[2][..., :-1]  # 去除tag列
 
         # 应用边框回归
-        boxes = tf.map_fn(lambda x: apply_regress(*x),
-                          elems=[deltas, proposals],
-                          dtype=tf.float32)
+        boxes = tf_utils.batch_apply_regress(deltas, proposals)
 
         # 非极大抑制
         options = {"max_output_size": self.output_box_num,
                    "iou_threshold": self.iou_threshold,
                    "score_threshold": self.score_threshold}
 
+        if self.batch_nms:
+            return batch_detect_boxes(boxes, class_logits, **options)
+
         outputs = tf.map_fn(lambda x: detect_boxes(*x, **options),
                             elems=[boxes, class_logits],
                             dtype=[tf.float32] * 2 + [tf.int64] + [tf.float32])
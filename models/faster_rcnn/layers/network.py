@@ -15,16 +15,78 @@ import numpy as np
 from taurus_cv.models.faster_rcnn.networks.backbone import feature_extractor, feature_extractor_with_fpn
 from taurus_cv.models.faster_rcnn.networks.rpn_net import rpn
 from taurus_cv.models.faster_rcnn.networks.head import roi_head
-from taurus_cv.models.faster_rcnn.layers.anchors import Anchor
+from taurus_cv.models.faster_rcnn.layers.anchors import Anchor, StaticAnchor, SelectAnchors, static_anchors
 from taurus_cv.models.faster_rcnn.layers.target import RpnTarget, DetectTarget
 from taurus_cv.models.faster_rcnn.layers.proposals import RpnToProposal
 from taurus_cv.models.faster_rcnn.layers.losses import rpn_cls_loss, rpn_regress_loss, detect_regress_loss, detect_cls_loss
 from taurus_cv.models.faster_rcnn.layers.specific_to_agnostic import deal_delta
 from taurus_cv.models.faster_rcnn.layers.detect_boxes import ProposalToDetectBox
 from taurus_cv.models.faster_rcnn.layers.clip_boxes import ClipBoxes, UniqueClipBoxes
+from taurus_cv.layers.normalize import NormalizeImage
 from taurus_cv.utils.spe import spe
 
 
+def image_input(config, batch_size=None):
+    """
+    图像输入，IMAGE_UINT8_INPUT时输入uint8并在图中转为float
+    :param config:
+    :param batch_size: 固定batch_size，None不固定
+    :return: 输入层，送入骨干网络的张量
+    """
+    dtype = 'uint8' if config.IMAGE_UINT8_INPUT else keras.backend.floatx()
+
+    if batch_size is None:
+        input_image = Input(shape=config.IMAGE_INPUT_SHAPE, dtype=dtype)
+    else:
+        input_image = Input(batch_shape=(batch_size,) + config.IMAGE_INPUT_SHAPE, dtype=dtype)
+
+    if not config.IMAGE_UINT8_INPUT:
+        return input_image, input_image
+
+    # 原来的float输入也没有减均值，这里只做类型转换，已训练的权重仍然适用
+    return input_image, NormalizeImage(name='normalize_image')(input_image)
+
+
+def anchors_graph(config, features, boxes_regress, class_logits):
+    """
+    生成anchors并裁剪到输入形状内
+    RPN_STATIC_ANCHORS时anchors是常量[N,4]，完全在图像外的anchors同时从rpn输出中删除，不参与NMS和IoU计算
+    :param config:
+    :param features: 卷积层特征
+    :param boxes_regress: rpn回归输出
+    :param class_logits: rpn分类输出
+    :return: anchors, boxes_regress, class_logits
+    """
+    feature_shape = keras.backend.int_shape(features)[1:3]
+
+    if config.RPN_STATIC_ANCHORS and None not in feature_shape:
+        anchors, indices = static_anchors(feature_shape,
+                                          config.RPN_ANCHOR_BASE_SIZE,
+                                          config.RPN_ANCHOR_RATIOS,
+                                          config.RPN_ANCHOR_SCALES,
+                                          config.BACKBONE_STRIDE,
+                                          config.IMAGE_INPUT_SHAPE)
+
+        anchors = StaticAnchor(anchors, name='gen_anchors')(features)
+        boxes_regress, class_logits = SelectAnchors(indices, name='select_anchors')([boxes_regress, class_logits])
+
+        return anchors, boxes_regress, class_logits
+
+    if config.RPN_STATIC_ANCHORS:
+        print('特征图尺寸不固定，使用动态anchors')
+
+    # 生成基础anchors(batch_size,M*N*ANCHOR_NUM,4)
+    anchors = Anchor(config.RPN_ANCHOR_BASE_SIZE,
+                     config.RPN_ANCHOR_RATIOS,
+                     config.RPN_ANCHOR_SCALES,
+                     config.BACKBONE_STRIDE, name='gen_anchors')(features)
+
+    # 裁剪到输入形状内
+    anchors = UniqueClipBoxes(clip_box_shape=config.IMAGE_INPUT_SHAPE, name='clip_anchors')(anchors)
+
+    return anchors, boxes_regress, class_logits
+
+
 def rpn_net(config, stage='train', backbone=None):
     """
     单独训练rpn
@@ -35,7 +97,7 @@ def rpn_net(config, stage='train', backbone=None):
     batch_size = config.IMAGES_PER_GPU
 
     # 图片尺寸
-    input_image = Input(batch_shape=(batch_size,) + config.IMAGE_INPUT_SHAPE)
+    input_image, image = image_input(config, batch_size)
 
     # 二分类
     input_class_ids = Input(batch_shape=(batch_size, config.MAX_GT_INSTANCES, 1 + 1))
@@ -54,20 +116,14 @@ def rpn_net(config, stage='train', backbone=None):
     input_image_meta = Input(batch_shape=(batch_size, 12))
 
     # 特征及预测结果 (1,32,32,1024)
-    features = feature_extractor(input_image, model=backbone, output_layer_name=config.backbone_output_layer_name)
+    features = feature_extractor(image, model=backbone, output_layer_name=config.backbone_output_layer_name)
 
     # 定义rpn网络 得到分类和回归值
     boxes_regress, class_logits = rpn(features, config.RPN_ANCHOR_NUM)
 
     # 生成anchor (1,6144,4) 1是batch_size, 6144是anchors数量
-    # 占满了（512，512）
-    anchors = Anchor(config.RPN_ANCHOR_BASE_SIZE,
-                     config.RPN_ANCHOR_RATIOS,
-                     config.RPN_ANCHOR_SCALES,
-                     config.BACKBONE_STRIDE, name='gen_anchors')(features)
-
     # 裁剪到窗口内 得到512x512内的anchors
-    anchors = UniqueClipBoxes(config.IMAGE_INPUT_SHAPE, name='clip_anchors')(anchors)
+    anchors, boxes_regress, class_logits = anchors_graph(config, features, boxes_regress, class_logits)
 
     # windows = Lambda(lambda x: x[:, 7:11])(input_image_meta)
     # anchors = ClipBoxes()([anchors, windows])
@@ -102,6 +158,7 @@ def rpn_net(config, stage='train', backbone=None):
                                                       output_box_num=config.POST_NMS_ROIS_INFERENCE,
                                                       score_threshold=config.RPN_SCORE_THRESHOLD,
                                                       iou_threshold=config.RPN_NMS_THRESHOLD_INFERENCE,
+                                                      pre_nms_top_k=config.PRE_NMS_TOP_K_INFERENCE,
                                                       name='rpn2proposals')([boxes_regress, class_logits, anchors])
 
         # 预测阶段，通过rpn获取候选框，得到候选框和置信度
@@ -118,25 +175,19 @@ def faster_rcnn(config, stage='train', backbone=None):
 
     batch_size = config.IMAGES_PER_GPU
 
-    input_image = Input(shape=config.IMAGE_INPUT_SHAPE)
+    input_image, image = image_input(config)
     gt_class_ids = Input(shape=(config.MAX_GT_INSTANCES, 1 + 1))
     gt_boxes = Input(shape=(config.MAX_GT_INSTANCES, 4 + 1))
     input_image_meta = Input(shape=(12,))
 
     # 通过CNN提取特征
-    features = feature_extractor(input_image, model=backbone, output_layer_name=config.backbone_output_layer_name)
+    features = feature_extractor(image, model=backbone, output_layer_name=config.backbone_output_layer_name)
 
     # 训练rpn 得到回归和分类分
     boxes_regress, class_logits = rpn(features, config.RPN_ANCHOR_NUM)
 
-    # 生成基础anchors(batch_size,M*N,ANCHOR_NUM,4)
-    anchors = Anchor(config.RPN_ANCHOR_BASE_SIZE,
-                     config.RPN_ANCHOR_RATIOS,
-                     config.RPN_ANCHOR_SCALES,
-                     config.BACKBONE_STRIDE, name='gen_anchors')(features)
-
-    # 裁剪到输入形状内
-    anchors = UniqueClipBoxes(clip_box_shape=config.IMAGE_INPUT_SHAPE, name='clip_anchors')(anchors)
+    # 生成基础anchors(batch_size,M*N*ANCHOR_NUM,4)并裁剪到输入形状内
+    anchors, boxes_regress, class_logits = anchors_graph(config, features, boxes_regress, class_logits)
 
     # 取图片元数据的后4个数据，作为窗口
     windows = Lambda(lambda x: x[:, 7:11])(input_image_meta)
@@ -145,12 +196,14 @@ def faster_rcnn(config, stage='train', backbone=None):
     # 应用分类和回归生成proposal，通过NMS后保留2000个候选框
     output_box_num = config.POST_NMS_ROIS_TRAIN if stage == 'train' else config.POST_NMS_ROIS_INFERENCE
     iou_threshold = config.RPN_NMS_THRESHOLD_TRAIN if stage == 'train' else config.RPN_NMS_THRESHOLD_INFERENCE
+    pre_nms_top_k = config.PRE_NMS_TOP_K_TRAIN if stage == 'train' else config.PRE_NMS_TOP_K_INFERENCE
 
     # 通过rpn后的候选框和anchors计算iou淘汰一部分，再走NMS过滤，得到最后的候选框rois [proprosal_boxes,fg_scores,class_logits]
     proposal_boxes, _, _ = RpnToProposal(batch_size,
                                          output_box_num=config.POST_NMS_ROIS_INFERENCE,
                                          score_threshold=config.RPN_SCORE_THRESHOLD,
                                          iou_threshold=iou_threshold,
+                                         pre_nms_top_k=pre_nms_top_k,
                                          name='rpn2proposals')([boxes_regress, class_logits, anchors])
 
     # 上面是从rpn输出的rois
@@ -211,6 +264,7 @@ def faster_rcnn(config, stage='train', backbone=None):
             score_threshold=config.DETECTION_MIN_CONFIDENCE,
             iou_threshold=config.DETECTION_NMS_THRESHOLD,
             output_box_num=output_box_num,
+            batch_nms=config.DETECTION_BATCH_NMS,
             name='proposals2detectboxes'
         )([rcnn_deltas, rcnn_class_logits, proposal_boxes])
 
@@ -15,17 +15,19 @@ class RpnToProposal(keras.layers.Layer):
     """
     生成候选框
     """
-    def __init__(self, batch_size, score_threshold=0.01, output_box_num=2000, iou_threshold=0.7, **kwargs):
+    def __init__(self, batch_size, score_threshold=0.01, output_box_num=2000, iou_threshold=0.7, pre_nms_top_k=None, **kwargs):
         """
-        :param batch_size:
+        :param batch_size: 保留参数，批量实现不依赖固定的batch_size
         :param score_threshold: 分数阈值
         :param output_box_num: 生成proposal 边框数量
         :param iou_threshold: nms iou阈值
+        :param pre_nms_top_k: 应用回归和nms之前每张图像保留前景分数最高的anchors数，None保留全部
         """
         self.batch_size = batch_size
         self.score_threshold = score_threshold
         self.output_box_num = output_box_num
         self.iou_threshold = iou_threshold
+        self.pre_nms_top_k = pre_nms_top_k
         super(RpnToProposal, self).__init__(**kwargs)
 
     def call(self, inputs, **kwargs):
@@ -34,7 +36,7 @@ class RpnToProposal(keras.layers.Layer):
         :param inputs:
         inputs[0]: deltas, [batch_size,N,(dy,dx,dh,dw)]   N是所有的anchors数量
         inputs[1]: class logits [batch_size,N,num_classes]
-        inputs[2]: anchors [batch_size,N,(y1,x1,y2,x2)]
+        inputs[2]: anchors [batch_size,N,(y1,x1,y2,x2)]，或所有图像共用的[N,(y1,x1,y2,x2)]
         :param kwargs:
         :return:
         """
@@ -46,32 +48,30 @@ class RpnToProposal(keras.layers.Layer):
         class_scores = tf.nn.softmax(logits=class_logits, axis=-1)  # [N,num_classes]
         fg_scores = tf.reduce_max(class_scores[..., 1:], axis=-1)  # 第一类为背景 (N,)
 
-        # 应用边框回归
-        # proposals = tf.map_fn(lambda x: apply_regress(*x),
-        #                       elems=[deltas, anchors],
-        #                       dtype=tf.float32)
-        # # 非极大抑制
-        # options = {"max_output_size": self.output_box_num,
-        #            "iou_threshold": self.iou_threshold,
-        #            "score_threshold": self.score_threshold,
-        #            "name": "proposals_nms"}
-        #
-        # outputs = tf.map_fn(lambda x: nms(*x, **options),
-        #                     elems=[proposals, fg_scores, class_logits],
-        #                     dtype=[tf.float32] * 3)
-        # # 非极大抑制
-
-        proposals = tf_utils.batch_slice([deltas, anchors],
-                                         lambda x, y: apply_regress(x, y),
-                                         self.batch_size)
-
-        outputs = tf_utils.batch_slice([proposals, fg_scores, class_logits],
-                                       lambda x, y, z: nms(x, y, z,
-                                                           max_output_size=self.output_box_num,
-                                                           iou_threshold=self.iou_threshold,
-                                                           score_threshold=self.score_threshold),
-                                       self.batch_size)
-        return outputs
+        # 只保留前景分数最高的top k个anchors，回归和nms的计算量与anchors总数无关
+        if self.pre_nms_top_k:
+            fg_scores, indices, (deltas, class_logits) = tf_utils.batch_top_k(fg_scores, self.pre_nms_top_k, [deltas, class_logits])
+            anchors = tf.gather(anchors, indices) if len(anchors.shape) == 2 else tf_utils.batch_gather(anchors, indices)
+
+        # 应用边框回归，整个batch一次完成
+        proposals = tf_utils.batch_apply_regress(deltas, anchors)
+
+        # 批量非极大抑制，返回每张图像保留的索引
+        indices, valid_num = tf_utils.batch_nms(proposals,
+                                                fg_scores,
+                                                max_output_size=self.output_box_num,
+                                                iou_threshold=self.iou_threshold,
+                                                score_threshold=self.score_threshold)
+
+        # 通过索引进行筛选
+        output_boxes = tf_utils.batch_gather(proposals, indices)  # [batch_size,M,4]
+        class_scores = tf.expand_dims(tf_utils.batch_gather(fg_scores, indices), axis=2)  # [batch_size,M,1]
+        class_logits = tf_utils.batch_gather(class_logits, indices)
+
+        # padding到固定大小
+        return [tf_utils.batch_pad_to_fixed_size(output_boxes, valid_num, self.output_box_num),
+                tf_utils.batch_pad_to_fixed_size(class_scores, valid_num, self.output_box_num),
+                tf_utils.batch_pad_to_fixed_size(class_logits, valid_num, self.output_box_num)]
 
     def compute_output_shape(self, input_shape):
         """
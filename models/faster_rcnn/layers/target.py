@@ -185,7 +185,7 @@ class RpnTarget(keras.layers.Layer):
         :param inputs:
         inputs[0]: GT 边框坐标 [batch_size, MAX_GT_BOXs,(y1,x1,y2,x2,tag)] ,tag=-1 为padding
         inputs[1]: GT 类别 [batch_size, MAX_GT_BOXs,num_class+1] ;最后一位为tag, tag=-1 为padding
-        inputs[2]: Anchors [batch_size, anchor_num,(y1,x1,y2,x2)]
+        inputs[2]: Anchors [batch_size, anchor_num,(y1,x1,y2,x2)]，或所有图像共用的[anchor_num,(y1,x1,y2,x2)]
         :param kwargs:
         :return:
         """
@@ -193,17 +193,25 @@ class RpnTarget(keras.layers.Layer):
         gt_cls_ids = inputs[1]
         anchors = inputs[2]
 
-        # options = {"rpn_train_anchors": self.train_anchors_per_image}
-        # outputs = tf.map_fn(lambda x: rpn_targets_graph(*x, **options),
-        #                    elems=[gt_boxes, gt_cls_ids, anchors],
-        #                    dtype=[tf.float32] * 2 + [tf.int64] + [tf.float32] * 4)
+        # 每张图像的采样逻辑只建一份子图，由map_fn循环，batch_size不固定
+        options = {"rpn_train_anchors": self.train_anchors_per_image}
 
-        outputs = tf_utils.batch_slice(
-            [gt_boxes, gt_cls_ids, anchors],
-            lambda x, y, z:
-            rpn_targets_graph(x, y, z, self.train_anchors_per_image), self.batch_size)
+        # 静态anchors所有图像共用，不参与循环
+        if len(anchors.shape) == 2:
+            fn = lambda x: rpn_targets_graph(x[0], x[1], anchors, **options)
+            elems = [gt_boxes, gt_cls_ids]
+        else:
+            fn = lambda x: rpn_targets_graph(*x, **options)
+            elems = [gt_boxes, gt_cls_ids, anchors]
 
-        return outputs
+        # 输入都是GT和anchors，没有可训练的上游，不需要反向传播
+        outputs = tf.map_fn(fn,
+                            elems=elems,
+                            dtype=[tf.float32] * 2 + [tf.int64] + [tf.float32] * 4,
+                            parallel_iterations=16,
+                            back_prop=False)
+
+        return list(outputs)
 
     def compute_output_shape(self, input_shape):
         return [(input_shape[0][0], self.train_anchors_per_image, 5),
@@ -350,17 +358,16 @@ class DetectTarget(keras.layers.Layer):
         gt_class_ids = inputs[1]
         proposals = inputs[2]
 
-        #options = {"train_rois_per_image": self.train_rois_per_image,
-        #           "roi_positive_ratio": self.roi_positive_ratio}
-        #outputs = tf.map_fn(lambda x: detect_targets_graph(*x, **options),
-        #                    elems=[gt_boxes, gt_class_ids, proposals],
-        #                    dtype=[tf.float32] * 4)
-
-        outputs = tf_utils.batch_slice([gt_boxes, gt_class_ids, proposals],
-                                       lambda x, y, z: detect_targets_graph(x, y, z, self.train_rois_per_image,
-                                                                            self.roi_positive_ratio),
-                                       self.batch_size)
-        return outputs
+        # 每张图像的采样逻辑只建一份子图，由map_fn循环，batch_size不固定
+        options = {"train_rois_per_image": self.train_rois_per_image,
+                   "roi_positive_ratio": self.roi_positive_ratio}
+
+        # proposals来自rpn的回归，保留反向传播，梯度与原来batch_slice的实现一致
+        outputs = tf.map_fn(lambda x: detect_targets_graph(*x, **options),
+                            elems=[gt_boxes, gt_class_ids, proposals],
+                            dtype=[tf.float32] * 4,
+                            parallel_iterations=16)
+        return list(outputs)
 
     def compute_output_shape(self, input_shape):
         return [(input_shape[0][0], self.train_rois_per_image, 4 + 1),  # deltas
@@ -8,11 +8,12 @@
 
 import random
 import numpy as np
-from taurus_cv.models.faster_rcnn.utils import np_utils
 from taurus_cv.models.faster_rcnn.preprocessing import image as image_util
+from taurus_cv.models.faster_rcnn.preprocessing.prefetch import PrefetchGenerator
+from taurus_cv.utils.buffer_ring import BatchBufferRing
 
 
-def image_generator(image_list, batch_size, max_output_dim, max_gt_num, stage='train'):
+def image_generator(image_list, batch_size, max_output_dim, max_gt_num, stage='train', ring_size=None):
     """
     生成器
     :param image_list: 字典列表
@@ -20,43 +21,146 @@ def image_generator(image_list, batch_size, max_output_dim, max_gt_num, stage='t
     :param max_output_dim:
     :param max_gt_num:
     :param stage:
-    :return:
+    :param ring_size: 批数据缓冲环大小，不能小于buffer_ring.required_ring_size(max_queue_size, workers)，None时按fit_generator的默认参数计算
+    :return: 输出是缓冲环上的视图，缓冲环转一圈后会被覆盖
     """
     image_length = len(image_list)
     id_list = range(image_length)
 
+    buffer_ring = BatchBufferRing(ring_size)
+
     while True:
         ids = random.sample(id_list, batch_size)
-        batch_image = []
-        batch_image_meta = []
-        batch_class_ids = []
-        batch_bbox = []
-
-        for id in ids:
-            # 图像数据，图像元数据，回归框
-            if '.jpg' not in image_list[id]['filename']:
-                image_list[id]['filename'] = image_list[id]['filename'] + '.jpg'
-            if '.jpg' not in image_list[id]['filepath']:
-                image_list[id]['filepath'] = image_list[id]['filepath'] + '.jpg'
 
+        buffers = buffer_ring.next()
+        batch_image = buffers.get('image', (batch_size, max_output_dim, max_output_dim, 3), np.uint8)
+        batch_image_meta = buffers.get('image_meta', (batch_size, 12), np.float64)
+
+        if stage == 'train':
+            # gt个数固定，最后一位是padding标志，1-非padding；类别数组类型取本批次中最宽的类型
+            labels_list = [np.asarray(image_list[id]['labels']) for id in ids]
+            batch_class_ids = buffers.get('class_ids', (batch_size, max_gt_num, 2), np.result_type(*labels_list))
+            batch_bbox = buffers.get('bbox', (batch_size, max_gt_num, 5), np.float64)
+
+        for i, id in enumerate(ids):
+            # 图像数据，图像元数据，回归框；文件路径在构建标注存储时已经补全.jpg后缀
+            image_info = image_list[id]
+
+            # 解码后直接缩放写入批数据
+            out = batch_image[i]
             image, image_meta, bbox = image_util.load_image_gt(id,
-                                                               image_list[id]['filepath'],
+                                                               image_info['filepath'],
                                                                max_output_dim,
-                                                               image_list[id]['boxes'])
-            batch_image.append(image)
-            batch_image_meta.append(image_meta)
+                                                               image_info['boxes'],
+                                                               out=out)
+            if image is not out:
+                out[...] = image
+
+            batch_image_meta[i] = image_meta
 
             if stage == 'train':
-                # gt个数固定
-                batch_class_ids.append(np_utils.pad_to_fixed_size(np.expand_dims(image_list[id]['labels'], axis=1), max_gt_num))
-                batch_bbox.append(np_utils.pad_to_fixed_size(bbox, max_gt_num))
+                labels = labels_list[i]
+                gt_num = min(max_gt_num, labels.shape[0])
+
+                batch_class_ids[i] = 0
+                batch_class_ids[i, :gt_num, 0] = labels[:gt_num]
+                batch_class_ids[i, :gt_num, 1] = 1
+
+                batch_bbox[i] = 0
+                batch_bbox[i, :gt_num, :4] = bbox[:gt_num]
+                batch_bbox[i, :gt_num, 4] = 1
 
         if stage == 'train':
-            yield [np.asarray(batch_image),
-                   np.asarray(batch_image_meta),
-                   np.asarray(batch_class_ids),
-                   np.asarray(batch_bbox)], None
+            yield [batch_image,
+                   batch_image_meta,
+                   batch_class_ids,
+                   batch_bbox], None
         else:
-            yield [np.asarray(batch_image),
-                   np.asarray(batch_image_meta)]
+            yield [batch_image,
+                   batch_image_meta]
+
+
+def load_batch(samples, max_output_dim, max_gt_num, stage='train'):
+    """
+    生成一个batch，预取worker中调用，每次新分配内存
+    :param samples: [(image_id, filepath, boxes, labels)]
+    :param max_output_dim:
+    :param max_gt_num:
+    :param stage:
+    :return: 与image_generator的输出一致
+    """
+    batch_size = len(samples)
+
+    batch_image = np.zeros((batch_size, max_output_dim, max_output_dim, 3), dtype=np.uint8)
+    batch_image_meta = np.zeros((batch_size, 12), dtype=np.float64)
+
+    if stage == 'train':
+        batch_class_ids = np.zeros((batch_size, max_gt_num, 2), dtype=np.result_type(*[labels for _, _, _, labels in samples]))
+        batch_bbox = np.zeros((batch_size, max_gt_num, 5), dtype=np.float64)
+
+    for i, (image_id, filepath, boxes, labels) in enumerate(samples):
+
+        out = batch_image[i]
+        image, image_meta, bbox = image_util.load_image_gt(image_id, filepath, max_output_dim, boxes, out=out)
+        if image is not out:
+            out[...] = image
+
+        batch_image_meta[i] = image_meta
 
+        if stage == 'train':
+            gt_num = min(max_gt_num, labels.shape[0])
+
+            batch_class_ids[i, :gt_num, 0] = labels[:gt_num]
+            batch_class_ids[i, :gt_num, 1] = 1
+
+            batch_bbox[i, :gt_num, :4] = bbox[:gt_num]
+            batch_bbox[i, :gt_num, 4] = 1
+
+    if stage == 'train':
+        return [batch_image,
+                batch_image_meta,
+                batch_class_ids,
+                batch_bbox], None
+    else:
+        return [batch_image,
+                batch_image_meta]
+
+
+def sample_batches(image_list, batch_size, max_output_dim, max_gt_num, stage='train'):
+    """
+    无限采样batch任务参数，每个任务只带本batch的路径和标注，进程池中序列化的开销很小
+    """
+    id_list = range(len(image_list))
+
+    while True:
+        samples = []
+        for id in random.sample(id_list, batch_size):
+            image_info = image_list[id]
+            samples.append((id, image_info['filepath'], np.asarray(image_info['boxes']), np.asarray(image_info['labels'])))
+
+        yield samples, max_output_dim, max_gt_num, stage
+
+
+def prefetch_image_generator(image_list, batch_size, max_output_dim, max_gt_num, stage='train',
+                             depth=8, workers=4, use_processes=False, deterministic=True, log_every=0):
+    """
+    带预取的生成器，多个worker并行解码、缩放、padding，输出与image_generator一致
+    :param image_list: 字典列表
+    :param batch_size: 批数据尺寸
+    :param max_output_dim:
+    :param max_gt_num:
+    :param stage:
+    :param depth: 预取深度，最多depth个batch在生成或等待消费
+    :param workers: worker数量
+    :param use_processes: 是否使用进程池
+    :param deterministic: 是否按采样顺序输出
+    :param log_every: 每隔多少个batch打印队列占用和等待时间
+    :return: PrefetchGenerator，stats属性记录队列占用和消费者等待时间
+    """
+    return PrefetchGenerator(load_batch,
+                             sample_batches(image_list, batch_size, max_output_dim, max_gt_num, stage),
+                             depth=depth,
+                             workers=workers,
+                             use_processes=use_processes,
+                             deterministic=deterministic,
+                             log_every=log_every)
@@ -6,17 +6,39 @@
 图像处理工具
 """
 
+import time
+import cv2
 from skimage import io, transform
 from skimage.color import gray2rgb
 import numpy as np
+from taurus_cv.datasets.image_size import read_image_size
 
+# 图像加载和缩放的后端，opencv直接处理uint8；skimage会先转为float64再插值，较慢
+IMAGE_BACKEND = 'opencv'
 
-def load_image(image_path):
+# 原图远大于输入尺寸时，jpeg按DCT缩放(1/2,1/4,1/8)降低分辨率解码
+REDUCED_DECODE = True
+
+# 忽略EXIF方向：原图尺寸从未旋转的文件头读取，PIL的draft也不旋转，旋转后宽高会与元数据相反
+REDUCED_COLOR_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2 | cv2.IMREAD_IGNORE_ORIENTATION,
+                       4: cv2.IMREAD_REDUCED_COLOR_4 | cv2.IMREAD_IGNORE_ORIENTATION,
+                       8: cv2.IMREAD_REDUCED_COLOR_8 | cv2.IMREAD_IGNORE_ORIENTATION}
+
+
+def load_image(image_path, backend=None):
     """
     加载图像
     :param image_path: 图像路径
+    :param backend: opencv或skimage，默认IMAGE_BACKEND
     :return: [h,w,3] numpy数组
     """
+    backend = backend or IMAGE_BACKEND
+
+    if backend == 'opencv':
+        # IMREAD_COLOR会把灰度图转为3通道并去掉alpha通道；与skimage一样不按EXIF方向旋转，与标注坐标一致
+        image = cv2.imread(image_path, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+        if image is not None:
+            return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
     # 载入图片
     image = io.imread(image_path)
@@ -29,23 +51,73 @@ def load_image(image_path):
     return image[..., :3]
 
 
-def load_image_gt(image_id, image_path, output_size, gt_boxes=None):
+def reduced_decode_factor(h, w, max_dim):
+    """
+    选择最大的DCT缩放因子，保证解码后的长边仍不小于max_dim
+    :param h: 原图高
+    :param w: 原图宽
+    :param max_dim: 缩放后的长边
+    :return: 1,2,4,8
+    """
+    for factor in (8, 4, 2):
+        if max(h, w) / factor >= max_dim:
+            return factor
+    return 1
+
+
+def load_image_reduced(image_path, max_dim, backend=None):
+    """
+    按目标尺寸降低分辨率加载图像，只用于随后缩放到max_dim的场景
+    :param image_path: 图像路径
+    :param max_dim: 缩放后的长边
+    :param backend: opencv或skimage，默认IMAGE_BACKEND
+    :return: [h',w',3] numpy数组，原图形状(H,W,3)
+    """
+    backend = backend or IMAGE_BACKEND
+
+    # 只读文件头获取原图尺寸，缩放比例按原图计算
+    width, height = read_image_size(image_path)
+    original_shape = (height, width, 3)
+
+    factor = reduced_decode_factor(height, width, max_dim)
+    if factor == 1:
+        return load_image(image_path, backend), original_shape
+
+    if backend == 'opencv':
+        image = cv2.imread(image_path, REDUCED_COLOR_FLAGS[factor])
+        if image is not None:
+            return cv2.cvtColor(image, cv2.COLOR_BGR2RGB), original_shape
+
+    # PIL的draft让libjpeg直接按DCT缩放解码，非jpeg时不起作用
+    from PIL import Image
+    with Image.open(image_path) as image:
+        image.draft('RGB', (width // factor, height // factor))
+        image = np.asarray(image.convert('RGB'))
+
+    return image, original_shape
+
+
+def load_image_gt(image_id, image_path, output_size, gt_boxes=None, out=None):
     """
     加载图像，生成训练输入大小的图像，并调整GT 边框，返回相关元数据信息
     :param image_id: 图像编号id
     :param image_path: 图像路径
     :param output_size: 标量，图像输出尺寸，及网络输入到高度或宽度(默认长宽相等)
     :param gt_boxes: GT 边框 [N,(y1,x1,y2,x2)]
+    :param out: 预先分配的(output_size,output_size,3)画布，opencv后端直接写入
     :return:
     image: (H,W,3)
     image_meta: 元数据信息，详见compose_image_meta
     gt_boxes：图像缩放及padding后对于的GT 边框坐标 [N,(y1,x1,y2,x2)]
     """
-    # 加载图像
-    image = load_image(image_path)
-    original_shape = image.shape
+    # 加载图像，降低分辨率解码时元数据仍按原图尺寸计算
+    if REDUCED_DECODE:
+        image, original_shape = load_image_reduced(image_path, output_size)
+    else:
+        image = load_image(image_path)
+        original_shape = image.shape
     # resize图像，并获取相关元数据信息
-    image, window, scale, padding = resize_image(image, output_size)
+    image, window, scale, padding = resize_image(image, output_size, out=out, original_shape=original_shape)
 
     # 组合元数据信息
     image_meta = compose_image_meta(image_id, original_shape, image.shape, window, scale)
@@ -57,15 +129,23 @@ def load_image_gt(image_id, image_path, output_size, gt_boxes=None):
     return image, image_meta, gt_boxes
 
 
-def resize_image(image, max_dim):
+def resize_image(image, max_dim, backend=None, out=None, original_shape=None):
     """
     缩放图像为正方形，指定长边大小，短边padding;
     :param image: numpy 数组(H,W,3)
     :param max_dim: 长边大小
+    :param backend: opencv或skimage，默认IMAGE_BACKEND
+    :param out: opencv后端可传入预先分配的(max_dim,max_dim,3)画布，缩放结果直接写入
+    :param original_shape: 降低分辨率解码时传入原图形状，缩放尺寸和窗口按原图计算
     :return: 缩放后的图像,元素图像的宽口位置，缩放尺寸，padding
     """
+    backend = backend or IMAGE_BACKEND
+
+    if backend == 'opencv':
+        return resize_image_cv(image, max_dim, out=out, original_shape=original_shape)
+
     image_dtype = image.dtype
-    h, w = image.shape[:2]
+    h, w = (original_shape or image.shape)[:2]
     scale = max_dim / max(h, w)  # 缩放尺寸
     image = transform.resize(image, (round(h * scale), round(w * scale)),
                              order=1, mode='constant', cval=0, clip=True, preserve_range=True)
@@ -80,6 +160,35 @@ def resize_image(image, max_dim):
     window = (top_pad, left_pad, h + top_pad, w + left_pad)  #
     return image.astype(image_dtype), window, scale, padding
 
+def resize_image_cv(image, max_dim, out=None, original_shape=None):
+    """
+    opencv缩放，保持原始dtype，直接写入padding后的画布，不再调用np.pad
+    :param image: numpy 数组(H,W,C)
+    :param max_dim: 长边大小
+    :param out: 预先分配的画布，None时新建
+    :param original_shape: 降低分辨率解码时传入原图形状
+    :return: 与resize_image一致
+    """
+    h, w = (original_shape or image.shape)[:2]
+    h, w, window, scale, padding = resize_meta(h, w, max_dim)
+
+    if out is None:
+        out = np.zeros((max_dim, max_dim) + image.shape[2:], dtype=image.dtype)
+    else:
+        out[...] = 0
+
+    # 缩小用area插值抗锯齿，放大用双线性插值；按实际解码的图像判断
+    interpolation = cv2.INTER_AREA if w < image.shape[1] else cv2.INTER_LINEAR
+    resized = cv2.resize(image, (w, h), interpolation=interpolation)
+
+    if resized.ndim < image.ndim:
+        resized = resized[..., np.newaxis]
+
+    out[window[0]:window[2], window[1]:window[3]] = resized
+
+    return out, window, scale, padding
+
+
 def resize_meta(h, w, max_dim):
     """
     计算resize的元数据信息
@@ -172,3 +281,31 @@ def recover_detect_boxes(boxes, window, scale):
     # 还原缩放
     boxes /= scale
     return boxes
+
+
+def benchmark_resize(image_shape=(2048, 4096, 3), max_dim=608, repeat=10):
+    """
+    对比两种后端的缩放耗时，输出一致性由tests/test_resize.py检查
+    :param image_shape: 测试图像尺寸
+    :param max_dim: 缩放后的边长
+    :param repeat: 重复次数
+    :return: {backend: 平均耗时(秒)}
+    """
+    image = np.random.randint(0, 256, size=image_shape, dtype=np.uint8)
+    results = {}
+
+    for backend in ['skimage', 'opencv']:
+        start = time.time()
+        for _ in range(repeat):
+            resize_image(image, max_dim, backend=backend)
+        results[backend] = (time.time() - start) / repeat
+
+    print("{} skimage:{:.4f}s opencv:{:.4f}s 加速:{:.1f}x".format(
+        image_shape, results['skimage'], results['opencv'], results['skimage'] / max(results['opencv'], 1e-9)))
+
+    return results
+
+
+if __name__ == '__main__':
+    for shape in [(375, 500, 3), (1024, 1024, 3), (2048, 4096, 3)]:
+        benchmark_resize(shape)
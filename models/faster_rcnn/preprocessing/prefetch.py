@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+"""
+有界预取流水线，多个worker并行生成batch，消费者从队列中取出
+"""
+
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+
+class PrefetchStats(object):
+    """
+    预取统计，用于判断瓶颈在模型还是在输入流水线
+    队列平均占用接近depth说明模型是瓶颈；消费者等待时间长、占用接近0说明输入流水线是瓶颈
+    """
+
+    def __init__(self, depth):
+        self.depth = depth
+        self.consumed = 0
+        self.wait_time = 0.
+        self.max_wait_time = 0.
+        self.occupancy_sum = 0
+        self.last_occupancy = 0
+
+    def update(self, occupancy, wait_time):
+        """
+        :param occupancy: 取数据时已经完成、在队列中等待的batch数
+        :param wait_time: 消费者本次等待的时间(秒)
+        :return:
+        """
+        self.consumed += 1
+        self.wait_time += wait_time
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+        self.occupancy_sum += occupancy
+        self.last_occupancy = occupancy
+
+    def summary(self):
+        consumed = max(1, self.consumed)
+        return {'consumed': self.consumed,
+                'depth': self.depth,
+                'mean_occupancy': self.occupancy_sum / consumed,
+                'last_occupancy': self.last_occupancy,
+                'mean_wait_time': self.wait_time / consumed,
+                'max_wait_time': self.max_wait_time,
+                'total_wait_time': self.wait_time}
+
+    def __str__(self):
+        return '预取队列平均占用:{mean_occupancy:.2f}/{depth} 平均等待:{mean_wait_time:.4f}s 最大等待:{max_wait_time:.4f}s 总等待:{total_wait_time:.2f}s'.format(**self.summary())
+
+
+class PrefetchGenerator(object):
+    """
+    预取生成器，最多有depth个batch在生成或等待消费
+    deterministic为True时按任务提交顺序输出，否则先完成的先输出
+    """
+
+    def __init__(self, task_fn, task_args_iter, depth=8, workers=4, use_processes=False, deterministic=True, log_every=0):
+        """
+        :param task_fn: 生成一个batch的函数，使用进程时必须是模块级函数
+        :param task_args_iter: 任务参数的迭代器，每个元素是task_fn的参数tuple
+        :param depth: 预取深度
+        :param workers: worker数量
+        :param use_processes: 使用进程池，解码、缩放等持有GIL的步骤较多时使用
+        :param deterministic: 是否保持输出顺序
+        :param log_every: 每隔多少个batch打印一次统计，0不打印
+        """
+        self.task_fn = task_fn
+        self.task_args_iter = iter(task_args_iter)
+        self.depth = max(1, int(depth))
+        self.deterministic = deterministic
+        self.log_every = log_every
+
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        self.executor = executor_class(max_workers=max(1, int(workers)))
+
+        self.futures = deque()
+        self.stats = PrefetchStats(self.depth)
+
+        self.fill()
+
+    def fill(self):
+        while len(self.futures) < self.depth:
+            try:
+                args = next(self.task_args_iter)
+            except StopIteration:
+                break
+            self.futures.append(self.executor.submit(self.task_fn, *args))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.next()
+
+    def next(self):
+
+        if not self.futures:
+            raise StopIteration
+
+        occupancy = sum(1 for future in self.futures if future.done())
+
+        start = time.time()
+
+        if self.deterministic:
+            future = self.futures.popleft()
+        else:
+            done, _ = wait(self.futures, return_when=FIRST_COMPLETED)
+            future = next(future for future in self.futures if future in done)
+            self.futures.remove(future)
+
+        result = future.result()
+
+        self.stats.update(occupancy, time.time() - start)
+
+        # 取走一个后补充一个任务
+        self.fill()
+
+        if self.log_every and self.stats.consumed % self.log_every == 0:
+            print(self.stats)
+
+        return result
+
+    def close(self):
+        for future in self.futures:
+            future.cancel()
+        self.futures.clear()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+"""
+预先缩放的图像分片，训练时通过内存映射读取，不再解码jpeg和缩放
+目录结构:
+    images_00000.npy  uint8 [n,max_dim,max_dim,3]，已经缩放并padding到IMAGE_MAX_DIM
+    images_00001.npy
+    ...
+    index.npz         元数据，包括image_meta、调整后的GT边框、类别、文件名，以及打包时的max_dim和数据集指纹
+"""
+
+import os
+import random
+import hashlib
+import numpy as np
+from taurus_cv.models.faster_rcnn.preprocessing import image as image_util
+from taurus_cv.utils.buffer_ring import BatchBufferRing
+
+SHARD_FILENAME = 'images_{:05d}.npy'
+INDEX_FILENAME = 'index.npz'
+
+
+def dataset_fingerprint(image_list):
+    """
+    数据集指纹，图像列表的顺序、图像文件的mtime和大小、GT边框和类别任一变化时都会改变
+    :param image_list: 字典列表，包含filepath,boxes,labels
+    :return: 十六进制字符串
+    """
+    sha1 = hashlib.sha1()
+
+    for image_info in image_list:
+        try:
+            stat = os.stat(image_info['filepath'])
+            mtime, size = stat.st_mtime_ns, stat.st_size
+        except OSError:
+            mtime, size = -1, -1
+
+        sha1.update('{}\0{}\0{}\0'.format(image_info['filepath'], mtime, size).encode('utf-8'))
+        sha1.update(np.asarray(image_info['boxes'], dtype=np.float64).tobytes())
+        # 类别可能是类别名，按文本计入
+        sha1.update('\0'.join(map(str, np.asarray(image_info['labels']).reshape((-1,)).tolist())).encode('utf-8'))
+
+    return sha1.hexdigest()
+
+
+def pack_shards(image_list, output_dir, max_dim, shard_size=512):
+    """
+    将数据集打包为固定大小的分片
+    :param image_list: 字典列表，包含filepath,boxes,labels
+    :param output_dir: 输出目录
+    :param max_dim: 缩放后的边长，即IMAGE_MAX_DIM
+    :param shard_size: 每个分片的图片数量
+    :return: 写入的图片数量
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    num_images = len(image_list)
+    num_shards = (num_images + shard_size - 1) // shard_size
+
+    # 写分片之前计算，图像列表有问题时不会先写完全部分片再失败
+    fingerprint = dataset_fingerprint(image_list)
+
+    image_metas = np.zeros((num_images, 12), dtype=np.float64)
+    offsets = np.zeros((num_images + 1,), dtype=np.int64)
+    boxes_list, labels_list, filenames, filepaths = [], [], [], []
+
+    for shard_id in range(num_shards):
+
+        start = shard_id * shard_size
+        end = min(num_images, start + shard_size)
+
+        # 直接写入npy文件的内存映射，不在内存中拼接整个分片
+        shard = np.lib.format.open_memmap(os.path.join(output_dir, SHARD_FILENAME.format(shard_id)),
+                                          mode='w+',
+                                          dtype=np.uint8,
+                                          shape=(end - start, max_dim, max_dim, 3))
+
+        for id in range(start, end):
+            image_info = image_list[id]
+
+            image, image_meta, boxes = image_util.load_image_gt(id,
+                                                                image_info['filepath'],
+                                                                max_dim,
+                                                                image_info['boxes'])
+            shard[id - start] = image
+            image_metas[id] = image_meta
+
+            boxes = np.asarray(boxes, dtype=np.float32).reshape((-1, 4))
+            boxes_list.append(boxes)
+            labels_list.append(np.asarray(image_info['labels']).reshape((-1,)))
+            offsets[id + 1] = offsets[id] + boxes.shape[0]
+
+            filenames.append(image_info['filename'])
+            filepaths.append(image_info['filepath'])
+
+        shard.flush()
+        del shard
+
+        print('分片{}/{}写入完成'.format(shard_id + 1, num_shards))
+
+    boxes = np.concatenate(boxes_list, axis=0) if boxes_list else np.zeros((0, 4), dtype=np.float32)
+    labels = np.concatenate(labels_list, axis=0) if labels_list else np.zeros((0,))
+
+    with open(os.path.join(output_dir, INDEX_FILENAME), 'wb') as f:
+        np.savez(f,
+                 max_dim=np.array(max_dim),
+                 fingerprint=np.array(fingerprint),
+                 shard_size=np.array(shard_size),
+                 image_metas=image_metas,
+                 offsets=offsets,
+                 boxes=boxes,
+                 labels=labels,
+                 filenames=np.array(filenames, dtype=str),
+                 filepaths=np.array(filepaths, dtype=str))
+
+    return num_images
+
+
+class ShardedImageDataset(object):
+    """
+    分片数据集，图像通过np.load(mmap_mode='r')映射，按需由操作系统分页读取
+    """
+
+    def __init__(self, shard_dir):
+        """
+        :param shard_dir: pack_shards的输出目录
+        """
+        self.shard_dir = shard_dir
+
+        with np.load(os.path.join(shard_dir, INDEX_FILENAME), allow_pickle=False) as data:
+            # 旧版本的索引没有指纹，无法确认是否过期
+            self.fingerprint = str(data['fingerprint']) if 'fingerprint' in data.files else None
+            self.max_dim = int(data['max_dim'])
+            self.shard_size = int(data['shard_size'])
+            self.image_metas = data['image_metas']
+            self.offsets = data['offsets']
+            self.boxes = data['boxes']
+            self.labels = data['labels']
+            self.filenames = data['filenames']
+            self.filepaths = data['filepaths']
+
+        num_shards = (len(self) + self.shard_size - 1) // self.shard_size
+        self.shards = [np.load(os.path.join(shard_dir, SHARD_FILENAME.format(shard_id)), mmap_mode='r')
+                       for shard_id in range(num_shards)]
+
+    def __len__(self):
+        return self.image_metas.shape[0]
+
+    def stale_reason(self, max_dim=None, image_list=None):
+        """
+        检查分片是否与当前配置和数据集一致
+        :param max_dim: 当前的IMAGE_MAX_DIM，None时不检查
+        :param image_list: 当前的数据集，None时不检查
+        :return: 分片过期的原因，一致时为None
+        """
+        if max_dim is not None and int(max_dim) != self.max_dim:
+            return '分片按max_dim={}打包，当前IMAGE_MAX_DIM={}，需要重新打包'.format(self.max_dim, max_dim)
+
+        if image_list is not None and self.fingerprint != dataset_fingerprint(image_list):
+            return '分片打包后数据集已变化(图像列表、图像文件或标注)，需要重新打包'
+
+        return None
+
+    def load_image(self, index):
+        """
+        返回内存映射上的视图，不拷贝
+        :param index:
+        :return: uint8 [max_dim,max_dim,3]
+        """
+        return self.shards[index // self.shard_size][index % self.shard_size]
+
+    def load_image_gt(self, index, image_id=None):
+        """
+        与image.load_image_gt返回一致
+        :param index: 图片下标
+        :param image_id: 写入元数据的图像id，默认为index
+        :return: image, image_meta, gt_boxes
+        """
+        image_meta = self.image_metas[index].copy()
+        image_meta[0] = index if image_id is None else image_id
+
+        return self.load_image(index), image_meta, self.get_boxes(index)
+
+    def get_boxes(self, index):
+        return self.boxes[self.offsets[index]:self.offsets[index + 1]]
+
+    def get_labels(self, index):
+        return self.labels[self.offsets[index]:self.offsets[index + 1]]
+
+
+def shard_image_generator(dataset, batch_size, max_gt_num, stage='train', ring_size=None):
+    """
+    分片数据生成器，输出与generator.image_generator一致
+    :param dataset: ShardedImageDataset
+    :param batch_size: 批数据尺寸
+    :param max_gt_num: gt个数固定为max_gt_num
+    :param stage:
+    :param ring_size: 批数据缓冲环大小，不能小于buffer_ring.required_ring_size(max_queue_size, workers)，None时按fit_generator的默认参数计算
+    :return:
+    """
+    id_list = range(len(dataset))
+
+    buffer_ring = BatchBufferRing(ring_size)
+
+    while True:
+        ids = random.sample(id_list, batch_size)
+
+        buffers = buffer_ring.next()
+        batch_image = buffers.get('image', (batch_size, dataset.max_dim, dataset.max_dim, 3), np.uint8)
+        batch_image_meta = buffers.get('image_meta', (batch_size, 12), np.float64)
+        batch_class_ids = buffers.get('class_ids', (batch_size, max_gt_num, 2), dataset.labels.dtype)
+        batch_bbox = buffers.get('bbox', (batch_size, max_gt_num, 5), np.float64)
+
+        for i, id in enumerate(ids):
+            image, image_meta, bbox = dataset.load_image_gt(id)
+
+            # 从内存映射直接拷贝到批数据中
+            batch_image[i] = image
+            batch_image_meta[i] = image_meta
+
+            if stage == 'train':
+                # gt个数固定，最后一位是padding标志，1-非padding
+                gt_num = min(max_gt_num, bbox.shape[0])
+
+                batch_class_ids[i] = 0
+                batch_class_ids[i, :gt_num, 0] = dataset.get_labels(id)[:gt_num]
+                batch_class_ids[i, :gt_num, 1] = 1
+
+                batch_bbox[i] = 0
+                batch_bbox[i, :gt_num, :4] = bbox[:gt_num]
+                batch_bbox[i, :gt_num, 4] = 1
+
+        if stage == 'train':
+            yield [batch_image,
+                   batch_image_meta,
+                   batch_class_ids,
+                   batch_bbox], None
+        else:
+            yield [batch_image,
+                   batch_image_meta]
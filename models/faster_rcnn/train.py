@@ -6,10 +6,14 @@
 训练模型
 """
 
+import os
+
 from taurus_cv.models.faster_rcnn.io.input import get_prepared_detection_dataset
-from taurus_cv.models.faster_rcnn.preprocessing.generator import image_generator
+from taurus_cv.models.faster_rcnn.preprocessing.generator import image_generator, prefetch_image_generator
+from taurus_cv.models.faster_rcnn.preprocessing.shards import ShardedImageDataset, shard_image_generator
 from taurus_cv.models.faster_rcnn.layers import network
 from taurus_cv.models.faster_rcnn.training import trainer, saver, observer
+from taurus_cv.utils.buffer_ring import required_ring_size
 
 
 def train(args, config):
@@ -22,16 +26,58 @@ def train(args, config):
     # 设置运行时环境 / training.trainer模块
     trainer.set_runtime_environment()
 
+    # 生成器输出缓冲环上的视图，环的大小要覆盖fit_generator队列中和正在生成的所有batch
+    ring_size = required_ring_size(max_queue_size=trainer.MAX_QUEUE_SIZE, workers=trainer.WORKERS)
+
     # 获取VOC数据集中的训练集数据，并根据models/faster_rcnn/config中的分类关联数据，得到最后的训练测试集 / io模块
     train_img_list = get_prepared_detection_dataset(config).get_train_data()
 
-    print("训练集图片数量:{}".format(len(train_img_list)))
+    # 有预先打包的分片时直接从内存映射读取，不再解码和缩放jpeg / preprocessing.shards模块
+    # 分片的max_dim或数据集指纹与当前不一致时说明分片已过期，改为直接读取图像
+    dataset = None
+    if config.shard_path and os.path.exists(config.shard_path):
+        dataset = ShardedImageDataset(config.shard_path)
+        reason = dataset.stale_reason(max_dim=config.IMAGE_MAX_DIM, image_list=train_img_list)
+
+        if reason is not None:
+            print("不使用分片: {}".format(reason))
+            dataset = None
+
+    if dataset is not None:
+
+        print("训练集图片数量(分片):{}".format(len(dataset)))
+
+        generator = shard_image_generator(dataset=dataset,
+                                          batch_size=config.IMAGES_PER_GPU,
+                                          max_gt_num=100,
+                                          ring_size=ring_size)
 
-    # 生成器 没有做数据增强 / preprocessing模块
-    generator = image_generator(image_list=train_img_list,
-                                batch_size=config.IMAGES_PER_GPU,
-                                max_output_dim=config.IMAGE_MAX_DIM,
-                                max_gt_num=100)
+    else:
+
+        print("训练集图片数量:{}".format(len(train_img_list)))
+
+        # config.ini中的值都是字符串
+        prefetch_depth = int(config.prefetch_depth)
+
+        # 多个worker预取，解码和缩放不再占用训练线程 / preprocessing模块
+        if prefetch_depth > 0:
+            generator = prefetch_image_generator(image_list=train_img_list,
+                                                 batch_size=config.IMAGES_PER_GPU,
+                                                 max_output_dim=config.IMAGE_MAX_DIM,
+                                                 max_gt_num=100,
+                                                 depth=prefetch_depth,
+                                                 workers=int(config.prefetch_workers),
+                                                 use_processes=str(config.prefetch_use_processes).lower() in ('1', 'true', 'yes'),
+                                                 deterministic=str(config.prefetch_deterministic).lower() in ('1', 'true', 'yes'),
+                                                 log_every=int(config.prefetch_log_every))
+
+        # 生成器 没有做数据增强 / preprocessing模块
+        else:
+            generator = image_generator(image_list=train_img_list,
+                                        batch_size=config.IMAGES_PER_GPU,
+                                        max_output_dim=config.IMAGE_MAX_DIM,
+                                        max_gt_num=100,
+                                        ring_size=ring_size)
 
     # 先训练rpn
     if 'rpn' in args.stages:
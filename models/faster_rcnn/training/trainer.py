@@ -11,6 +11,11 @@ import tensorflow as tf
 import keras
 from keras.callbacks import TensorBoard, ReduceLROnPlateau, ModelCheckpoint
 
+# fit_generator的队列长度和worker数，生成器的缓冲环大小按这两个值计算
+MAX_QUEUE_SIZE = 10
+WORKERS = 1
+
+
 def set_runtime_environment():
     """
     GPU设置，设置后端，包括字符精度
@@ -75,6 +80,8 @@ def train_rpn(model, generator, epochs, iterations, init_epochs, config):
                         steps_per_epoch=iterations,
                         verbose=1,
                         initial_epoch=init_epochs,
+                        max_queue_size=MAX_QUEUE_SIZE,
+                        workers=WORKERS,
                         callbacks=get_callback('rpn', config=config))
 
     return model
@@ -110,6 +117,8 @@ def train_rcnn(model, generator, epochs, iterations, init_epochs, init_weight_pa
                         steps_per_epoch=iterations,
                         verbose=1,
                         initial_epoch=init_epochs,
+                        max_queue_size=MAX_QUEUE_SIZE,
+                        workers=WORKERS,
                         callbacks=get_callback('rcnn', config=config))
 
     return model
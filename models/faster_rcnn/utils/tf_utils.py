@@ -149,6 +149,161 @@ def clip_boxes(boxes, window):
     return clipped_boxes
 
 
+def batch_apply_regress(deltas, anchors):
+    """
+    批量应用回归目标到边框，与apply_regress一致，整个batch只有一组算子
+    :param deltas: 回归目标[batch_size,N,(dy, dx, dh, dw)]
+    :param anchors: anchor boxes[batch_size,N,(y1,x1,y2,x2)]或所有图像共用的[N,(y1,x1,y2,x2)]
+    :return: [batch_size,N,(y1,x1,y2,x2)]
+    """
+    # 高度和宽度
+    h = anchors[..., 2] - anchors[..., 0]
+    w = anchors[..., 3] - anchors[..., 1]
+
+    # 中心点坐标
+    cy = (anchors[..., 2] + anchors[..., 0]) * 0.5
+    cx = (anchors[..., 3] + anchors[..., 1]) * 0.5
+
+    # 回归系数
+    deltas = deltas * tf.constant([0.1, 0.1, 0.2, 0.2])
+    dy, dx, dh, dw = deltas[..., 0], deltas[..., 1], deltas[..., 2], deltas[..., 3]
+
+    # 中心坐标回归，anchors为二维时按batch广播
+    cy = cy + dy * h
+    cx = cx + dx * w
+    # 高度和宽度回归
+    h = h * tf.exp(dh)
+    w = w * tf.exp(dw)
+
+    return tf.stack([cy - h * 0.5, cx - w * 0.5, cy + h * 0.5, cx + w * 0.5], axis=-1)
+
+
+def batch_gather(params, indices):
+    """
+    按每张图像各自的索引收集
+    :param params: [batch_size,N,...]
+    :param indices: [batch_size,K] int32
+    :return: [batch_size,K,...]
+    """
+    indices = tf.cast(indices, tf.int32)
+    batch_size = tf.shape(indices)[0]
+    k = tf.shape(indices)[1]
+
+    batch_indices = tf.tile(tf.expand_dims(tf.range(batch_size), axis=1), [1, k])
+    return tf.gather_nd(params, tf.stack([batch_indices, indices], axis=2))
+
+
+def batch_top_k(scores, k, tensors=None):
+    """
+    每张图像取分数最高的k个，k大于N时取全部
+    :param scores: [batch_size,N]
+    :param k: 整数
+    :param tensors: 需要同步收集的[batch_size,N,...]张量列表
+    :return: top_scores [batch_size,k], indices [batch_size,k], 收集后的tensors
+    """
+    k = tf.minimum(k, tf.shape(scores)[1])
+    top_scores, indices = tf.nn.top_k(scores, k, sorted=True)
+
+    if tensors is None:
+        return top_scores, indices
+
+    return top_scores, indices, [batch_gather(tensor, indices) for tensor in tensors]
+
+
+def batch_pad_to_fixed_size(input_tensor, valid_num, fixed_size):
+    """
+    与pad_to_fixed_size一致，每张图像的有效数量不同；在最后一维增加一个标志位,0-padding,1-非padding
+    :param input_tensor: [batch_size,M,C]，每张图像前valid_num个有效
+    :param valid_num: [batch_size] 每张图像的有效数量
+    :param fixed_size: 固定尺寸
+    :return: [batch_size,fixed_size,C+1]，padding部分全为0
+    """
+    size = tf.shape(input_tensor)[1]
+
+    # 超出fixed_size的截断，不足的padding 0
+    input_tensor = input_tensor[:, :fixed_size]
+    input_tensor = tf.pad(input_tensor, [[0, 0], [0, tf.maximum(0, fixed_size - size)], [0, 0]], mode='CONSTANT', constant_values=0)
+
+    tag = tf.sequence_mask(valid_num, fixed_size, dtype=input_tensor.dtype)  # [batch_size,fixed_size]
+    tag = tf.expand_dims(tag, axis=2)
+
+    return tf.concat([input_tensor * tag, tag], axis=2)
+
+
+def batch_nms(boxes, scores, max_output_size, iou_threshold=0.5, score_threshold=0.05, parallel_iterations=16):
+    """
+    批量非极大值抑制，map_fn逐张图像调用nms，nms仍然每张图像执行一次；
+    图中只有一份nms子图，不随batch_size复制，parallel_iterations张图像可以同时执行
+    :param boxes: [batch_size,N,4]
+    :param scores: [batch_size,N]
+    :param max_output_size: 每张图像最多保留的边框数
+    :param iou_threshold:
+    :param score_threshold:
+    :param parallel_iterations: 同时处理的图像数
+    :return: indices [batch_size,max_output_size] 按分数降序，无效位置为0; valid_num [batch_size]
+    """
+    def nms_graph(x):
+        indices = tf.image.non_max_suppression(x[0], x[1], max_output_size, iou_threshold, score_threshold)
+        valid_num = tf.shape(indices)[0]
+        indices = tf.pad(indices, [[0, max_output_size - valid_num]], mode='CONSTANT', constant_values=0)
+        return indices, valid_num
+
+    indices, valid_num = tf.map_fn(nms_graph,
+                                   elems=[boxes, scores],
+                                   dtype=(tf.int32, tf.int32),
+                                   parallel_iterations=parallel_iterations,
+                                   back_prop=False)
+
+    indices.set_shape([None, max_output_size])
+    return indices, valid_num
+
+
+def flat_batch_nms(boxes, scores, max_output_size, iou_threshold=0.5, score_threshold=0.05):
+    """
+    整个batch只调用一次nms：按图像平移边框使不同图像的边框互不重叠，展平为[batch_size*N,4]后做一次nms，
+    再按图像拆分，每张图像保留分数最高的max_output_size个，结果与逐张图像nms一致
+    nms的总数上限为batch_size*N，否则一张图像的边框会挤占其它图像的名额；
+    适合score_threshold过滤后边框很少的情况，如检测框的nms；边框坐标经平移后变大，float32下仍有足够的精度
+    :param boxes: [batch_size,N,4]
+    :param scores: [batch_size,N]
+    :param max_output_size: 每张图像最多保留的边框数
+    :param iou_threshold:
+    :param score_threshold:
+    :return: indices [batch_size,max_output_size] 图像内的下标，按分数降序，无效位置为0; valid_num [batch_size]
+    """
+    batch_size = tf.shape(boxes)[0]
+    num = tf.shape(boxes)[1]
+
+    # 按图像平移，平移量大于所有边框的范围
+    offset = tf.reduce_max(tf.abs(boxes)) * 2. + 1.
+    image_offsets = tf.cast(tf.range(batch_size), boxes.dtype) * offset
+    boxes = boxes + tf.reshape(image_offsets, [-1, 1, 1])
+
+    flat_scores = tf.reshape(scores, [-1])
+    keep = tf.image.non_max_suppression(tf.reshape(boxes, [-1, 4]),
+                                        flat_scores,
+                                        tf.size(flat_scores),
+                                        iou_threshold,
+                                        score_threshold)  # 按分数降序
+
+    keep_image_ids = keep // num
+    keep_indices = keep % num
+
+    # 每个保留的边框在所属图像中的名次
+    one_hot = tf.one_hot(keep_image_ids, batch_size, dtype=tf.int32)  # [K,batch_size]
+    ranks = tf.reduce_sum(tf.cumsum(one_hot, axis=0) * one_hot, axis=1) - 1  # [K]
+
+    # 每张图像取前max_output_size个，写入各自的行
+    selected = tf.where(ranks < max_output_size)[:, 0]
+    scatter_indices = tf.stack([tf.gather(keep_image_ids, selected), tf.gather(ranks, selected)], axis=1)
+    indices = tf.scatter_nd(scatter_indices, tf.gather(keep_indices, selected), tf.stack([batch_size, max_output_size]))
+
+    valid_num = tf.minimum(tf.reduce_sum(one_hot, axis=0), max_output_size)
+
+    indices.set_shape([None, max_output_size])
+    return indices, valid_num
+
+
 def main():
     sess = tf.Session()
     x = sess.run(tf.maximum(3.0, 2.0))
@@ -9,30 +9,51 @@ import tensorflow as tf
 from taurus_cv.models.retinanet.model import tensorflow_backend
 
 # 自定义损失，字典，总损失是每个loss之和
-def get_loss():
+def get_loss(compact_targets=False):
 
     return {
         'regression_ab': smooth_l1(),
-        'classification_ab': focal(),
+        'classification_ab': focal(compact_targets=compact_targets),
         'regression_af': smooth_l1(),
-        'classification_af': focal()
+        'classification_af': focal(compact_targets=compact_targets)
     }
 
 
-def focal(alpha=0.25, gamma=2.0):
+def compact_to_labels(y_true, num_classes):
+    """
+    把紧凑的anchor目标展开为one-hot标签
+    :param y_true: [batch,N,(anchor_state,class_id)]，anchor_state: -1忽略，0背景，1正样本
+    :param num_classes: 类别数，标量张量
+    :return: anchor_state [batch,N]，labels [batch,N,num_classes]，与稠密编码一致(忽略的anchor全为0，之后会被过滤)
+    """
+    anchor_state = y_true[:, :, 0]
+    class_ids = keras.backend.cast(y_true[:, :, 1], 'int32')
+
+    labels = keras.backend.one_hot(class_ids, num_classes)
+    labels = labels * keras.backend.expand_dims(keras.backend.cast(keras.backend.equal(anchor_state, 1), keras.backend.floatx()), axis=2)
+
+    return anchor_state, labels
+
+
+def focal(alpha=0.25, gamma=2.0, compact_targets=False):
     """
     Focal Loss
     :param alpha:
     :param gamma:
+    :param compact_targets: y_true为紧凑编码[batch,N,(anchor_state,class_id)]，在图中展开为one-hot
     :return:
     """
     def _focal(y_true, y_pred):
 
-        labels         = y_true
         classification = y_pred
 
+        if compact_targets:
+            anchor_state, labels = compact_to_labels(y_true, keras.backend.shape(classification)[2])
+        else:
+            labels       = y_true
+            anchor_state = keras.backend.max(labels, axis=2)  # -1 for ignore, 0 for background, 1 for object
+
         # filter out "ignore" anchors
-        anchor_state   = keras.backend.max(labels, axis=2)  # -1 for ignore, 0 for background, 1 for object
         indices        = tensorflow_backend.where(keras.backend.not_equal(anchor_state, -1))
         labels         = tensorflow_backend.gather_nd(labels, indices)
         classification = tensorflow_backend.gather_nd(classification, indices)
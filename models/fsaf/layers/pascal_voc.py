@@ -12,8 +12,8 @@ from matplotlib import pyplot as plt
 from six import raise_from
 
 from taurus_cv.models.fsaf.layers.anchors import anchor_targets_bbox, bbox_transform
-from taurus_cv.models.fsaf.layers.transform import transform_aabb
-from taurus_cv.models.fsaf.preprocessing.image import read_image_bgr, TransformParameters, apply_transform, adjust_transform_for_image, resize_image, preprocess_image
+from taurus_cv.models.fsaf.layers.transform import transform_aabbs
+from taurus_cv.models.fsaf.preprocessing.image import read_image_bgr, TransformParameters, apply_transform, adjust_transform_for_image, resize_image, transform_resize_image, preprocess_image
 from taurus_cv.utils.spe import spe
 
 try:
@@ -165,8 +165,23 @@ class Generator(object):
             image = apply_transform(transform, image, self.transform_parameters)
 
             annotations = annotations.copy()
-            for index in range(annotations.shape[0]):
-                annotations[index, :4] = transform_aabb(transform, annotations[index, :4])
+            annotations[:, :4] = transform_aabbs(transform, annotations[:, :4])
+
+        return image, annotations
+
+    def transform_resize_group_entry(self, image, annotations):
+        """
+        随机变换和缩放合成一个仿射矩阵，图像只重采样一次
+        :param image:
+        :param annotations:
+        :return: 缩放到最终尺寸的图像和标注
+        """
+        transform = adjust_transform_for_image(next(self.transform_generator), image, self.transform_parameters.relative_translation)
+
+        image, matrix, _ = transform_resize_image(transform, image, self.transform_parameters, self.image_min_side, self.image_max_side)
+
+        annotations = annotations.copy()
+        annotations[:, :4] = transform_aabbs(matrix, annotations[:, :4])
 
         return image, annotations
 
@@ -198,11 +213,11 @@ class Generator(object):
         if self.debug:
             self.save_img_ann(image, annotations, '0PRE', index)
 
-        image, annotations = self.random_transform_group_entry(image, annotations)
-
-        image, image_scale = self.resize_image(image)
-
-        annotations[:, :4] *= image_scale
+        if self.transform_generator:
+            image, annotations = self.transform_resize_group_entry(image, annotations)
+        else:
+            image, image_scale = self.resize_image(image)
+            annotations[:, :4] *= image_scale
 
         if self.debug:
             self.save_img_ann(image, annotations, '1POST', index)
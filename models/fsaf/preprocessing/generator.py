@@ -8,11 +8,11 @@ import cv2
 import keras
 
 from taurus_cv.models.fsaf.preprocessing.anchors import anchor_targets_bbox, bbox_transform
-from taurus_cv.models.fsaf.preprocessing.image import preprocess_image
+from taurus_cv.models.fsaf.preprocessing.image import preprocess_image, read_resized_image_bgr
 from taurus_cv.utils.spe import spe
 
 
-def generator(image_list, num_classes, batch_size, image_size=(512,512), stage='train'):
+def generator(image_list, num_classes, batch_size, image_size=(512,512), stage='train', compact_targets=False):
 
     length = len(image_list)
     idx_list = range(length)
@@ -26,8 +26,8 @@ def generator(image_list, num_classes, batch_size, image_size=(512,512), stage='
         for id in ids:
 
             # img
-            image = cv2.imread(image_list[id]['filepath'])
-            image = cv2.resize(image, image_size)
+            # 原图远大于输入尺寸时降低分辨率解码
+            image = read_resized_image_bgr(image_list[id]['filepath'], image_size)
 
             # anno
             gt_bbox = image_list[id]['boxes']
@@ -44,7 +44,7 @@ def generator(image_list, num_classes, batch_size, image_size=(512,512), stage='
         inputs = np.array(batch_images)
 
         # model outputs
-        outputs = get_outputs(batch_images, batch_annotations, batch_size, num_classes)
+        outputs = get_outputs(batch_images, batch_annotations, batch_size, num_classes, compact_targets)
         # spe(inputs[0].shape, outputs[0].shape, outputs[1].shape, outputs[0][0][:5], outputs[1][0][:5])
 
         if stage == 'train':
@@ -54,7 +54,11 @@ def generator(image_list, num_classes, batch_size, image_size=(512,512), stage='
 
 
 # image_group (1,512,512,3) anno_group (1,2,5) 1张图，2个gtbox, 4个坐标+置信度
-def get_outputs(image_batch, annotations_batch, batch_size, num_classes):
+def get_outputs(image_batch, annotations_batch, batch_size, num_classes, compact_targets=False):
+    """
+    计算一个batch的回归和分类目标
+    :param compact_targets: 分类目标使用紧凑编码[anchor_state,class_id]，配合focal(compact_targets=True)
+    """
 
     # 512
     max_shape = tuple(max(image.shape[x] for image in image_batch) for x in range(3))
@@ -64,17 +68,20 @@ def get_outputs(image_batch, annotations_batch, batch_size, num_classes):
 
     for index, (image, annotations) in enumerate(zip(image_batch, annotations_batch)):
 
-        labels_group[index], annotations, anchors = anchor_targets(max_shape, annotations, num_classes, mask_shape=image.shape)
+        labels_group[index], annotations, anchors = anchor_targets(max_shape, annotations, num_classes, mask_shape=image.shape, compact=compact_targets)
         regression_group[index] = bbox_transform(anchors, annotations)
 
-        anchor_states = np.max(labels_group[index], axis=1, keepdims=True)
+        if compact_targets:
+            anchor_states = labels_group[index][:, :1]
+        else:
+            anchor_states = np.max(labels_group[index], axis=1, keepdims=True)
         regression_group[index] = np.append(regression_group[index], anchor_states, axis=1)
 
     # (1, 196416, 5) regression_group (1, 196416, 8) labels_group
     # print(regression_group[0].shape, labels_group[0][:5])
     # exit()
 
-    labels_batch = np.zeros((batch_size,) + labels_group[0].shape, dtype=keras.backend.floatx())
+    labels_batch = np.zeros((batch_size,) + labels_group[0].shape, dtype=labels_group[0].dtype if compact_targets else keras.backend.floatx())
     regression_batch = np.zeros((batch_size,) + regression_group[0].shape, dtype=keras.backend.floatx())
 
     for index, (labels, regression) in enumerate(zip(labels_group, regression_group)):
@@ -5,6 +5,7 @@ import cv2
 import keras
 import numpy as np
 
+from taurus_cv.datasets.image_size import read_image_size
 from taurus_cv.models.fsaf.layers.transform import change_transform_origin
 
 
@@ -18,6 +19,26 @@ def read_image_bgr(path):
     return image[:, :, ::-1].copy()
 
 
+def read_resized_image_bgr(path, image_size):
+    """
+    按固定输入尺寸读取并缩放图像，原图足够大时用opencv的IMREAD_REDUCED_*按DCT缩放解码
+    :param path: 图像路径
+    :param image_size: (width, height)
+    :return: BGR图像 [height,width,3]
+    """
+    width, height = read_image_size(path)
+
+    flag = cv2.IMREAD_COLOR
+    for factor, reduced_flag in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if width / factor >= image_size[0] and height / factor >= image_size[1]:
+            flag = reduced_flag
+            break
+
+    image = cv2.imread(path, flag)
+
+    return cv2.resize(image, image_size)
+
+
 def preprocess_image(x):
 
     x = x.astype(keras.backend.floatx())
@@ -101,15 +122,22 @@ class TransformParameters:
             return cv2.INTER_LANCZOS4
 
 
-def apply_transform(matrix, image, params):
-
+def apply_transform(matrix, image, params, dsize=None):
+    """
+    仿射变换图像
+    :param matrix: 3x3仿射矩阵
+    :param image:
+    :param params: TransformParameters
+    :param dsize: 输出尺寸(width, height)，默认与输入相同；矩阵中合成了缩放时传入缩放后的尺寸
+    :return:
+    """
     if params.channel_axis != 2:
         image = np.moveaxis(image, params.channel_axis, 2)
 
     output = cv2.warpAffine(
         image,
         matrix[:2, :],
-        dsize=(image.shape[1], image.shape[0]),
+        dsize=dsize or (image.shape[1], image.shape[0]),
         flags=params.cvInterpolation(),
         borderMode=params.cvBorderMode(),
         borderValue=params.cval,
@@ -120,17 +148,47 @@ def apply_transform(matrix, image, params):
     return output
 
 
+def resize_scale(rows, cols, min_side, max_side):
+    """
+    与resize_image相同的缩放比例计算
+    """
+    scale = min_side / min(rows, cols)
+
+    if max(rows, cols) * scale > max_side:
+        scale = max_side / max(rows, cols)
+
+    return scale
+
+
+def transform_resize_image(matrix, image, params, min_side, max_side):
+    """
+    随机仿射变换和缩放合成一个矩阵，只用一次warpAffine重采样到最终尺寸
+    输出尺寸与apply_transform + resize_image一致
+    :param matrix: 已经按图像调整过的3x3仿射矩阵
+    :param image:
+    :param params: TransformParameters
+    :param min_side:
+    :param max_side:
+    :return: 变换后的图像，合成后的矩阵(用于变换边框)，缩放比例
+    """
+    rows, cols = image.shape[:2] if params.channel_axis == 2 else image.shape[1:]
+
+    scale = resize_scale(rows, cols, min_side, max_side)
+
+    # 先变换再缩放
+    matrix = np.array([[scale, 0, 0], [0, scale, 0], [0, 0, 1]]).dot(matrix)
+
+    # cv2.resize(fx=scale)输出尺寸为round(原尺寸*scale)
+    dsize = (int(round(cols * scale)), int(round(rows * scale)))
+
+    return apply_transform(matrix, image, params, dsize), matrix, scale
+
+
 def resize_image(img, min_side, max_side):
     (rows, cols, _) = img.shape
 
-    smallest_side = min(rows, cols)
-
     # 计算表根据图像的大小
-    scale = min_side / smallest_side
-
-    largest_side = max(rows, cols)
-    if largest_side * scale > max_side:
-        scale = max_side / largest_side
+    scale = resize_scale(rows, cols, min_side, max_side)
 
     img = cv2.resize(img, None, fx=scale, fy=scale)
 
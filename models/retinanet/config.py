@@ -14,6 +14,12 @@ class Config:
         self.freeze_layer_stop_name = config['train']['freeze_layer_stop_name']
         self.train_val_split = config['train']['train_val_split']
         self.augmentation = config['train']['augmentation']
+        self.workers = config['train'].get('workers', 1)
+        self.parse_workers = config['train'].get('parse_workers', 1)
+        self.reduced_decode = config['train'].get('reduced_decode', False)
+        self.tf_augmentation = config['train'].get('tf_augmentation', False)
+        self.compact_targets = config['train'].get('compact_targets', False)
+        self.target_cache_dir = config['train'].get('target_cache_dir', '')
 
         self.pretrained_weights_path = config['path']['pretrained_weights']
         self.base_weights_path = config['path']['base_weights']
@@ -24,14 +30,21 @@ class Config:
         self.test_images_path = config['path']['test_images']
         self.test_result_path = config['path']['test_result']
         self.log_path = config['path']['log']
+        self.frozen_graph_path = config['path'].get('frozen_graph', '')
+        self.quantized_weights_path = config['path'].get('quantized_weights', '')
 
         self.type = config['model']['type']
         self.model_image = config['model']['model_image']
         self.classes = config['model']['classes']
         self.img_min_size = config['model']['img_min_size']
         self.img_max_size = config['model']['img_max_size']
+        self.uint8_inputs = config['model'].get('uint8_inputs', False)
 
         self.test_save_annotations = config['test']['save_annotations']
         self.test_start_index = config['test']['start_index']
+        self.quantize_mode = config['test'].get('quantize_mode', 'int8')
+        self.use_frozen_graph = config['test'].get('use_frozen_graph', False)
+        self.use_quantized_weights = config['test'].get('use_quantized_weights', False)
+        self.calibration_images = config['test'].get('calibration_images', 50)
 
         self.base_weights_path = self.base_weights_path.format(self.type)
\ No newline at end of file
@@ -8,7 +8,7 @@ import cv2
 from matplotlib import pyplot as plt
 
 from taurus_cv.models.retinanet.model.pascal_voc import save_annotations
-from taurus_cv.models.retinanet.model.image import read_image_bgr, preprocess_image, resize_image, read_image_rgb
+from taurus_cv.models.retinanet.model.image import read_resized_image_bgr, preprocess_image, read_image_rgb
 from taurus_cv.models.retinanet.model.resnet import resnet_retinanet
 from taurus_cv.models.retinanet.config import Config
 
@@ -28,7 +28,7 @@ if os.path.isfile(config.pretrained_weights_path):
     classes = config.classes
 
 if config.type.startswith('resnet'):
-    model, _ = resnet_retinanet(len(classes), backbone=config.type, weights='imagenet', nms=True)
+    model, _ = resnet_retinanet(len(classes), backbone=config.type, weights='imagenet', nms=True, uint8_inputs=config.uint8_inputs)
 else:
     model = None
     print("模型 ({})".format(config.type))
@@ -47,11 +47,12 @@ for nimage, imgf in enumerate(sorted(os.listdir(config.test_images_path))):
     imgfp = os.path.join(config.test_images_path, imgf)
     if os.path.isfile(imgfp):
         try:
-            img = read_image_bgr(imgfp)
+            # 按输入尺寸降低分辨率解码，scale仍是相对原图的比例
+            img, scale = read_resized_image_bgr(imgfp, min_side=config.img_min_size, max_side=config.img_max_size)
         except:
             continue
-        img = preprocess_image(img.copy())
-        img, scale = resize_image(img, min_side=config.img_min_size, max_side=config.img_max_size)
+        if not config.uint8_inputs:
+            img = preprocess_image(img)
 
         orig_image = read_image_rgb(imgfp)
 
@@ -0,0 +1,37 @@
+import os
+
+import keras
+
+from taurus_cv.models.retinanet.config import Config
+from taurus_cv.models.retinanet.model.resnet import resnet_retinanet
+from taurus_cv.utils.frozen_graph import freeze_model, missing_weight_layers
+
+# 导出冻结的推理图，test.use_frozen_graph为true时inference.py直接载入
+config = Config('configRetinaNet.json')
+
+# 推理模式，BN使用推理时的计算
+keras.backend.set_learning_phase(0)
+
+# 只导出训练好的权重，不退回预训练权重
+wpath = config.trained_weights_path
+if not os.path.isfile(wpath):
+    print("权重不存在({})".format(wpath))
+    exit(1)
+
+if config.type.startswith('resnet'):
+    model, _ = resnet_retinanet(len(config.classes), backbone=config.type, weights=None, nms=True, uint8_inputs=config.uint8_inputs)
+else:
+    print("模型 ({})".format(config.type))
+    exit(1)
+
+# 缺少的层会被by_name静默跳过，形状不一致时load_weights直接报错，都不能导出
+missing = missing_weight_layers(model, wpath)
+if missing:
+    print("权重文件中缺少以下层({}): {}".format(wpath, ', '.join(missing)))
+    exit(1)
+
+model.load_weights(wpath, by_name=True)
+
+node_num = freeze_model(model, config.frozen_graph_path)
+
+print("导出完成:{} 节点数:{}".format(config.frozen_graph_path, node_num))
@@ -1,40 +1,199 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
 import numpy as np
 
+# anchors缓存的大小，输入尺寸固定时只会用到一项
+ANCHOR_CACHE_SIZE = 8
+
+# 无法剪枝(negative_overlap<=0)时分块计算IoU，每块的anchor数
+OVERLAP_CHUNK_SIZE = 16384
+
+# 剪枝使用的阈值比negative_overlap低这么多，避免浮点误差把IoU恰好达到阈值的anchor剪掉
+OVERLAP_TOLERANCE = 1e-4
+
+# anchor按宽高分组时的取整位数，平移得到的同一形状anchor宽高只有浮点误差的差别
+SHAPE_GROUP_DECIMALS = 2
+
+
 def anchor_targets_bbox(image_shape,
                         annotations,
                         num_classes,
                         mask_shape=None,
                         negative_overlap=0.4,
                         positive_overlap=0.5,
+                        compact=False,
                         **kwargs):
-    anchors = anchors_for_shape(image_shape, **kwargs)
+    """
+    计算anchor的分类和回归目标
+    :param compact: 返回紧凑编码[N,(anchor_state,class_id)] int16，否则返回稠密的[N,num_classes]标签
+    :return: labels, 每个anchor对应的标注, anchors
+    """
+    anchor_set = cached_anchors_for_shape(image_shape, **kwargs)
+    anchors = anchor_set.anchors
 
-    # label: 1 positive, 0 negative, -1 ignore
-    labels = np.ones((anchors.shape[0], num_classes)) * -1
+    anchor_states, class_ids, argmax_overlaps_inds = compute_anchor_states(anchor_set, image_shape, annotations, mask_shape, negative_overlap, positive_overlap)
 
-    if annotations.shape[0]:
+    if argmax_overlaps_inds is not None:
+        annotations = annotations[argmax_overlaps_inds]
+    else:
+        annotations = np.zeros_like(anchors)
 
-        overlaps = compute_overlap(anchors, annotations[:, :4])
-        argmax_overlaps_inds = np.argmax(overlaps, axis=1)
-        max_overlaps = overlaps[np.arange(overlaps.shape[0]), argmax_overlaps_inds]
+    return anchor_labels(anchor_states, class_ids, num_classes, compact), annotations, anchors
+
+
+def compute_anchor_states(anchor_set,
+                          image_shape,
+                          annotations,
+                          mask_shape=None,
+                          negative_overlap=0.4,
+                          positive_overlap=0.5):
+    """
+    计算每个anchor的状态和类别
+    :param anchor_set: AnchorSet
+    :param image_shape: anchors对应的输入尺寸
+    :param annotations: [n,5]
+    :param mask_shape: 图像实际尺寸，中心超出的anchor忽略
+    :return: anchor_states int8 [N] (1 positive, 0 negative, -1 ignore), class_ids int16 [N], 每个anchor最匹配的标注下标(没有标注时为None)
+    """
+    anchors = anchor_set.anchors
+
+    anchor_states = np.zeros((anchors.shape[0],), dtype=np.int8)
+    class_ids = np.zeros((anchors.shape[0],), dtype=np.int16)
+    argmax_overlaps_inds = None
 
-        labels[max_overlaps < negative_overlap, :] = 0
+    if annotations.shape[0]:
 
-        annotations = annotations[argmax_overlaps_inds]
+        argmax_overlaps_inds, max_overlaps = compute_max_overlaps(anchors, annotations[:, :4], negative_overlap,
+                                                                  anchor_areas=anchor_set.areas, shape_groups=anchor_set.shape_groups)
+
+        anchor_states[max_overlaps >= negative_overlap] = -1
 
         positive_indices = max_overlaps >= positive_overlap
-        labels[positive_indices, :] = 0
-        labels[positive_indices, annotations[positive_indices, 4].astype(int)] = 1
-    else:
-        labels[:] = 0
-        annotations = np.zeros_like(anchors)
+        anchor_states[positive_indices] = 1
+        class_ids[positive_indices] = annotations[argmax_overlaps_inds[positive_indices], 4]
 
     mask_shape = image_shape if mask_shape is None else mask_shape
-    anchors_centers = np.vstack([(anchors[:, 0] + anchors[:, 2]) / 2, (anchors[:, 1] + anchors[:, 3]) / 2]).T
+    anchors_centers = anchor_set.centers
     indices = np.logical_or(anchors_centers[:, 0] >= mask_shape[1], anchors_centers[:, 1] >= mask_shape[0])
-    labels[indices, :] = -1
+    anchor_states[indices] = -1
+
+    return anchor_states, class_ids, argmax_overlaps_inds
+
+
+def anchor_labels(anchor_states, class_ids, num_classes, compact=False):
+    """
+    由anchor状态和类别生成分类目标
+    :param compact: 紧凑编码[N,(anchor_state,class_id)] int16，否则为稠密的[N,num_classes]
+    :return:
+    """
+    if compact:
+        return np.stack([anchor_states, class_ids], axis=1).astype(np.int16)
+
+    # 稠密编码，忽略的anchor整行为-1，正样本对应类别为1
+    labels = np.zeros((anchor_states.shape[0], num_classes))
+    labels[anchor_states == -1, :] = -1
+    positive_indices = np.where(anchor_states == 1)[0]
+    labels[positive_indices, class_ids[positive_indices]] = 1
+
+    return labels
+
+
+class AnchorSet(object):
+    """
+    一组anchors及其派生量，全部只读，多个batch共用
+    """
+
+    def __init__(self, anchors):
+        self.anchors = anchors
+        self.centers = np.vstack([(anchors[:, 0] + anchors[:, 2]) / 2, (anchors[:, 1] + anchors[:, 3]) / 2]).T
+        self.areas = (anchors[:, 2] - anchors[:, 0] + 1) * (anchors[:, 3] - anchors[:, 1] + 1)
+
+        for array in (self.anchors, self.centers, self.areas):
+            array.flags.writeable = False
+
+        self._shape_groups = None
+
+        self._digest = None
+
+    @property
+    def digest(self):
+        """
+        anchors内容的摘要，anchor参数或输入尺寸变化时随之变化，只计算一次
+        """
+        if self._digest is None:
+            self._digest = hashlib.sha1(self.anchors.tobytes()).hexdigest()
+        return self._digest
+
+
+    @property
+    def shape_groups(self):
+        """
+        anchor_shape_groups(anchors)，第一次用到时计算，多个线程同时计算只是重复一次
+        """
+        if self._shape_groups is None:
+            groups = anchor_shape_groups(self.anchors)
+            for group in groups:
+                for array in group[3:]:
+                    array.flags.writeable = False
+            self._shape_groups = groups
+        return self._shape_groups
+
+
+class AnchorCache(object):
+    """
+    按(图像尺寸, 金字塔参数)缓存anchors的LRU缓存
+    """
+
+    def __init__(self, size=ANCHOR_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
 
-    return labels, annotations, anchors
+    @staticmethod
+    def key(image_shape, **kwargs):
+        key = [tuple(int(x) for x in image_shape[:2])]
+        for name in sorted(kwargs.keys()):
+            value = kwargs[name]
+            key.append((name, None if value is None else tuple(np.asarray(value, dtype=np.float64).ravel().tolist())))
+        return tuple(key)
+
+    def get(self, image_shape, **kwargs):
+        key = self.key(image_shape, **kwargs)
+
+        with self.lock:
+            anchor_set = self.entries.get(key)
+            if anchor_set is not None:
+                self.entries.move_to_end(key)
+                return anchor_set
+
+        # 在锁外生成，多个线程同时未命中时只是重复计算一次
+        anchor_set = AnchorSet(anchors_for_shape(image_shape, **kwargs))
+
+        with self.lock:
+            self.entries[key] = anchor_set
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+        return anchor_set
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+anchor_cache = AnchorCache()
+
+
+def cached_anchors_for_shape(image_shape, **kwargs):
+    """
+    带缓存的anchors_for_shape，返回的anchors只读
+    :param image_shape:
+    :param kwargs: pyramid_levels, ratios, scales, strides, sizes
+    :return: AnchorSet
+    """
+    return anchor_cache.get(image_shape, **kwargs)
 
 
 def anchors_for_shape(image_shape,
@@ -60,12 +219,21 @@ def anchors_for_shape(image_shape,
     for i in range(pyramid_levels[0] - 1):
         image_shape = (image_shape + 1) // 2
 
-    all_anchors = np.zeros((0, 4))
-    for idx, p in enumerate(pyramid_levels):
+    # 先计算每层的特征图尺寸，一次分配全部anchors
+    level_shapes = []
+    for p in pyramid_levels:
         image_shape = (image_shape + 1) // 2
+        level_shapes.append(image_shape)
+
+    num_anchors = len(ratios) * len(scales)
+    all_anchors = np.empty((sum(int(np.prod(shape)) for shape in level_shapes) * num_anchors, 4))
+
+    start = 0
+    for idx, shape in enumerate(level_shapes):
         anchors = generate_anchors(base_size=sizes[idx], ratios=ratios, scales=scales)
-        shifted_anchors = shift(image_shape, strides[idx], anchors)
-        all_anchors = np.append(all_anchors, shifted_anchors, axis=0)
+        end = start + int(np.prod(shape)) * num_anchors
+        all_anchors[start:end] = shift(shape, strides[idx], anchors)
+        start = end
 
     return all_anchors
 
@@ -157,7 +325,145 @@ def bbox_transform(anchors, gt_boxes, mean=None, std=None):
     return targets
 
 
-def compute_overlap(a, b):
+def compute_max_overlaps(anchors, boxes, negative_overlap, anchor_areas=None, shape_groups=None, chunk_size=OVERLAP_CHUNK_SIZE):
+    """
+    计算每个anchor的最大IoU及对应的gt下标，不生成(num_anchors, num_gt)的完整矩阵
+    对每个gt只计算IoU可能达到negative_overlap的anchor:
+    1. 形状: 同一组anchor与gt中心重合时IoU最大，为min(宽)*min(高)/并集，达不到阈值的整组跳过
+    2. 位置: IoU达到阈值时x方向的重叠长度至少为 阈值*max(面积)/min(高)，而重叠长度不超过(宽+宽)/2-中心距离，
+       由此得到anchor中心相对gt中心的窗口，y方向同理；组内按中心y排序，二分取出y窗口再按x窗口过滤
+    候选(anchor, gt)对按compute_overlap的公式用float64计算，最大IoU不小于negative_overlap的anchor(忽略和正样本)
+    的IoU和gt下标与compute_overlap + argmax完全一致；其余anchor标签都是0，IoU和gt下标可能与完整计算不同，只影响不参与回归损失的负样本
+    negative_overlap<=0时无法剪枝，分块完整计算
+    :param anchors: [N,4]
+    :param boxes: [M,4]
+    :param negative_overlap: 负样本阈值
+    :param anchor_areas: [N,] anchor面积，None时计算
+    :param shape_groups: anchor_shape_groups(anchors)的结果，None时计算
+    :param chunk_size: 完整计算时每块anchor数
+    :return: argmax_overlaps_inds [N,], max_overlaps [N,]
+    """
+    num_anchors = anchors.shape[0]
+    boxes = boxes[:, :4]
+
+    if anchor_areas is None:
+        anchor_areas = (anchors[:, 2] - anchors[:, 0] + 1) * (anchors[:, 3] - anchors[:, 1] + 1)
+
+    argmax_overlaps_inds = np.zeros((num_anchors,), dtype=np.int64)
+    max_overlaps = np.zeros((num_anchors,), dtype=np.float64)
+
+    threshold = negative_overlap - OVERLAP_TOLERANCE
+
+    if threshold <= 0:
+        for start in range(0, num_anchors, chunk_size):
+            end = min(num_anchors, start + chunk_size)
+
+            overlaps = compute_overlap(anchors[start:end], boxes, a_areas=anchor_areas[start:end])
+            inds = np.argmax(overlaps, axis=1)
+
+            argmax_overlaps_inds[start:end] = inds
+            max_overlaps[start:end] = overlaps[np.arange(end - start), inds]
+
+        return argmax_overlaps_inds, max_overlaps
+
+    if shape_groups is None:
+        shape_groups = anchor_shape_groups(anchors)
+
+    box_widths = boxes[:, 2] - boxes[:, 0] + 1
+    box_heights = boxes[:, 3] - boxes[:, 1] + 1
+    box_areas = box_widths * box_heights
+    box_centers_x = (boxes[:, 0] + boxes[:, 2]) / 2
+    box_centers_y = (boxes[:, 1] + boxes[:, 3]) / 2
+
+    pair_anchors = []
+    pair_boxes = []
+
+    for width, height, area, inds, centers_x, centers_y in shape_groups:
+        # 组内宽高取最大值、面积取最小值，得到的上界和窗口都偏大，不会误删
+        min_widths = np.minimum(width, box_widths)
+        min_heights = np.minimum(height, box_heights)
+        max_areas = np.maximum(area, box_areas)
+
+        intersections = min_widths * min_heights
+        best_overlaps = intersections / np.maximum(area + box_areas - intersections, np.finfo(float).eps)
+
+        half_x = (width + box_widths) / 2 - threshold * max_areas / min_heights
+        half_y = (height + box_heights) / 2 - threshold * max_areas / min_widths
+
+        for box_ind in np.where((best_overlaps >= threshold) & (half_x >= 0) & (half_y >= 0))[0]:
+            start = np.searchsorted(centers_y, box_centers_y[box_ind] - half_y[box_ind], side='left')
+            end = np.searchsorted(centers_y, box_centers_y[box_ind] + half_y[box_ind], side='right')
+
+            candidates = start + np.where(np.abs(centers_x[start:end] - box_centers_x[box_ind]) <= half_x[box_ind])[0]
+            if candidates.size == 0:
+                continue
+
+            pair_anchors.append(inds[candidates])
+            pair_boxes.append(np.full((candidates.size,), box_ind, dtype=np.int64))
+
+    if not pair_anchors:
+        return argmax_overlaps_inds, max_overlaps
+
+    pair_anchors = np.concatenate(pair_anchors)
+    pair_boxes = np.concatenate(pair_boxes)
+    overlaps = compute_pair_overlap(anchors[pair_anchors], boxes[pair_boxes], anchor_areas[pair_anchors], box_areas[pair_boxes])
+
+    # 每个anchor取IoU最大、相同时gt下标最小的一对，与np.argmax的结果一致
+    order = np.lexsort((pair_boxes, -overlaps, pair_anchors))
+    pair_anchors = pair_anchors[order]
+    first = np.concatenate([[True], pair_anchors[1:] != pair_anchors[:-1]])
+
+    argmax_overlaps_inds[pair_anchors[first]] = pair_boxes[order][first]
+    max_overlaps[pair_anchors[first]] = overlaps[order][first]
+
+    return argmax_overlaps_inds, max_overlaps
+
+
+def anchor_shape_groups(anchors):
+    """
+    按宽高把anchors分组，组内按中心y排序，供compute_max_overlaps按gt剪枝
+    :param anchors: [N,4]
+    :return: [(最大宽, 最大高, 最小面积, anchor下标, 中心x, 中心y)]，宽高面积按+1计算
+    """
+    widths = anchors[:, 2] - anchors[:, 0] + 1
+    heights = anchors[:, 3] - anchors[:, 1] + 1
+    centers_x = (anchors[:, 0] + anchors[:, 2]) / 2
+    centers_y = (anchors[:, 1] + anchors[:, 3]) / 2
+
+    keys = np.round(np.stack([widths, heights], axis=1), SHAPE_GROUP_DECIMALS)
+    _, group_ids = np.unique(keys, axis=0, return_inverse=True)
+    group_ids = group_ids.reshape(-1)
+
+    groups = []
+    for inds in np.split(np.argsort(group_ids, kind='stable'), np.cumsum(np.bincount(group_ids))[:-1]):
+        inds = inds[np.argsort(centers_y[inds], kind='stable')]
+        groups.append((widths[inds].max(), heights[inds].max(), (widths[inds] * heights[inds]).min(),
+                       inds, centers_x[inds], centers_y[inds]))
+
+    return groups
+
+
+def compute_pair_overlap(a, b, a_areas, b_areas):
+    """
+    逐对计算IoU，a[i]与b[i]，公式与compute_overlap相同
+    :return: [n,]
+    """
+    iw = np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0]) + 1
+    ih = np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1]) + 1
+
+    iw = np.maximum(iw, 0)
+    ih = np.maximum(ih, 0)
+
+    ua = a_areas + b_areas - iw * ih
+
+    ua = np.maximum(ua, np.finfo(float).eps)
+
+    intersection = iw * ih
+
+    return intersection / ua
+
+
+def compute_overlap(a, b, a_areas=None):
 
     area = (b[:, 2] - b[:, 0] + 1) * (b[:, 3] - b[:, 1] + 1)
 
@@ -167,7 +473,10 @@ def compute_overlap(a, b):
     iw = np.maximum(iw, 0)
     ih = np.maximum(ih, 0)
 
-    ua = np.expand_dims((a[:, 2] - a[:, 0] + 1) * (a[:, 3] - a[:, 1] + 1), axis=1) + area - iw * ih
+    if a_areas is None:
+        a_areas = (a[:, 2] - a[:, 0] + 1) * (a[:, 3] - a[:, 1] + 1)
+
+    ua = np.expand_dims(a_areas, axis=1) + area - iw * ih
 
     ua = np.maximum(ua, np.finfo(float).eps)
 
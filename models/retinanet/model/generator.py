@@ -3,38 +3,30 @@ import random
 import time
 
 from taurus_cv.models.retinanet.model.pascal_voc import PascalVocGenerator
+from taurus_cv.models.retinanet.model.sequence import GeneratorSequence
 from taurus_cv.models.retinanet.model.transform import random_transform_generator
 
+# 数据增强的随机变换参数
+TRANSFORM_ARGS = dict(min_rotation=-0.1,
+                      max_rotation=0.1,
+                      min_translation=(-0.1, -0.1),
+                      max_translation=(0.1, 0.1),
+                      min_shear=-0.1,
+                      max_shear=0.1,
+                      min_scaling=(0.9, 0.9),
+                      max_scaling=(1.1, 1.1),
+                      flip_x_chance=0.5,
+                      flip_y_chance=0.5)
 
-def get_generators(images_path, annotations_path, train_val_split, batch_size, classes, img_min_size, img_max_size, shuffle=True, debug=False, transform=True):
+
+def split_annotation_ids(annotations_path, train_val_split, shuffle=True):
     """
-    获取生成器
-    :param images_path:
+    按比例划分训练集和验证集
     :param annotations_path:
     :param train_val_split:
-    :param batch_size:
-    :param classes:
-    :param img_min_size:
-    :param img_max_size:
     :param shuffle:
-    :param debug:
-    :param transform:
-    :return:
+    :return: train_ids, val_ids(没有验证集时为None)
     """
-    if transform:
-        transform_generator = random_transform_generator(min_rotation=-0.1,
-                                                         max_rotation=0.1,
-                                                         min_translation=(-0.1, -0.1),
-                                                         max_translation=(0.1, 0.1),
-                                                         min_shear=-0.1,
-                                                         max_shear=0.1,
-                                                         min_scaling=(0.9, 0.9),
-                                                         max_scaling=(1.1, 1.1),
-                                                         flip_x_chance=0.5,
-                                                         flip_y_chance=0.5)
-    else:
-        transform_generator = None
-
     annotation_files = [os.path.splitext(f)[0] for f in os.listdir(annotations_path) if os.path.isfile(os.path.join(annotations_path, f))]
 
     if shuffle:
@@ -49,15 +41,54 @@ def get_generators(images_path, annotations_path, train_val_split, batch_size, c
 
     random.seed = int(round(time.time() * 1000))
 
+    return train_ids, val_ids
+
+
+def get_generators(images_path, annotations_path, train_val_split, batch_size, classes, img_min_size, img_max_size, shuffle=True, debug=False, transform=True, reduced_decode=False, uint8_inputs=False, tf_augmentation=False, compact_targets=False, target_cache_dir=None, ring_size=None, parse_workers=1):
+    """
+    获取生成器
+    :param images_path:
+    :param annotations_path:
+    :param train_val_split:
+    :param batch_size:
+    :param classes:
+    :param img_min_size:
+    :param img_max_size:
+    :param shuffle:
+    :param debug:
+    :param transform:
+    :param reduced_decode: 按目标尺寸降低分辨率解码jpeg
+    :param uint8_inputs: 输出uint8图像，归一化在模型中完成
+    :param tf_augmentation: 随机变换在TensorFlow中对整个batch完成
+    :param compact_targets: 分类目标使用紧凑编码[anchor_state,class_id]
+    :param target_cache_dir: anchor目标缓存目录，只在不做数据增强时使用
+    :param ring_size: 批数据缓冲环大小，按fit_generator的max_queue_size和workers计算，None时使用默认参数的大小
+    :param parse_workers: 构造生成器时解析xml的进程数，结果顺序与单进程一致
+    :return:
+    """
+    if transform:
+        transform_generator = random_transform_generator(**TRANSFORM_ARGS)
+    else:
+        transform_generator = None
+
+    train_ids, val_ids = split_annotation_ids(annotations_path, train_val_split, shuffle)
+
     train_generator = PascalVocGenerator(
         annotations_path,
         images_path,
         train_ids,
         classes,
+        workers=parse_workers,
         image_min_side=img_min_size,
         image_max_side=img_max_size,
+        reduced_decode=reduced_decode,
+        uint8_inputs=uint8_inputs,
+        tf_augmentation=tf_augmentation,
+        compact_targets=compact_targets,
+        target_cache_dir=target_cache_dir,
         transform_generator=transform_generator,
         batch_size=batch_size,
+        ring_size=ring_size,
         debug=debug
     )
 
@@ -67,11 +98,87 @@ def get_generators(images_path, annotations_path, train_val_split, batch_size, c
             images_path,
             val_ids,
             classes,
+            workers=parse_workers,
             image_min_side=img_min_size,
             image_max_side=img_max_size,
+            reduced_decode=reduced_decode,
+            uint8_inputs=uint8_inputs,
+            tf_augmentation=tf_augmentation,
+            compact_targets=compact_targets,
+            target_cache_dir=target_cache_dir,
             transform_generator=None,
-            batch_size=batch_size
+            batch_size=batch_size,
+            ring_size=ring_size
         )
         return train_generator, validation_generator, train_generator.size(), validation_generator.size()
     else:
         return train_generator, None, train_generator.size(), 0
+
+
+def get_sequences(images_path, annotations_path, train_val_split, batch_size, classes, img_min_size, img_max_size, shuffle=True, transform=True, seed=0, reduced_decode=False, uint8_inputs=False, tf_augmentation=False, compact_targets=False, target_cache_dir=None, parse_workers=1):
+    """
+    获取Sequence，用于fit_generator(workers>1, use_multiprocessing=True)多进程计算anchor目标
+    :param images_path:
+    :param annotations_path:
+    :param train_val_split:
+    :param batch_size:
+    :param classes:
+    :param img_min_size:
+    :param img_max_size:
+    :param shuffle:
+    :param transform:
+    :param seed: 每个epoch打乱顺序和随机变换的种子
+    :param reduced_decode: 按目标尺寸降低分辨率解码jpeg
+    :param uint8_inputs: 输出uint8图像，归一化在模型中完成
+    :param tf_augmentation: 多进程worker中不能安全地创建tf.Session，忽略此参数，使用NumPy增强
+    :param compact_targets: 分类目标使用紧凑编码[anchor_state,class_id]
+    :param target_cache_dir: anchor目标缓存目录，只在不做数据增强时使用
+    :param parse_workers: 构造生成器时解析xml的进程数
+    :return: 与get_generators一致
+    """
+    if tf_augmentation:
+        print('多进程Sequence不支持tf_augmentation，使用NumPy数据增强')
+        tf_augmentation = False
+
+    train_ids, val_ids = split_annotation_ids(annotations_path, train_val_split, shuffle)
+
+    # group的打乱由Sequence按epoch完成
+    train_generator = PascalVocGenerator(
+        annotations_path,
+        images_path,
+        train_ids,
+        classes,
+        workers=parse_workers,
+        image_min_side=img_min_size,
+        image_max_side=img_max_size,
+        reduced_decode=reduced_decode,
+        uint8_inputs=uint8_inputs,
+        tf_augmentation=tf_augmentation,
+        compact_targets=compact_targets,
+        target_cache_dir=target_cache_dir,
+        batch_size=batch_size,
+        shuffle_groups=False
+    )
+    train_sequence = GeneratorSequence(train_generator, transform_args=TRANSFORM_ARGS if transform else None, seed=seed)
+
+    if val_ids is not None:
+        validation_generator = PascalVocGenerator(
+            annotations_path,
+            images_path,
+            val_ids,
+            classes,
+            workers=parse_workers,
+            image_min_side=img_min_size,
+            image_max_side=img_max_size,
+            reduced_decode=reduced_decode,
+            uint8_inputs=uint8_inputs,
+            tf_augmentation=tf_augmentation,
+            compact_targets=compact_targets,
+            target_cache_dir=target_cache_dir,
+            batch_size=batch_size,
+            shuffle_groups=False
+        )
+        validation_sequence = GeneratorSequence(validation_generator, shuffle_groups=False, seed=seed)
+        return train_sequence, validation_sequence, train_generator.size(), validation_generator.size()
+    else:
+        return train_sequence, None, train_generator.size(), 0
@@ -7,6 +7,9 @@ import numpy as np
 
 from taurus_cv.models.retinanet.model.transform import change_transform_origin
 
+# caffe风格的BGR均值，preprocess_image和图中的NormalizeImage共用
+IMAGE_MEAN_BGR = (103.939, 116.779, 123.68)
+
 
 def read_image_rgb(path):
     image = np.asarray(PIL.Image.open(path).convert('RGB'))
@@ -18,22 +21,93 @@ def read_image_bgr(path):
     return image[:, :, ::-1].copy()
 
 
+def reduced_decode_factor(scale):
+    """
+    选择jpeg DCT缩放解码的最大因子(1/2,1/4,1/8)，保证解码后的图像仍不小于缩放目标
+    :param scale: 目标缩放比例
+    :return: 1,2,4,8
+    """
+    for factor in (8, 4, 2):
+        if 1. / factor >= scale:
+            return factor
+    return 1
+
+
+def resize_scale(rows, cols, min_side, max_side):
+    """
+    与resize_image相同的缩放比例计算
+    """
+    scale = min_side / min(rows, cols)
+
+    if max(rows, cols) * scale > max_side:
+        scale = max_side / max(rows, cols)
+
+    return scale
+
+
+def read_image_bgr_reduced(path, min_side, max_side):
+    """
+    按目标尺寸降低分辨率解码，PIL的draft直接让libjpeg按DCT缩放解码
+    :param path: 图像路径
+    :param min_side:
+    :param max_side:
+    :return: BGR图像，(x方向缩放, y方向缩放)，即解码图像相对原图的比例
+    """
+    image = PIL.Image.open(path)
+    width, height = image.size
+
+    factor = reduced_decode_factor(resize_scale(height, width, min_side, max_side))
+
+    # draft返回不小于请求尺寸的最小DCT缩放
+    if factor > 1:
+        image.draft('RGB', (width // factor, height // factor))
+
+    image = np.asarray(image.convert('RGB'))[:, :, ::-1].copy()
+
+    return image, (image.shape[1] / width, image.shape[0] / height)
+
+
+def read_resized_image_bgr(path, min_side, max_side):
+    """
+    降低分辨率解码后缩放，输出尺寸和缩放比例与read_image_bgr + resize_image完全一致
+    :param path: 图像路径
+    :param min_side:
+    :param max_side:
+    :return: 缩放后的BGR图像，相对原图的缩放比例
+    """
+    image = PIL.Image.open(path)
+    width, height = image.size
+
+    scale = resize_scale(height, width, min_side, max_side)
+    factor = reduced_decode_factor(scale)
+
+    if factor > 1:
+        image.draft('RGB', (width // factor, height // factor))
+
+    image = np.ascontiguousarray(np.asarray(image.convert('RGB'))[:, :, ::-1])
+
+    # cv2.resize(fx=scale)的输出尺寸为round(原尺寸*scale)，这里按原图尺寸计算，坐标还原时scale保持精确
+    dsize = (int(round(width * scale)), int(round(height * scale)))
+    image = cv2.resize(image, dsize, interpolation=cv2.INTER_AREA if image.shape[1] > dsize[0] else cv2.INTER_LINEAR)
+
+    return image, scale
+
+
 def preprocess_image(x):
 
     x = x.astype(keras.backend.floatx())
     if keras.backend.image_data_format() == 'channels_first':
         if x.ndim == 3:
-            x[0, :, :] -= 103.939
-            x[1, :, :] -= 116.779
-            x[2, :, :] -= 123.68
+            x[0, :, :] -= IMAGE_MEAN_BGR[0]
+            x[1, :, :] -= IMAGE_MEAN_BGR[1]
+            x[2, :, :] -= IMAGE_MEAN_BGR[2]
         else:
-            x[:, 0, :, :] -= 103.939
-            x[:, 1, :, :] -= 116.779
-            x[:, 2, :, :] -= 123.68
+            x[:, 0, :, :] -= IMAGE_MEAN_BGR[0]
+            x[:, 1, :, :] -= IMAGE_MEAN_BGR[1]
+            x[:, 2, :, :] -= IMAGE_MEAN_BGR[2]
     else:
-        x[..., 0] -= 103.939
-        x[..., 1] -= 116.779
-        x[..., 2] -= 123.68
+        # 一次广播减去三个通道的均值
+        x -= np.asarray(IMAGE_MEAN_BGR, dtype=x.dtype)
 
     return x
 
@@ -101,15 +175,22 @@ class TransformParameters:
             return cv2.INTER_LANCZOS4
 
 
-def apply_transform(matrix, image, params):
-
+def apply_transform(matrix, image, params, dsize=None):
+    """
+    仿射变换图像
+    :param matrix: 3x3仿射矩阵
+    :param image:
+    :param params: TransformParameters
+    :param dsize: 输出尺寸(width, height)，默认与输入相同；矩阵中合成了缩放时传入缩放后的尺寸
+    :return:
+    """
     if params.channel_axis != 2:
         image = np.moveaxis(image, params.channel_axis, 2)
 
     output = cv2.warpAffine(
         image,
         matrix[:2, :],
-        dsize=(image.shape[1], image.shape[0]),
+        dsize=dsize or (image.shape[1], image.shape[0]),
         flags=params.cvInterpolation(),
         borderMode=params.cvBorderMode(),
         borderValue=params.cval,
@@ -120,17 +201,35 @@ def apply_transform(matrix, image, params):
     return output
 
 
+def transform_resize_image(matrix, image, params, min_side, max_side):
+    """
+    随机仿射变换和缩放合成一个矩阵，只用一次warpAffine重采样到最终尺寸
+    输出尺寸与apply_transform + resize_image一致
+    :param matrix: 已经按图像调整过的3x3仿射矩阵
+    :param image:
+    :param params: TransformParameters
+    :param min_side:
+    :param max_side:
+    :return: 变换后的图像，合成后的矩阵(用于变换边框)，缩放比例
+    """
+    rows, cols = image.shape[:2] if params.channel_axis == 2 else image.shape[1:]
+
+    scale = resize_scale(rows, cols, min_side, max_side)
+
+    # 先变换再缩放
+    matrix = np.array([[scale, 0, 0], [0, scale, 0], [0, 0, 1]]).dot(matrix)
+
+    # cv2.resize(fx=scale)输出尺寸为round(原尺寸*scale)
+    dsize = (int(round(cols * scale)), int(round(rows * scale)))
+
+    return apply_transform(matrix, image, params, dsize), matrix, scale
+
+
 def resize_image(img, min_side, max_side):
     (rows, cols, _) = img.shape
 
-    smallest_side = min(rows, cols)
-
     # 计算表根据图像的大小
-    scale = min_side / smallest_side
-
-    largest_side = max(rows, cols)
-    if largest_side * scale > max_side:
-        scale = max_side / largest_side
+    scale = resize_scale(rows, cols, min_side, max_side)
 
     img = cv2.resize(img, None, fx=scale, fy=scale)
 
@@ -2,18 +2,23 @@ import os
 import random
 import threading
 import warnings
+from functools import partial
+from multiprocessing import Pool
 from xml.dom import minidom
 
 import cv2
 import keras
 import numpy as np
-from PIL import Image
 from matplotlib import pyplot as plt
 from six import raise_from
 
-from taurus_cv.models.retinanet.model.anchors import anchor_targets_bbox, bbox_transform
-from taurus_cv.models.retinanet.model.image import read_image_bgr, TransformParameters, apply_transform, adjust_transform_for_image, resize_image, preprocess_image
-from taurus_cv.models.retinanet.model.transform import transform_aabb
+from taurus_cv.datasets.image_size import ImageSizeIndex, IMAGE_SIZE_INDEX_FILENAME
+from taurus_cv.utils.buffer_ring import BatchBufferRing
+from taurus_cv.models.retinanet.model.anchors import anchor_targets_bbox, anchor_labels, bbox_transform, cached_anchors_for_shape, compute_anchor_states
+from taurus_cv.models.retinanet.model.image import IMAGE_MEAN_BGR, read_image_bgr, read_image_bgr_reduced, TransformParameters, apply_transform, adjust_transform_for_image, resize_image, transform_resize_image, preprocess_image
+from taurus_cv.models.retinanet.model.transform import transform_aabbs
+from taurus_cv.models.retinanet.model.tf_augmentation import TFAugmenter
+from taurus_cv.models.retinanet.model.target_cache import AnchorTargetCache
 
 try:
     import xml.etree.cElementTree as ET
@@ -63,6 +68,65 @@ def _find_node(parent, name, debug_name=None, parse=None):
     return result
 
 
+def parse_annotation(element, classes):
+    class_name = _find_node(element, 'name').text
+    if class_name not in classes:
+        raise ValueError('解析 \'{}\' 出现错误: {}'.format(class_name, list(classes.keys())))
+
+    box = np.zeros((1, 5))
+    box[0, 4] = classes[class_name]
+
+    bndbox = _find_node(element, 'bndbox')
+    box[0, 0] = _find_node(bndbox, 'xmin', 'bndbox.xmin', parse=float) - 1
+    box[0, 1] = _find_node(bndbox, 'ymin', 'bndbox.ymin', parse=float) - 1
+    box[0, 2] = _find_node(bndbox, 'xmax', 'bndbox.xmax', parse=float) - 1
+    box[0, 3] = _find_node(bndbox, 'ymax', 'bndbox.ymax', parse=float) - 1
+
+    return box
+
+
+def parse_annotations(xml_root, classes):
+    boxes = []
+    for i, element in enumerate(xml_root.iter('object')):
+        try:
+            boxes.append(parse_annotation(element, classes))
+        except ValueError as e:
+            raise_from(ValueError('可能出现问题 #{}: {}'.format(i, e)), None)
+
+    if not boxes:
+        return np.zeros((0, 5))
+
+    return np.concatenate(boxes, axis=0)
+
+
+def parse_size(xml_root):
+    size = xml_root.find('size')
+    if size is None:
+        return 0, 0
+
+    try:
+        return int(float(size.find('width').text)), int(float(size.find('height').text))
+    except (AttributeError, TypeError, ValueError):
+        return 0, 0
+
+
+def parse_annotation_file(path, classes):
+    """
+    解析单个标注文件，模块级函数，可以在进程池中使用
+    :param path: xml路径
+    :param classes: 类别名 -> label
+    :return: boxes [n,(x1,y1,x2,y2,label)], (width, height)，xml中没有size时宽高为0
+    """
+    filename = os.path.basename(path)
+    try:
+        tree = ET.parse(path)
+        return parse_annotations(tree.getroot(), classes), parse_size(tree.getroot())
+    except ET.ParseError as e:
+        raise_from(ValueError('文件问题: {}: {}'.format(filename, e)), None)
+    except ValueError as e:
+        raise_from(ValueError('文件问题: {}: {}'.format(filename, e)), None)
+
+
 class Generator(object):
     def __init__(
             self,
@@ -73,7 +137,13 @@ class Generator(object):
             group_method='ratio',  # 'none', 'random', 'ratio'
             shuffle_groups=True,
             transform_parameters=None,
-            debug=False
+            debug=False,
+            ring_size=None,
+            reduced_decode=False,
+            uint8_inputs=False,
+            tf_augmentation=False,
+            compact_targets=False,
+            target_cache_dir=None
     ):
         self.debug = debug
         if self.debug:
@@ -85,11 +155,32 @@ class Generator(object):
         self.shuffle_groups = shuffle_groups
         self.image_min_side = image_min_side
         self.image_max_side = image_max_side
-        self.transform_parameters = transform_parameters or TransformParameters()
+        # TensorFlow增强只能用常数填充超出原图的区域
+        self.transform_parameters = transform_parameters or TransformParameters(fill_mode='constant' if tf_augmentation else 'nearest')
+
+        # 按目标尺寸降低分辨率解码jpeg，标注按实际解码比例缩放
+        self.reduced_decode = reduced_decode
+
+        # 模型在图中做归一化时直接输出uint8图像
+        self.uint8_inputs = uint8_inputs
+
+        # 随机变换在TensorFlow中对整个batch完成，首次使用时创建
+        self.tf_augmentation = tf_augmentation
+        self.tf_augmenter = None
+
+        # 分类目标使用紧凑编码[anchor_state,class_id]，配合focal(compact_targets=True)
+        self.compact_targets = compact_targets
+
+        # 不做数据增强时anchor目标每个epoch都相同，从离线缓存读取
+        self.target_cache = AnchorTargetCache(target_cache_dir) if target_cache_dir else None
 
         self.group_index = 0
         self.lock = threading.Lock()
 
+        # 批数据缓冲环，不能小于required_ring_size(max_queue_size, workers)，否则队列中的batch会被覆盖
+        self.ring_size = ring_size
+        self.buffer_ring = BatchBufferRing(ring_size)
+
         self.group_images()
 
     def size(self):
@@ -152,27 +243,72 @@ class Generator(object):
 
         return image_group, annotations_group
 
+    def load_image_reduced(self, image_index):
+        """
+        降低分辨率解码，子类不支持时解码原图
+        :param image_index:
+        :return: 图像，(x方向比例, y方向比例)
+        """
+        return self.load_image(image_index), (1., 1.)
+
     def load_image_group(self, group):
         return [self.load_image(image_index) for image_index in group]
 
-    def random_transform_group_entry(self, image, annotations):
+    def load_image_group_reduced(self, group, annotations_group):
+        """
+        降低分辨率解码一组图像，并把标注缩放到解码后的坐标
+        :param group:
+        :param annotations_group:
+        :return: image_group
+        """
+        image_group = []
+        for image_index, annotations in zip(group, annotations_group):
+            image, (scale_x, scale_y) = self.load_image_reduced(image_index)
+
+            annotations[:, [0, 2]] *= scale_x
+            annotations[:, [1, 3]] *= scale_y
+
+            image_group.append(image)
+
+        return image_group
+
+    def random_transform_group_entry(self, image, annotations, transform=None):
 
-        if self.transform_generator:
+        if transform is None and self.transform_generator:
+            transform = next(self.transform_generator)
 
-            transform = adjust_transform_for_image(next(self.transform_generator), image, self.transform_parameters.relative_translation)
+        if transform is not None:
+
+            transform = adjust_transform_for_image(transform, image, self.transform_parameters.relative_translation)
 
             image = apply_transform(transform, image, self.transform_parameters)
 
             annotations = annotations.copy()
-            for index in range(annotations.shape[0]):
-                annotations[index, :4] = transform_aabb(transform, annotations[index, :4])
+            annotations[:, :4] = transform_aabbs(transform, annotations[:, :4])
+
+        return image, annotations
+
+    def transform_resize_group_entry(self, image, annotations, transform):
+        """
+        随机变换和缩放合成一个仿射矩阵，图像只重采样一次
+        :param image:
+        :param annotations:
+        :param transform: 随机变换矩阵
+        :return: 缩放到最终尺寸的图像和标注
+        """
+        transform = adjust_transform_for_image(transform, image, self.transform_parameters.relative_translation)
+
+        image, matrix, _ = transform_resize_image(transform, image, self.transform_parameters, self.image_min_side, self.image_max_side)
+
+        annotations = annotations.copy()
+        annotations[:, :4] = transform_aabbs(matrix, annotations[:, :4])
 
         return image, annotations
 
     def save_img_ann(self, image, annotations, where, index):
         name = str(self.group_index) + '_' + str(index) + '_' + where + '.jpg'
 
-        image_n = image.copy()
+        image_n = image.astype(np.float32)
 
         image_n -= np.min(image_n)
         image_n /= np.max(image_n)
@@ -188,29 +324,78 @@ class Generator(object):
         return resize_image(image, min_side=self.image_min_side, max_side=self.image_max_side)
 
     def preprocess_image(self, image):
+        if self.uint8_inputs:
+            return image
         return preprocess_image(image)
 
-    def preprocess_group_entry(self, image, annotations, index):
+    def preprocess_group_entry(self, image, annotations, index, transform=None):
 
         image = self.preprocess_image(image)
 
         if self.debug:
             self.save_img_ann(image, annotations, '0PRE', index)
 
-        image, annotations = self.random_transform_group_entry(image, annotations)
-
-        image, image_scale = self.resize_image(image)
+        if transform is None and self.transform_generator:
+            transform = next(self.transform_generator)
 
-        annotations[:, :4] *= image_scale
+        if transform is not None:
+            image, annotations = self.transform_resize_group_entry(image, annotations, transform)
+        else:
+            image, image_scale = self.resize_image(image)
+            annotations[:, :4] *= image_scale
 
         if self.debug:
             self.save_img_ann(image, annotations, '1POST', index)
 
         return image, annotations
 
-    def preprocess_group(self, image_group, annotations_group):
+    def resize_group(self, image_group, annotations_group):
+        """
+        只做预处理和缩放，随机变换交给tf_augment_group
+        """
         for index, (image, annotations) in enumerate(zip(image_group, annotations_group)):
-            image, annotations = self.preprocess_group_entry(image, annotations, index)
+            image, image_scale = self.resize_image(self.preprocess_image(image))
+            annotations[:, :4] *= image_scale
+
+            image_group[index] = image
+            annotations_group[index] = annotations
+
+        return image_group, annotations_group
+
+    def group_transforms(self, group, transforms=None):
+        """
+        获取一组图像的随机变换矩阵
+        :return: 矩阵列表，不做变换时为None
+        """
+        if transforms is None and self.transform_generator:
+            transforms = [next(self.transform_generator) for _ in group]
+        return transforms
+
+    def tf_augment_group(self, image_batch, image_group, annotations_group, transforms):
+        """
+        在TensorFlow中对缩放后的整个batch做随机变换，图像和标注原地修改
+        :param image_batch: compute_inputs的输出
+        :param image_group: 缩放后的图像，用于按实际尺寸调整变换中心和平移
+        :param annotations_group:
+        :param transforms: 随机变换矩阵列表
+        :return: image_batch, annotations_group
+        """
+        with self.lock:
+            if self.tf_augmenter is None:
+                # 填充值与compute_inputs的padding一致：float输入减均值后为0，uint8输入为均值
+                fill_value = np.round(IMAGE_MEAN_BGR) if self.uint8_inputs else None
+                self.tf_augmenter = TFAugmenter(self.transform_parameters, fill_value=fill_value)
+
+        matrices = [np.eye(3)] * image_batch.shape[0]
+        for index, (transform, image) in enumerate(zip(transforms, image_group)):
+            matrices[index] = adjust_transform_for_image(np.array(transform, dtype=np.float64), image, self.transform_parameters.relative_translation)
+
+        return self.tf_augmenter(image_batch, matrices, annotations_group)
+
+    def preprocess_group(self, image_group, annotations_group, transforms=None):
+        for index, (image, annotations) in enumerate(zip(image_group, annotations_group)):
+            transform = None if transforms is None else transforms[index]
+            image, annotations = self.preprocess_group_entry(image, annotations, index, transform)
 
             image_group[index] = image
             annotations_group[index] = annotations
@@ -227,11 +412,20 @@ class Generator(object):
 
         self.groups = [[order[x % len(order)] for x in range(i, i + self.batch_size)] for i in range(0, len(order), self.batch_size)]
 
-    def compute_inputs(self, image_group):
+    def compute_inputs(self, image_group, buffers=None):
 
         max_shape = tuple(max(image.shape[x] for image in image_group) for x in range(3))
 
-        image_batch = np.zeros((self.batch_size,) + max_shape, dtype=keras.backend.floatx())
+        dtype = np.uint8 if self.uint8_inputs else keras.backend.floatx()
+
+        if buffers is None:
+            image_batch = np.zeros((self.batch_size,) + max_shape, dtype=dtype)
+        else:
+            image_batch = buffers.get('images', (self.batch_size,) + max_shape, dtype, zero=not self.uint8_inputs)
+
+        # uint8时用均值填充，图中减均值后padding仍接近0，与float输入一致
+        if self.uint8_inputs:
+            image_batch[...] = np.round(IMAGE_MEAN_BGR).astype(np.uint8)
 
         for image_index, image in enumerate(image_group):
             image_batch[image_index, :image.shape[0], :image.shape[1], :image.shape[2]] = image
@@ -247,52 +441,134 @@ class Generator(object):
                        negative_overlap=0.4,
                        positive_overlap=0.5,
                        **kwargs):
-        return anchor_targets_bbox(image_shape, annotations, num_classes, mask_shape, negative_overlap, positive_overlap, **kwargs)
+        return anchor_targets_bbox(image_shape, annotations, num_classes, mask_shape, negative_overlap, positive_overlap, compact=self.compact_targets, **kwargs)
+
+    def cached_anchor_targets(self,
+                              image_index,
+                              image_shape,
+                              annotations,
+                              num_classes,
+                              mask_shape=None,
+                              negative_overlap=0.4,
+                              positive_overlap=0.5,
+                              **kwargs):
+        """
+        与anchor_targets相同，目标从离线缓存读取，未命中时计算并写入缓存
+        非正样本的回归目标为0，回归损失只使用正样本
+        :return: labels, regression [N,4]
+        """
+        anchor_set = cached_anchors_for_shape(image_shape, **kwargs)
+        anchors = anchor_set.anchors
+
+        image_id = self.name_from_index(image_index)
+        key = self.target_cache.config_key(anchor_set, image_shape, mask_shape, num_classes, negative_overlap, positive_overlap)
+
+        cached = self.target_cache.load(image_id, key, annotations, anchors.shape[0])
+
+        if cached is not None:
+            anchor_states, class_ids, positive_indices, positive_gt_indices = cached
+        else:
+            anchor_states, class_ids, argmax_overlaps_inds = compute_anchor_states(anchor_set, image_shape, annotations, mask_shape, negative_overlap, positive_overlap)
+            positive_indices, positive_gt_indices = self.target_cache.save(image_id, key, annotations, anchor_states, class_ids, argmax_overlaps_inds)
+
+        regression = np.zeros((anchors.shape[0], 4))
+        if positive_indices.shape[0]:
+            regression[positive_indices] = bbox_transform(anchors[positive_indices], annotations[positive_gt_indices])
+
+        return anchor_labels(anchor_states, class_ids, num_classes, self.compact_targets), regression
 
     # image_group (1,512,512,3) anno_group (1,2,5) 1张图，2个gtbox, 4个坐标+置信度
-    def compute_targets(self, image_group, annotations_group):
+    def compute_targets(self, image_group, annotations_group, buffers=None, group=None):
+        """
+        :param group: 图像下标，给出时从离线缓存读取anchor目标
+        """
 
         max_shape = tuple(max(image.shape[x] for image in image_group) for x in range(3))
 
-        labels_group = [None] * self.batch_size
-        regression_group = [None] * self.batch_size
-        for index, (image, annotations) in enumerate(zip(image_group, annotations_group)):
-
-            labels_group[index], annotations, anchors = self.anchor_targets(max_shape, annotations, self.num_classes(), mask_shape=image.shape)
-            regression_group[index] = bbox_transform(anchors, annotations)
-
-            anchor_states = np.max(labels_group[index], axis=1, keepdims=True)
-            regression_group[index] = np.append(regression_group[index], anchor_states, axis=1)
+        labels_batch = None
+        regression_batch = None
 
-        # (1, 196416, 5) regression_group (1, 196416, 8) labels_group
-        # print(regression_group[0].shape, labels_group[0][:5])
-        # exit()
-
-        labels_batch = np.zeros((self.batch_size,) + labels_group[0].shape, dtype=keras.backend.floatx())
-        regression_batch = np.zeros((self.batch_size,) + regression_group[0].shape, dtype=keras.backend.floatx())
+        for index, (image, annotations) in enumerate(zip(image_group, annotations_group)):
 
-        for index, (labels, regression) in enumerate(zip(labels_group, regression_group)):
+            if group is not None:
+                labels, regression = self.cached_anchor_targets(group[index], max_shape, annotations, self.num_classes(), mask_shape=image.shape)
+            else:
+                labels, annotations, anchors = self.anchor_targets(max_shape, annotations, self.num_classes(), mask_shape=image.shape)
+                regression = bbox_transform(anchors, annotations)
+
+            # 所有图片anchor数相同，第一张图时分配批数据
+            if labels_batch is None:
+                labels_shape = (self.batch_size,) + labels.shape
+                labels_dtype = labels.dtype if self.compact_targets else keras.backend.floatx()
+                regression_shape = (self.batch_size, labels.shape[0], 5)
+
+                if buffers is None:
+                    labels_batch = np.zeros(labels_shape, dtype=labels_dtype)
+                    regression_batch = np.zeros(regression_shape, dtype=keras.backend.floatx())
+                else:
+                    labels_batch = buffers.get('labels', labels_shape, labels_dtype, zero=True)
+                    regression_batch = buffers.get('regression', regression_shape, keras.backend.floatx(), zero=True)
+
+            # 直接写入批数据，最后一位是anchor状态
             labels_batch[index, ...] = labels
-            regression_batch[index, ...] = regression
+            regression_batch[index, :, :4] = regression
+            regression_batch[index, :, 4] = labels[:, 0] if self.compact_targets else np.max(labels, axis=1)
+
+        # (1, 196416, 5) regression_batch (1, 196416, 8) labels_batch
 
         # (1, 196416, 5) (1, 196416, 8)
         return [regression_batch, labels_batch]
 
-    def compute_input_output(self, group):
+    def compute_input_output(self, group, transforms=None, use_buffer_ring=True):
+
+        # 只有不做随机变换时目标才固定，可以使用缓存
+        use_target_cache = self.target_cache is not None and transforms is None and self.transform_generator is None
 
-        image_group = self.load_image_group(group)
         annotations_group = self.load_annotations_group(group)
 
+        if self.reduced_decode:
+            image_group = self.load_image_group_reduced(group, annotations_group)
+        else:
+            image_group = self.load_image_group(group)
+
         image_group, annotations_group = self.filter_annotations(image_group, annotations_group, group)
 
-        image_group, annotations_group = self.preprocess_group(image_group, annotations_group)
+        if self.tf_augmentation:
+            # 先缩放，随机变换在TensorFlow中对整个batch完成
+            transforms = self.group_transforms(group, transforms)
+            image_group, annotations_group = self.resize_group(image_group, annotations_group)
+        else:
+            image_group, annotations_group = self.preprocess_group(image_group, annotations_group, transforms)
+
+        # 输出是缓冲环上的视图
+        buffers = self.buffer_ring.next() if use_buffer_ring else None
+
+        inputs = self.compute_inputs(image_group, buffers)
 
-        inputs = self.compute_inputs(image_group)
+        if self.tf_augmentation and transforms is not None:
+            inputs, annotations_group = self.tf_augment_group(inputs, image_group, annotations_group, transforms)
 
-        targets = self.compute_targets(image_group, annotations_group)
+        targets = self.compute_targets(image_group, annotations_group, buffers, group=group if use_target_cache else None)
 
         return inputs, targets
 
+    def __getstate__(self):
+        # 锁和python生成器不能序列化，多进程Sequence中不使用transform_generator
+        state = self.__dict__.copy()
+        state['lock'] = None
+        state['transform_generator'] = None
+        state['buffer_ring'] = None
+        state['tf_augmenter'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+        # 子进程是在TensorFlow初始化之后fork出来的，不能再创建tf.Session，改用NumPy增强
+        self.tf_augmentation = False
+        self.buffer_ring = BatchBufferRing(self.ring_size)
+
     def __next__(self):
         return self.next()
 
@@ -314,6 +590,7 @@ class PascalVocGenerator(Generator):
             images_path,
             ids,
             classes,
+            workers=1,
             **kwargs
     ):
         self.annotations_path = annotations_path
@@ -328,6 +605,9 @@ class PascalVocGenerator(Generator):
         for key, value in self.classes.items():
             self.labels[value] = key
 
+        # 构造时一次性解析所有标注，存入一个紧凑数组，按offsets切分；workers为解析xml的进程数
+        self.load_all_annotations(workers=workers)
+
         super(PascalVocGenerator, self).__init__(**kwargs)
 
     def size(self):
@@ -346,47 +626,59 @@ class PascalVocGenerator(Generator):
         return self.image_names[index]
 
     def image_aspect_ratio(self, image_index):
-        path = os.path.join(self.images_path, self.image_names[image_index] + '.jpg')
-        image = Image.open(path)
-        return float(image.width) / float(image.height)
+        width, height = self.image_sizes[image_index]
+        return float(width) / float(height)
 
     def load_image(self, image_index):
         path = os.path.join(self.images_path, self.image_names[image_index] + '.jpg')
         return read_image_bgr(path)
 
-    def __parse_annotation(self, element):
-        class_name = _find_node(element, 'name').text
-        if class_name not in self.classes:
-            raise ValueError('解析 \'{}\' 出现错误: {}'.format(class_name, list(self.classes.keys())))
-
-        box = np.zeros((1, 5))
-        box[0, 4] = self.name_to_label(class_name)
-
-        bndbox = _find_node(element, 'bndbox')
-        box[0, 0] = _find_node(bndbox, 'xmin', 'bndbox.xmin', parse=float) - 1
-        box[0, 1] = _find_node(bndbox, 'ymin', 'bndbox.ymin', parse=float) - 1
-        box[0, 2] = _find_node(bndbox, 'xmax', 'bndbox.xmax', parse=float) - 1
-        box[0, 3] = _find_node(bndbox, 'ymax', 'bndbox.ymax', parse=float) - 1
-
-        return box
-
-    def __parse_annotations(self, xml_root):
-        boxes = np.zeros((0, 5))
-        for i, element in enumerate(xml_root.iter('object')):
-            try:
-                box = self.__parse_annotation(element)
-                boxes = np.append(boxes, box, axis=0)
-            except ValueError as e:
-                raise_from(ValueError('可能出现问题 #{}: {}'.format(i, e)), None)
-
-        return boxes
+    def load_image_reduced(self, image_index):
+        path = os.path.join(self.images_path, self.image_names[image_index] + '.jpg')
+        return read_image_bgr_reduced(path, self.image_min_side, self.image_max_side)
+
+    def load_all_annotations(self, workers=1):
+        """
+        解析全部标注，workers大于1时使用进程池分块解析，结果顺序与单进程一致
+        :param workers: 解析xml的进程数
+        """
+        paths = [os.path.join(self.annotations_path, name + '.xml') for name in self.image_names]
+        parse = partial(parse_annotation_file, classes=self.classes)
+
+        workers = max(1, int(workers or 1))
+        if workers == 1 or len(paths) < 2:
+            parsed = [parse(path) for path in paths]
+        else:
+            # imap按输入顺序返回结果，解析出错时在主进程中重新抛出
+            with Pool(processes=workers) as pool:
+                parsed = list(pool.imap(parse, paths, chunksize=max(1, len(paths) // (workers * 4))))
+
+        boxes_list = [boxes for boxes, _ in parsed]
+
+        # 图像宽高优先取xml中的size，没有时读取jpeg文件头，结果保存在数据集目录下供训练集和验证集共用
+        self.image_sizes = np.array([size for _, size in parsed], dtype=np.int32).reshape((-1, 2))
+        missing = np.where(np.min(self.image_sizes, axis=1) <= 0)[0]
+
+        if len(missing):
+            index_dir = os.path.dirname(os.path.normpath(self.images_path))
+            size_index = ImageSizeIndex(os.path.join(index_dir, IMAGE_SIZE_INDEX_FILENAME)).load()
+            for image_index in missing:
+                path = os.path.join(self.images_path, self.image_names[image_index] + '.jpg')
+                self.image_sizes[image_index] = size_index.get(path)
+            if size_index.dirty:
+                size_index.save()
+
+        # 第i张图片的标注为annotations[offsets[i]:offsets[i+1]]
+        self.annotation_offsets = np.zeros((len(boxes_list) + 1,), dtype=np.int64)
+        self.annotation_offsets[1:] = np.cumsum([len(boxes) for boxes in boxes_list])
+
+        if boxes_list:
+            self.annotations = np.concatenate(boxes_list, axis=0).astype(np.float32)
+        else:
+            self.annotations = np.zeros((0, 5), dtype=np.float32)
 
     def load_annotations(self, image_index):
-        filename = self.image_names[image_index] + '.xml'
-        try:
-            tree = ET.parse(os.path.join(self.annotations_path, filename))
-            return self.__parse_annotations(tree.getroot())
-        except ET.ParseError as e:
-            raise_from(ValueError('文件问题: {}: {}'.format(filename, e)), None)
-        except ValueError as e:
-            raise_from(ValueError('文件问题: {}: {}'.format(filename, e)), None)
+        start, end = self.annotation_offsets[image_index], self.annotation_offsets[image_index + 1]
+
+        # 返回拷贝，后续的过滤和缩放会原地修改
+        return self.annotations[start:end].astype(np.float64)
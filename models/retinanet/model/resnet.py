@@ -6,6 +6,8 @@ import keras_resnet.models
 sys.path.append('../../..')
 
 from taurus_cv.models.retinanet.model.retinanet import custom_objects, retinanet_bbox
+from taurus_cv.models.retinanet.model.image import IMAGE_MEAN_BGR
+from taurus_cv.layers.normalize import NormalizeImage
 from keras.utils import get_file
 # from keras.applications import imagenet_utils
 # from keras.applications.imagenet_utils import imagenet_utils
@@ -15,6 +17,7 @@ resnet_resource = 'https://github.com/fizyr/keras-models/releases/download/v0.0.
 
 custom_objects = custom_objects.copy()
 custom_objects.update(keras_resnet.custom_objects)
+custom_objects['NormalizeImage'] = NormalizeImage
 
 
 def download_imagenet(backbone):
@@ -37,10 +40,43 @@ def download_imagenet(backbone):
     )
 
 
-def resnet_retinanet(num_classes, backbone='resnet50', inputs=None, weights='imagenet', skip_mismatch=True, **kwargs):
+def call_backbone_layers(backbone, inputs):
+    """
+    在新的输入张量上按拓扑顺序逐层调用backbone的层，结果不嵌套子模型
+    层和权重与backbone共用，层名不变，load_weights(by_name=True)与float输入的模型一致
+    :param backbone: keras模型
+    :param inputs: 与backbone.inputs对应的张量列表
+    :return: 与backbone.outputs对应的张量列表
+    """
+    tensor_map = {id(x): y for x, y in zip(backbone.inputs, inputs)}
+
+    # depth越大越靠近输入
+    for depth in sorted(backbone._nodes_by_depth.keys(), reverse=True):
+        for node in backbone._nodes_by_depth[depth]:
+            layer = node.outbound_layer
+            if isinstance(layer, keras.layers.InputLayer):
+                continue
+
+            computed = [tensor_map[id(x)] for x in node.input_tensors]
+            outputs = layer(computed[0] if len(computed) == 1 else computed, **(node.arguments or {}))
+
+            if not isinstance(outputs, list):
+                outputs = [outputs]
+
+            for x, y in zip(node.output_tensors, outputs):
+                tensor_map[id(x)] = y
+
+    return [tensor_map[id(x)] for x in backbone.outputs]
+
+
+def resnet_retinanet(num_classes, backbone='resnet50', inputs=None, weights='imagenet', skip_mismatch=True, uint8_inputs=False, **kwargs):
     # choose default input
     if inputs is None:
-        inputs = keras.layers.Input(shape=(None, None, 3))
+        inputs = keras.layers.Input(shape=(None, None, 3), dtype='uint8' if uint8_inputs else keras.backend.floatx())
+
+    # uint8输入时backbone先建在float输入上，再在归一化后的张量上逐层调用，
+    # keras_resnet内部用传入的张量构造Model，直接传入NormalizeImage的输出会因找不到Input而报Graph disconnected
+    image = keras.layers.Input(shape=(None, None, 3)) if uint8_inputs else inputs
 
     # determine which weights to load
     # if weights == 'imagenet':
@@ -52,21 +88,28 @@ def resnet_retinanet(num_classes, backbone='resnet50', inputs=None, weights='ima
 
     # create the resnet backbone
     if backbone == 'resnet50':
-        resnet = keras_resnet.models.ResNet50(inputs, include_top=False, freeze_bn=True)
+        resnet = keras_resnet.models.ResNet50(image, include_top=False, freeze_bn=True)
         # from taurus_cv.models.resnet.resnet import resnet50_fpn
         # resnet = resnet50_fpn(inputs)
         # resnet.summary()
         # print(resnet.outputs)
         # exit()
     elif backbone == 'resnet101':
-        resnet = keras_resnet.models.ResNet101(inputs, include_top=False, freeze_bn=True)
+        resnet = keras_resnet.models.ResNet101(image, include_top=False, freeze_bn=True)
     elif backbone == 'resnet152':
-        resnet = keras_resnet.models.ResNet152(inputs, include_top=False, freeze_bn=True)
+        resnet = keras_resnet.models.ResNet152(image, include_top=False, freeze_bn=True)
     else:
         raise ValueError("backbone不存在".format(backbone))
 
+    backbone_outputs = resnet.outputs[0:]
+
+    # uint8输入时类型转换和减均值放在图中，主机端不再调用preprocess_image
+    if uint8_inputs:
+        image = NormalizeImage(IMAGE_MEAN_BGR, name='normalize_image')(inputs)
+        backbone_outputs = call_backbone_layers(resnet, [image])
+
     # 生成完整模型
-    model = retinanet_bbox(inputs=inputs, num_classes=num_classes, backbone_outputs=resnet.outputs[0:], **kwargs)
+    model = retinanet_bbox(inputs=inputs, num_classes=num_classes, backbone_outputs=backbone_outputs, **kwargs)
 
     # optionally load weights
     # if weights_path:
@@ -0,0 +1,50 @@
+import keras
+import numpy as np
+
+from taurus_cv.models.retinanet.model.transform import random_transform
+
+
+class GeneratorSequence(keras.utils.Sequence):
+    """
+    Generator的Sequence版本，按group下标取数据，可以在fit_generator(workers>1, use_multiprocessing=True)中使用
+    每个epoch的打乱顺序和每个group的随机变换都由(seed, epoch, index)决定，与取数据的进程和顺序无关
+    """
+
+    def __init__(self, generator, transform_args=None, shuffle_groups=True, seed=0):
+        """
+        :param generator: Generator，transform_generator应为None，随机变换由transform_args生成
+        :param transform_args: random_transform的参数，None表示不做数据增强
+        :param shuffle_groups: 每个epoch是否打乱group顺序
+        :param seed: 随机种子
+        """
+        self.generator = generator
+        self.transform_args = transform_args
+        self.shuffle_groups = shuffle_groups
+        self.seed = seed
+
+        self.epoch = 0
+        self.order = self.group_order(self.epoch)
+
+    def group_order(self, epoch):
+        if not self.shuffle_groups:
+            return np.arange(len(self.generator.groups))
+
+        return np.random.RandomState(self.seed + epoch).permutation(len(self.generator.groups))
+
+    def __len__(self):
+        return len(self.generator.groups)
+
+    def __getitem__(self, index):
+        group = self.generator.groups[self.order[index]]
+
+        transforms = None
+        if self.transform_args is not None:
+            prng = np.random.RandomState((self.seed + self.epoch * len(self) + index) % (2 ** 32))
+            transforms = [random_transform(prng=prng, **self.transform_args) for _ in group]
+
+        # 结果会被序列化或放入队列，不使用缓冲环，避免被后面的batch覆盖
+        return self.generator.compute_input_output(group, transforms=transforms, use_buffer_ring=False)
+
+    def on_epoch_end(self):
+        self.epoch += 1
+        self.order = self.group_order(self.epoch)
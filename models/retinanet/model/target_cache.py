@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+"""
+anchor目标的离线缓存，不做数据增强时每个epoch的目标都相同，只需计算一次
+每张图像一个npz文件，只保存positive和ignore的anchor，其余anchor都是negative
+文件中记录anchor配置的摘要和标注的摘要，AnchorParameters、输入尺寸或标注变化时自动重新计算
+"""
+
+import os
+import hashlib
+import numpy as np
+
+
+class AnchorTargetCache(object):
+    """
+    anchor目标缓存，以图像id为文件名，anchor配置摘要和标注摘要不一致时视为未命中
+    """
+
+    VERSION = 1
+
+    def __init__(self, cache_dir):
+        """
+        :param cache_dir: 缓存目录
+        """
+        self.cache_dir = cache_dir
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def path(self, image_id):
+        return os.path.join(self.cache_dir, '{}.npz'.format(image_id))
+
+    @staticmethod
+    def config_key(anchor_set, image_shape, mask_shape, num_classes, negative_overlap, positive_overlap):
+        """
+        anchor配置摘要，anchors由AnchorParameters和batch输入尺寸决定，mask_shape是图像缩放后的实际尺寸
+        :return: str
+        """
+        mask_shape = image_shape if mask_shape is None else mask_shape
+        key = '{}|{}|{}|{}|{}|{}'.format(AnchorTargetCache.VERSION,
+                                         anchor_set.digest,
+                                         tuple(int(x) for x in mask_shape[:2]),
+                                         int(num_classes),
+                                         float(negative_overlap),
+                                         float(positive_overlap))
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def annotations_key(annotations):
+        """
+        标注摘要，使用缩放后的标注，所以图像尺寸配置变化也会反映在这里
+        """
+        return hashlib.sha1(np.ascontiguousarray(annotations, dtype=np.float64).tobytes()).hexdigest()
+
+    def load(self, image_id, key, annotations, num_anchors):
+        """
+        读取并展开缓存的目标
+        :param image_id: 图像id
+        :param key: config_key
+        :param annotations: 当前的标注，用于校验
+        :param num_anchors: anchor个数
+        :return: anchor_states int8 [N], class_ids int16 [N], positive_indices, 正样本对应的标注下标；未命中时返回None
+        """
+        path = self.path(image_id)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with np.load(path, allow_pickle=False) as data:
+
+                if str(data['key']) != key or str(data['annotations_key']) != self.annotations_key(annotations):
+                    return None
+
+                positive_indices = data['positive_indices']
+                positive_class_ids = data['positive_class_ids']
+                positive_gt_indices = data['positive_gt_indices']
+                ignore_indices = data['ignore_indices']
+
+        except Exception as e:
+            print('anchor目标缓存损坏，将重新计算: {} {}'.format(path, e))
+            return None
+
+        anchor_states = np.zeros((num_anchors,), dtype=np.int8)
+        anchor_states[ignore_indices] = -1
+        anchor_states[positive_indices] = 1
+
+        class_ids = np.zeros((num_anchors,), dtype=np.int16)
+        class_ids[positive_indices] = positive_class_ids
+
+        return anchor_states, class_ids, positive_indices, positive_gt_indices
+
+    def save(self, image_id, key, annotations, anchor_states, class_ids, argmax_overlaps_inds):
+        """
+        以稀疏形式保存目标，先写临时文件再替换，多个worker同时写同一张图时不会读到不完整的文件
+        :param image_id:
+        :param key: config_key
+        :param annotations:
+        :param anchor_states: compute_anchor_states的输出
+        :param class_ids:
+        :param argmax_overlaps_inds: 每个anchor最匹配的标注下标，没有标注时为None
+        :return: positive_indices, 正样本对应的标注下标
+        """
+        positive_indices = np.where(anchor_states == 1)[0].astype(np.int32)
+        ignore_indices = np.where(anchor_states == -1)[0].astype(np.int32)
+
+        if argmax_overlaps_inds is None:
+            positive_gt_indices = np.zeros((0,), dtype=np.int32)
+        else:
+            positive_gt_indices = argmax_overlaps_inds[positive_indices].astype(np.int32)
+
+        path = self.path(image_id)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f,
+                                key=np.array(key),
+                                annotations_key=np.array(self.annotations_key(annotations)),
+                                positive_indices=positive_indices,
+                                positive_class_ids=class_ids[positive_indices],
+                                positive_gt_indices=positive_gt_indices,
+                                ignore_indices=ignore_indices)
+
+        os.replace(tmp_path, path)
+
+        return positive_indices, positive_gt_indices
+
+
+def precompute_targets(generator, verbose=True):
+    """
+    预先计算生成器所有group的anchor目标并写入缓存，已经缓存且有效的图像只做校验
+    :param generator: Generator，需要设置target_cache_dir且不做数据增强
+    :param verbose: 打印进度
+    :return: group数
+    """
+    if generator.target_cache is None:
+        return 0
+
+    num_groups = len(generator.groups)
+
+    for index, group in enumerate(generator.groups):
+        generator.compute_input_output(group, use_buffer_ring=False)
+
+        if verbose and ((index + 1) % 100 == 0 or index + 1 == num_groups):
+            print('anchor目标预计算 {}/{}'.format(index + 1, num_groups))
+
+    return num_groups
@@ -0,0 +1,149 @@
+"""
+TensorFlow实现的数据增强，与transform.py/image.py中的NumPy实现对应
+图像仿射变换用tf.contrib.image.transform，边框变换用一次batch矩阵乘法，整个batch在session的intra-op线程池中并行执行
+"""
+
+import numpy as np
+import tensorflow as tf
+
+from taurus_cv.models.retinanet.model.image import TransformParameters
+
+
+def tf_apply_transform(images, transforms, interpolation='BILINEAR', fill_value=0):
+    """
+    仿射变换一个batch的图像，与image.apply_transform在fill_mode='constant', cval=fill_value时一致
+    cv2.warpAffine的矩阵是输入到输出的映射，tf.contrib.image.transform需要输出到输入的映射，所以传入逆矩阵
+    :param images: [B,H,W,C]
+    :param transforms: [B,3,3]
+    :param interpolation: NEAREST或BILINEAR
+    :param fill_value: 超出原图区域的填充值，标量或每个通道一个值
+    :return: [B,H,W,C]
+    """
+    inverse = tf.matrix_inverse(tf.cast(transforms, tf.float32))
+
+    # 仿射矩阵最后一行为[0,0,1]，取前8个元素
+    inverse = tf.reshape(inverse, (-1, 9))[:, :8]
+
+    outputs = tf.contrib.image.transform(images, inverse, interpolation=interpolation)
+
+    fill_value = np.asarray(fill_value, dtype=np.float32)
+    if not np.any(fill_value):
+        return outputs
+
+    # tf.contrib.image.transform只能填0，同样变换一个全1的掩码，掩码之外的部分补上填充值
+    mask = tf.contrib.image.transform(tf.ones_like(images[..., :1], dtype=tf.float32), inverse, interpolation=interpolation)
+    outputs = tf.cast(outputs, tf.float32) + (1. - mask) * tf.constant(fill_value)
+
+    if images.dtype.is_integer:
+        outputs = tf.round(tf.clip_by_value(outputs, images.dtype.min, images.dtype.max))
+
+    return tf.cast(outputs, images.dtype)
+
+
+def tf_transform_aabbs(transforms, boxes):
+    """
+    与transform.transform_aabbs一致，一个batch的4N个角点只做一次batch矩阵乘法
+    :param transforms: [B,3,3]
+    :param boxes: [B,N,(x1,y1,x2,y2)]
+    :return: [B,N,(x1,y1,x2,y2)]
+    """
+    boxes = tf.cast(boxes, tf.float32)
+    x1, y1, x2, y2 = tf.unstack(boxes, axis=2)
+
+    # [B,N,4] 四个角点
+    xs = tf.stack([x1, x2, x1, x2], axis=2)
+    ys = tf.stack([y1, y2, y2, y1], axis=2)
+
+    batch_size = tf.shape(boxes)[0]
+    num_boxes = tf.shape(boxes)[1]
+
+    # [B,N*4,3] x [B,3,2] = [B,N*4,2]
+    points = tf.stack([tf.reshape(xs, (batch_size, -1)), tf.reshape(ys, (batch_size, -1)), tf.ones((batch_size, num_boxes * 4))], axis=2)
+    points = tf.matmul(points, tf.transpose(tf.cast(transforms, tf.float32)[:, :2, :], (0, 2, 1)))
+    points = tf.reshape(points, (batch_size, num_boxes, 4, 2))
+
+    return tf.concat([tf.reduce_min(points, axis=2), tf.reduce_max(points, axis=2)], axis=2)
+
+
+class TFAugmenter(object):
+    """
+    在独立的graph和session中对整个batch做仿射增强
+    变换矩阵由生成器给出(保持现有的随机种子和Sequence的可复现性)，图像重采样和边框变换都在图中完成
+    """
+
+    def __init__(self, transform_parameters=None, fill_value=None, threads=0):
+        """
+        :param transform_parameters: TransformParameters，只支持fill_mode='constant'
+        :param fill_value: 超出原图区域的填充值，None时使用transform_parameters.cval；
+                           uint8输入时应与batch的padding一致，即IMAGE_MEAN_BGR
+        :param threads: intra-op线程数，0表示使用全部核
+        """
+        transform_parameters = transform_parameters or TransformParameters(fill_mode='constant')
+        if transform_parameters.fill_mode != 'constant':
+            raise ValueError('TensorFlow数据增强只支持fill_mode=\'constant\'，当前为\'{}\''.format(transform_parameters.fill_mode))
+
+        self.interpolation = 'NEAREST' if transform_parameters.interpolation == 'nearest' else 'BILINEAR'
+        self.fill_value = transform_parameters.cval if fill_value is None else fill_value
+
+        self.graph = tf.Graph()
+        self.session = tf.Session(graph=self.graph,
+                                  config=tf.ConfigProto(intra_op_parallelism_threads=threads,
+                                                        inter_op_parallelism_threads=threads))
+
+        # dtype -> (images, transforms, boxes, output_images, output_boxes)
+        self.ops = {}
+
+    def build(self, dtype):
+        dtype = np.dtype(dtype)
+
+        if dtype not in self.ops:
+            with self.graph.as_default():
+                images = tf.placeholder(tf.as_dtype(dtype), (None, None, None, None))
+                transforms = tf.placeholder(tf.float32, (None, 3, 3))
+                boxes = tf.placeholder(tf.float32, (None, None, 4))
+
+                self.ops[dtype] = (images,
+                                   transforms,
+                                   boxes,
+                                   tf_apply_transform(images, transforms, self.interpolation, self.fill_value),
+                                   tf_transform_aabbs(transforms, boxes))
+
+        return self.ops[dtype]
+
+    def run(self, images, transforms, boxes):
+        """
+        :param images: [B,H,W,C]
+        :param transforms: [B,3,3] 已经按图像调整过的变换矩阵
+        :param boxes: [B,N,4]
+        :return: 变换后的图像和边框
+        """
+        images_ph, transforms_ph, boxes_ph, output_images, output_boxes = self.build(images.dtype)
+
+        return self.session.run([output_images, output_boxes], feed_dict={images_ph: images,
+                                                                          transforms_ph: np.asarray(transforms, dtype=np.float32),
+                                                                          boxes_ph: boxes})
+
+    def __call__(self, image_batch, transforms, annotations_group):
+        """
+        原地增强生成器的批数据
+        :param image_batch: [B,H,W,C] compute_inputs的输出，原地写回
+        :param transforms: B个3x3矩阵
+        :param annotations_group: B个[n,5]标注，原地修改前4列
+        :return: image_batch, annotations_group
+        """
+        num_boxes = max([annotations.shape[0] for annotations in annotations_group] + [1])
+
+        boxes = np.zeros((image_batch.shape[0], num_boxes, 4), dtype=np.float32)
+        for index, annotations in enumerate(annotations_group):
+            boxes[index, :annotations.shape[0]] = annotations[:, :4]
+
+        output_images, output_boxes = self.run(image_batch, transforms, boxes)
+
+        image_batch[...] = output_images
+        for index, annotations in enumerate(annotations_group):
+            annotations[:, :4] = output_boxes[index, :annotations.shape[0]]
+
+        return image_batch, annotations_group
+
+    def close(self):
+        self.session.close()
@@ -24,6 +24,26 @@ def transform_aabb(transform, aabb):
     return [min_corner[0], min_corner[1], max_corner[0], max_corner[1]]
 
 
+def transform_aabbs(transform, aabbs):
+    """
+    批量变换边框，N个边框的4N个角点只做一次矩阵乘法
+    :param transform: 3x3仿射矩阵
+    :param aabbs: [N,(x1,y1,x2,y2)]
+    :return: [N,(x1,y1,x2,y2)]，变换后角点的外接框
+    """
+    aabbs = np.asarray(aabbs, dtype=np.float64).reshape((-1, 4))
+
+    # [N,4] 四个角点的x和y
+    xs = aabbs[:, [0, 2, 0, 2]]
+    ys = aabbs[:, [1, 3, 3, 1]]
+
+    # [N*4,2] = [N*4,3] x [3,2]
+    points = np.stack([xs.ravel(), ys.ravel(), np.ones(xs.size)], axis=1).dot(transform[:2].T)
+    points = points.reshape((-1, 4, 2))
+
+    return np.concatenate([points.min(axis=1), points.max(axis=1)], axis=1)
+
+
 def _random_vector(min, max, prng=DEFAULT_PRNG):
     min = np.array(min)
     max = np.array(max)
@@ -6,6 +6,7 @@ import numpy as np
 from taurus_cv.models.retinanet.config import Config
 from taurus_cv.models.retinanet.model.image import preprocess_image, resize_image
 from taurus_cv.models.retinanet.model.resnet import resnet_retinanet
+from taurus_cv.utils.frozen_graph import FrozenGraph
 
 config = Config('configRetinaNet.json')
 
@@ -101,23 +102,32 @@ if os.path.isfile(config.pretrained_weights_path):
     wpath = config.pretrained_weights_path
     classes = config.classes
 
-if config.type.startswith('resnet'):
-    model, _ = resnet_retinanet(len(classes), backbone=config.type, weights='imagenet', nms=True)
+# 配置为使用冻结的推理图(export.py导出)时直接载入，输入类型与导出时的uint8_inputs一致；推理图比权重旧时仍使用权重
+uint8_inputs = False
+if config.use_frozen_graph and os.path.isfile(config.frozen_graph_path) \
+        and (not os.path.isfile(wpath) or os.path.getmtime(config.frozen_graph_path) >= os.path.getmtime(wpath)):
+    model = FrozenGraph(config.frozen_graph_path)
+    uint8_inputs = config.uint8_inputs
+    print("冻结推理图", config.frozen_graph_path)
 else:
-    model = None
-    print("Tipo modello non riconosciuto ({})".format(config.type))
-    exit(1)
+    if config.type.startswith('resnet'):
+        model, _ = resnet_retinanet(len(classes), backbone=config.type, weights='imagenet', nms=True)
+    else:
+        model = None
+        print("Tipo modello non riconosciuto ({})".format(config.type))
+        exit(1)
 
-print("backend: ", config.type)
-model.load_weights(wpath, by_name=True, skip_mismatch=True)
-print(wname)
+    print("backend: ", config.type)
+    model.load_weights(wpath, by_name=True, skip_mismatch=True)
+    print(wname)
 
 cam = cv2.VideoCapture(0)
 while True:
     _, img = cam.read()
     orig_image = img.copy()
 
-    img = preprocess_image(img.copy())
+    if not uint8_inputs:
+        img = preprocess_image(img.copy())
     img, scale = resize_image(img, min_side=config.img_min_size, max_side=config.img_max_size)
 
     _, _, detections = model.predict_on_batch(np.expand_dims(img, axis=0))
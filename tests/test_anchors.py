@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+"""
+剪枝后的compute_max_overlaps与完整的compute_overlap + argmax得到相同的anchor状态和gt下标
+"""
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from taurus_cv.models.retinanet.model.anchors import AnchorSet, anchors_for_shape, compute_max_overlaps, compute_overlap
+
+
+def random_boxes(prng, image_shape, num_boxes):
+    height, width = image_shape[:2]
+
+    sizes = np.exp(prng.uniform(np.log(2), np.log(max(height, width)), size=num_boxes))
+    ratios = np.exp(prng.uniform(-1.5, 1.5, size=num_boxes))
+    x1 = prng.uniform(-20, width, size=num_boxes)
+    y1 = prng.uniform(-20, height, size=num_boxes)
+
+    return np.stack([x1, y1, x1 + sizes * ratios, y1 + sizes / ratios], axis=1)
+
+
+@pytest.fixture(scope='module')
+def prng():
+    return np.random.RandomState(0)
+
+
+@pytest.fixture(scope='module')
+def anchor_set():
+    return AnchorSet(anchors_for_shape((320, 480, 3)))
+
+
+@pytest.mark.parametrize('num_boxes', [1, 7, 60])
+@pytest.mark.parametrize('negative_overlap, positive_overlap', [(0.4, 0.5), (0.3, 0.7)])
+def test_matches_full_overlap(prng, anchor_set, num_boxes, negative_overlap, positive_overlap):
+    anchors = anchor_set.anchors
+    boxes = random_boxes(prng, (320, 480), num_boxes)
+
+    # 把部分gt放到anchor上，构造IoU恰好为1和落在阈值附近的情况
+    picks = prng.randint(0, anchors.shape[0], size=max(1, num_boxes // 3))
+    boxes = np.concatenate([boxes, anchors[picks], anchors[picks] + [0, 0, 3, 3]])
+
+    overlaps = compute_overlap(anchors, boxes)
+    expected_argmax = np.argmax(overlaps, axis=1)
+    expected_max = overlaps[np.arange(anchors.shape[0]), expected_argmax]
+
+    argmax, max_overlaps = compute_max_overlaps(anchors, boxes, negative_overlap,
+                                                anchor_areas=anchor_set.areas, shape_groups=anchor_set.shape_groups)
+
+    for threshold in (negative_overlap, positive_overlap):
+        np.testing.assert_array_equal(max_overlaps >= threshold, expected_max >= threshold)
+
+    kept = expected_max >= negative_overlap
+    np.testing.assert_array_equal(argmax[kept], expected_argmax[kept])
+    np.testing.assert_array_equal(max_overlaps[kept], expected_max[kept])
+
+
+def test_without_threshold_is_full_overlap(prng, anchor_set):
+    anchors = anchor_set.anchors
+    boxes = random_boxes(prng, (320, 480), 10)
+
+    overlaps = compute_overlap(anchors, boxes)
+
+    argmax, max_overlaps = compute_max_overlaps(anchors, boxes, 0., chunk_size=1000)
+
+    np.testing.assert_array_equal(argmax, np.argmax(overlaps, axis=1))
+    np.testing.assert_array_equal(max_overlaps, overlaps.max(axis=1))
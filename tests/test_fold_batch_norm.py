@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+"""
+折叠后的卷积与卷积+BN的前向计算一致
+"""
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('keras')
+
+from taurus_cv.utils.fold_batch_norm import fold_conv_bn_weights
+
+
+def conv2d(x, kernel, bias):
+    """
+    valid卷积，stride为1
+    :param x: [h,w,in]
+    :param kernel: [kh,kw,in,out]
+    :return: [h-kh+1,w-kw+1,out]
+    """
+    kh, kw = kernel.shape[:2]
+    out_h, out_w = x.shape[0] - kh + 1, x.shape[1] - kw + 1
+
+    y = np.zeros((out_h, out_w, kernel.shape[-1]), dtype=np.float64)
+    for i in range(kh):
+        for j in range(kw):
+            y += np.tensordot(x[i:i + out_h, j:j + out_w], kernel[i, j], axes=([2], [0]))
+
+    return y + bias
+
+
+def batch_norm(x, gamma, beta, mean, variance, epsilon):
+    return (x - mean) / np.sqrt(variance + epsilon) * gamma + beta
+
+
+@pytest.mark.parametrize('kernel_size', [1, 3])
+@pytest.mark.parametrize('use_bias', [True, False])
+def test_fold_matches_conv_bn(kernel_size, use_bias):
+    prng = np.random.RandomState(kernel_size)
+    in_channels, out_channels, epsilon = 4, 6, 1e-3
+
+    x = prng.normal(size=(9, 11, in_channels)).astype(np.float32)
+    kernel = prng.normal(size=(kernel_size, kernel_size, in_channels, out_channels)).astype(np.float32)
+    bias = prng.normal(size=(out_channels,)).astype(np.float32) if use_bias else np.zeros((out_channels,), dtype=np.float32)
+
+    gamma = prng.uniform(0.5, 2, size=(out_channels,)).astype(np.float32)
+    beta = prng.normal(size=(out_channels,)).astype(np.float32)
+    mean = prng.normal(size=(out_channels,)).astype(np.float32)
+    # 包含很小的方差，检查epsilon的位置
+    variance = np.concatenate([[1e-6], prng.uniform(0.1, 3, size=(out_channels - 1,))]).astype(np.float32)
+
+    expected = batch_norm(conv2d(x, kernel, bias), gamma, beta, mean, variance, epsilon)
+
+    folded_kernel, folded_bias = fold_conv_bn_weights(kernel, bias, gamma, beta, mean, variance, epsilon)
+
+    assert folded_kernel.shape == kernel.shape and folded_bias.shape == bias.shape
+    np.testing.assert_allclose(conv2d(x, folded_kernel, folded_bias), expected, rtol=1e-4, atol=1e-4)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+"""
+opencv与skimage两种缩放后端的输出一致性
+"""
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+pytest.importorskip('skimage')
+
+from taurus_cv.models.faster_rcnn.preprocessing.image import load_image, load_image_reduced, resize_image
+
+
+def smooth_image(image_shape):
+    """
+    平滑的测试图像，两种插值方式在平滑区域上的差别很小，像素容差才有意义
+    """
+    height, width = image_shape[:2]
+    y, x = np.mgrid[0:height, 0:width].astype(np.float64)
+
+    channels = [127.5 + 127.5 * np.sin(2 * np.pi * (x / width * (c + 1) + y / height * (2 - c)) / 2) for c in range(image_shape[2])]
+
+    return np.round(np.stack(channels, axis=-1)).astype(np.uint8)
+
+
+@pytest.mark.parametrize('image_shape, max_dim', [((375, 500, 3), 608),
+                                                  ((1024, 1024, 3), 608),
+                                                  ((2048, 4096, 3), 608),
+                                                  ((500, 333, 3), 512)])
+def test_backends_match(image_shape, max_dim):
+    image = smooth_image(image_shape)
+
+    cv_image, cv_window, cv_scale, cv_padding = resize_image(image, max_dim, backend='opencv')
+    sk_image, sk_window, sk_scale, sk_padding = resize_image(image, max_dim, backend='skimage')
+
+    assert cv_image.shape == sk_image.shape == (max_dim, max_dim, image_shape[2])
+    assert cv_image.dtype == sk_image.dtype == image.dtype
+    assert tuple(cv_window) == tuple(sk_window)
+    assert cv_scale == sk_scale
+    assert [tuple(pad) for pad in cv_padding] == [tuple(pad) for pad in sk_padding]
+
+    # padding区域两种后端都为0
+    y1, x1, y2, x2 = cv_window
+    mask = np.zeros((max_dim, max_dim), dtype=bool)
+    mask[y1:y2, x1:x2] = True
+    assert not cv_image[~mask].any() and not sk_image[~mask].any()
+
+    # 插值方式不同(缩小时opencv用area，skimage用高斯抗锯齿+双线性)，窗口内只要求像素接近
+    diff = np.abs(cv_image[mask].astype(np.float32) - sk_image[mask].astype(np.float32))
+    assert diff.mean() < 1.
+    assert np.percentile(diff, 99) <= 2.
+
+
+def write_rotated_jpeg(path, image_shape):
+    """
+    写入EXIF方向为6(需顺时针旋转90度)的jpeg，像素按未旋转的方向保存
+    """
+    Image = pytest.importorskip('PIL.Image')
+
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    Image.fromarray(smooth_image(image_shape)).save(path, quality=95, exif=exif)
+
+
+def test_reduced_decode_ignores_exif_orientation(tmpdir):
+    path = str(tmpdir.join('rotated.jpg'))
+    write_rotated_jpeg(path, (800, 1600, 3))
+
+    for backend in ['opencv', 'skimage']:
+        image, original_shape = load_image_reduced(path, 200, backend=backend)
+
+        # 解码结果与文件头的宽高方向一致，缩放比例和窗口才正确
+        assert original_shape == (800, 1600, 3)
+        assert image.shape[1] > image.shape[0]
+        assert image.shape[1] * 800 == image.shape[0] * 1600
+
+
+def test_load_image_ignores_exif_orientation(tmpdir):
+    path = str(tmpdir.join('rotated.jpg'))
+    write_rotated_jpeg(path, (120, 200, 3))
+
+    cv_image = load_image(path, backend='opencv')
+    sk_image = load_image(path, backend='skimage')
+
+    # 两种后端都保持文件中的像素方向，与VOC标注的坐标一致
+    assert cv_image.shape == sk_image.shape == (120, 200, 3)
+    assert np.mean(np.abs(cv_image.astype(np.float32) - sk_image.astype(np.float32))) < 2.
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+"""
+uint8输入的RetinaNet可以构建，层名与float输入一致，输出与主机端preprocess_image的结果一致
+"""
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('tensorflow')
+keras = pytest.importorskip('keras')
+pytest.importorskip('keras_resnet')
+
+from taurus_cv.models.retinanet.model.image import preprocess_image
+from taurus_cv.models.retinanet.model.resnet import resnet_retinanet
+
+NUM_CLASSES = 3
+
+
+@pytest.fixture(scope='module')
+def models():
+    keras.backend.clear_session()
+    keras.backend.set_learning_phase(0)
+
+    uint8_model, _ = resnet_retinanet(NUM_CLASSES, weights=None, nms=True, uint8_inputs=True)
+    float_model, _ = resnet_retinanet(NUM_CLASSES, weights=None, nms=True)
+
+    return uint8_model, float_model
+
+
+def weight_layer_names(model):
+    return sorted(layer.name for layer in model.layers if layer.weights)
+
+
+def test_build_uint8_model(models):
+    uint8_model, float_model = models
+
+    assert uint8_model.inputs[0].dtype.base_dtype.name == 'uint8'
+    assert uint8_model.get_layer('normalize_image') is not None
+
+    # backbone的层直接出现在模型中，不是嵌套的子模型，按层名载入权重与float输入的模型一致
+    assert not any(isinstance(layer, keras.models.Model) for layer in uint8_model.layers)
+    assert weight_layer_names(uint8_model) == weight_layer_names(float_model)
+
+
+def test_uint8_matches_preprocessed_float(models):
+    uint8_model, float_model = models
+
+    for layer in float_model.layers:
+        if layer.weights:
+            layer.set_weights(uint8_model.get_layer(layer.name).get_weights())
+
+    image = np.random.RandomState(0).randint(0, 256, size=(1, 96, 128, 3)).astype(np.uint8)
+
+    uint8_outputs = uint8_model.predict_on_batch(image)
+    float_outputs = float_model.predict_on_batch(preprocess_image(image))
+
+    # 只比较nms之前的回归和分类
+    for a, b in zip(uint8_outputs[:2], float_outputs[:2]):
+        np.testing.assert_allclose(a, b, rtol=1e-4, atol=1e-4)
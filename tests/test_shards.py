@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+"""
+分片打包后按同一个图像列表打开，并生成一个batch
+"""
+
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+cv2 = pytest.importorskip('cv2')
+pytest.importorskip('skimage')
+
+from taurus_cv.datasets.annotation_store import DetectionAnnotationStore, ImageListView
+from taurus_cv.models.faster_rcnn.preprocessing.shards import ShardedImageDataset, pack_shards, shard_image_generator
+
+MAX_DIM = 64
+
+
+@pytest.fixture
+def image_list(tmpdir):
+    prng = np.random.RandomState(0)
+    records = []
+
+    for i, (height, width) in enumerate([(48, 80), (100, 60), (32, 32)]):
+        filepath = os.path.join(str(tmpdir), 'image_{}.jpg'.format(i))
+        cv2.imwrite(filepath, prng.randint(0, 256, size=(height, width, 3)).astype(np.uint8))
+
+        records.append({'filename': os.path.basename(filepath),
+                        'filepath': filepath,
+                        'type': 'trainval',
+                        'height': height,
+                        'width': width,
+                        'boxes': [[2, 3, height // 2, width // 2], [1, 1, height - 1, width - 1]][:i + 1],
+                        'label_ids': [1, 2][:i + 1]})
+
+    # 与VocDetectionDataset.prepare()一样，labels为类别名
+    store = DetectionAnnotationStore.from_records(records, {'dog': 1, 'cat': 2})
+
+    return ImageListView(store)
+
+
+def test_pack_open_and_generate(tmpdir, image_list):
+    shard_dir = os.path.join(str(tmpdir), 'shards')
+
+    assert pack_shards(image_list, shard_dir, MAX_DIM, shard_size=2) == len(image_list)
+
+    dataset = ShardedImageDataset(shard_dir)
+
+    assert len(dataset) == len(image_list)
+    assert dataset.stale_reason(max_dim=MAX_DIM, image_list=image_list) is None
+    assert dataset.stale_reason(max_dim=MAX_DIM * 2) is not None
+
+    for index, image_info in enumerate(image_list):
+        np.testing.assert_array_equal(dataset.get_labels(index), image_info['labels'])
+
+    inputs, _ = next(shard_image_generator(dataset, batch_size=2, max_gt_num=4))
+    batch_image, batch_image_meta, batch_class_ids, batch_bbox = inputs
+
+    assert batch_image.shape == (2, MAX_DIM, MAX_DIM, 3) and batch_image.dtype == np.uint8
+    assert batch_image_meta.shape == (2, 12)
+    assert batch_class_ids.shape == (2, 4, 2)
+    assert batch_bbox.shape == (2, 4, 5)
+
+
+def test_changed_dataset_is_stale(tmpdir, image_list):
+    shard_dir = os.path.join(str(tmpdir), 'shards')
+    pack_shards(image_list, shard_dir, MAX_DIM)
+
+    # 图像文件修改后指纹变化
+    os.utime(image_list[0]['filepath'], ns=(1, 1))
+
+    assert ShardedImageDataset(shard_dir).stale_reason(image_list=image_list) is not None
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+"""
+TensorFlow数据增强与NumPy实现的一致性
+"""
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+pytest.importorskip('tensorflow')
+
+from taurus_cv.models.retinanet.model.generator import TRANSFORM_ARGS
+from taurus_cv.models.retinanet.model.image import IMAGE_MEAN_BGR, TransformParameters, apply_transform, adjust_transform_for_image
+from taurus_cv.models.retinanet.model.transform import random_transform, transform_aabbs
+from taurus_cv.models.retinanet.model.tf_augmentation import TFAugmenter
+
+
+def random_case(prng, image_shape, num_boxes, dtype):
+    height, width = image_shape[:2]
+    image = prng.randint(0, 256, size=image_shape).astype(dtype)
+
+    xy = prng.uniform(0, 1, size=(num_boxes, 2)) * [width / 2, height / 2]
+    wh = prng.uniform(0.1, 1, size=(num_boxes, 2)) * [width / 4, height / 4]
+    boxes = np.concatenate([xy, xy + wh], axis=1)
+
+    return image, boxes
+
+
+@pytest.fixture(scope='module')
+def prng():
+    return np.random.RandomState(0)
+
+
+@pytest.mark.parametrize('dtype, fill_value', [(np.float32, (0., 0., 0.)),
+                                               (np.uint8, tuple(np.round(IMAGE_MEAN_BGR)))])
+def test_matches_numpy_transform(prng, dtype, fill_value):
+    params = TransformParameters(fill_mode='constant', cval=fill_value)
+    augmenter = TFAugmenter(params)
+
+    try:
+        for _ in range(5):
+            image, boxes = random_case(prng, (300, 400, 3), 8, dtype)
+            transform = adjust_transform_for_image(random_transform(prng=prng, **TRANSFORM_ARGS), image, params.relative_translation)
+
+            np_image = apply_transform(transform, image, params)
+            np_boxes = transform_aabbs(transform, boxes)
+
+            tf_images, tf_boxes = augmenter.run(image[np.newaxis], transform[np.newaxis], boxes[np.newaxis].astype(np.float32))
+
+            assert tf_images.dtype == image.dtype
+            np.testing.assert_allclose(tf_boxes[0], np_boxes, atol=1e-2)
+
+            # 边界1像素内两种实现对越界的处理不同，只比较内部，包括填充区域
+            pixel_error = np.mean(np.abs(tf_images[0].astype(np.float32) - np_image.astype(np.float32))[1:-1, 1:-1])
+            assert pixel_error < 2.
+    finally:
+        augmenter.close()
+
+
+def test_fill_matches_uint8_padding():
+    mean = np.round(IMAGE_MEAN_BGR)
+    augmenter = TFAugmenter(fill_value=mean)
+
+    try:
+        image = np.zeros((1, 32, 32, 3), dtype=np.uint8)
+
+        # 平移出画面，输出全部是填充值
+        transform = np.array([[[1., 0., 100.], [0., 1., 100.], [0., 0., 1.]]])
+        output, _ = augmenter.run(image, transform, np.zeros((1, 1, 4), dtype=np.float32))
+
+        np.testing.assert_array_equal(output[0], np.broadcast_to(mean.astype(np.uint8), output[0].shape))
+    finally:
+        augmenter.close()
+
+
+def test_rejects_non_constant_fill():
+    with pytest.raises(ValueError):
+        TFAugmenter(TransformParameters(fill_mode='nearest'))
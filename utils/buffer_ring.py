@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+"""
+批数据缓冲环，生成器循环复用预先分配的批数据内存，避免每个batch重新分配
+"""
+
+import threading
+import numpy as np
+
+
+class BatchBuffers(object):
+    """
+    一个缓冲槽，按名字保存若干块连续内存，取出时按需要的形状和类型解释
+    """
+
+    def __init__(self):
+        self.buffers = {}
+
+    def get(self, name, shape, dtype, zero=False):
+        """
+        获取指定形状的数组，返回的是缓冲区上的连续视图，容量不够时才重新分配
+        :param name: 缓冲区名字，如images、regression
+        :param shape: 数组形状
+        :param dtype: 数组类型
+        :param zero: 是否清零
+        :return:
+        """
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.nbytes < nbytes:
+            buffer = np.empty((nbytes,), dtype=np.uint8)
+            self.buffers[name] = buffer
+
+        array = buffer[:nbytes].view(dtype).reshape(shape)
+
+        if zero:
+            array.fill(0)
+
+        return array
+
+
+# fit_generator的max_queue_size默认值
+DEFAULT_MAX_QUEUE_SIZE = 10
+
+
+def required_ring_size(max_queue_size=DEFAULT_MAX_QUEUE_SIZE, workers=1, prefetch_depth=0):
+    """
+    缓冲环至少需要的槽数：队列中的batch、每个worker正在生成的batch、预取中的batch，
+    再加上正在训练的batch和生成器刚交出还没放进队列的batch
+    :param max_queue_size: fit_generator的max_queue_size
+    :param workers: fit_generator的workers
+    :param prefetch_depth: 生成器之后再预取的batch数
+    :return: int
+    """
+    return int(max_queue_size) + max(1, int(workers)) + max(0, int(prefetch_depth)) + 2
+
+
+class BatchBufferRing(object):
+    """
+    缓冲环，每个batch依次使用下一个缓冲槽
+    注意: 生成器输出的是缓冲区上的视图，fit_generator会预先取max_queue_size(默认10)个batch放入队列，
+    所以环的大小不能小于required_ring_size，否则还没被消费的batch会被原地覆盖
+    """
+
+    def __init__(self, size=None):
+        """
+        :param size: 缓冲槽个数，None时按fit_generator的默认参数计算
+        """
+        if size is None:
+            size = required_ring_size()
+
+        if size < required_ring_size(max_queue_size=0, workers=1):
+            raise ValueError('缓冲环太小: {}'.format(size))
+
+        self.size = size
+        self.slots = [BatchBuffers() for _ in range(size)]
+        self.index = 0
+        self.lock = threading.Lock()
+
+    def next(self):
+        """
+        获取下一个缓冲槽，多线程生成时每个batch拿到不同的槽
+        :return: BatchBuffers
+        """
+        with self.lock:
+            slot = self.slots[self.index]
+            self.index = (self.index + 1) % self.size
+
+        return slot
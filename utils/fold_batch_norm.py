@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+"""
+推理时把BatchNormalization折叠进前面的卷积
+BN在推理时是逐通道的仿射变换 y = (x - mean) / sqrt(var + eps) * gamma + beta，
+可以并入卷积的kernel和bias，省去BN的多次内存读写
+"""
+
+import time
+import numpy as np
+from keras import backend
+from keras.layers import Input, Conv2D, BatchNormalization, TimeDistributed
+from keras.models import Model
+
+
+def unwrap(layer):
+    """
+    TimeDistributed包装的层返回内部的层
+    """
+    return layer.layer if isinstance(layer, TimeDistributed) else layer
+
+
+def find_conv_bn_pairs(model):
+    """
+    查找可以折叠的(卷积,BN)对：BN的唯一输入是卷积，卷积的输出只被这个BN使用，BN作用在通道维(最后一维)
+    支持TimeDistributed(Conv2D)后接TimeDistributed(BatchNormalization)
+    :param model: keras模型
+    :return: [(conv_layer, bn_layer)]
+    """
+    pairs = []
+
+    for layer in model.layers:
+
+        if isinstance(layer, Model):
+            pairs.extend(find_conv_bn_pairs(layer))
+            continue
+
+        bn = unwrap(layer)
+        if not isinstance(bn, BatchNormalization) or len(layer._inbound_nodes) != 1:
+            continue
+
+        inbound_layers = layer._inbound_nodes[0].inbound_layers
+        if len(inbound_layers) != 1:
+            continue
+
+        conv_layer = inbound_layers[0]
+        if not isinstance(unwrap(conv_layer), Conv2D) or len(conv_layer._outbound_nodes) != 1:
+            continue
+
+        # TimeDistributed的内部层看不到时间维
+        if isinstance(layer, TimeDistributed) != isinstance(conv_layer, TimeDistributed):
+            continue
+
+        rank = len(backend.int_shape(layer.output)) - (1 if isinstance(layer, TimeDistributed) else 0)
+        if bn.axis not in (-1, rank - 1):
+            continue
+
+        pairs.append((conv_layer, layer))
+
+    return pairs
+
+
+def fold_conv_bn_weights(kernel, bias, gamma, beta, mean, variance, epsilon):
+    """
+    计算折叠后的卷积权重
+    :param kernel: [kh,kw,in,out]
+    :param bias: [out]，卷积没有bias时为0
+    :return: kernel, bias
+    """
+    scale = gamma / np.sqrt(variance + epsilon)
+    return kernel * scale, (bias - mean) * scale + beta
+
+
+def bn_weights(bn):
+    """
+    BN的gamma, beta, moving_mean, moving_variance，没有scale或center时补1和0
+    """
+    weights = bn.get_weights()
+    channels = weights[-1].shape[0]
+
+    gamma = weights.pop(0) if bn.scale else np.ones((channels,), dtype=np.float32)
+    beta = weights.pop(0) if bn.center else np.zeros((channels,), dtype=np.float32)
+    mean, variance = weights
+
+    return gamma, beta, mean, variance
+
+
+def fold_batch_norms(model):
+    """
+    折叠模型中所有可以折叠的BN，返回只用于推理的新模型
+    卷积有bias时BN变为恒等；没有bias时BN只剩一个bias_add
+    注意：卷积权重原地修改，原模型不能再使用
+    :param model: 已载入权重的keras模型
+    :return: 新模型, 折叠的BN数
+    """
+    pairs = find_conv_bn_pairs(model)
+
+    for conv_layer, bn_layer in pairs:
+        conv = unwrap(conv_layer)
+        bn = unwrap(bn_layer)
+
+        conv_weights = conv.get_weights()
+        kernel = conv_weights[0]
+        bias = conv_weights[1] if conv.use_bias else np.zeros((kernel.shape[-1],), dtype=kernel.dtype)
+
+        kernel, bias = fold_conv_bn_weights(kernel, bias, *bn_weights(bn), epsilon=bn.epsilon)
+
+        if conv.use_bias:
+            conv.set_weights([kernel, bias])
+            shift = None
+        else:
+            conv.set_weights([kernel])
+            shift = backend.constant(bias)
+
+        # 替换BN的计算，重新调用模型时生效；TimeDistributed直接替换外层，省去reshape
+        bn_layer.call = (lambda inputs, **kwargs: inputs) if shift is None else \
+            (lambda inputs, shift=shift, **kwargs: backend.bias_add(inputs, shift))
+
+    return rebuild(model), len(pairs)
+
+
+def rebuild(model):
+    """
+    在新的输入上重新调用所有层，折叠后调用得到不含BN计算的图
+    :param model: keras模型
+    :return: 新模型
+    """
+    inputs = [Input(batch_shape=backend.int_shape(tensor), dtype=tensor.dtype.base_dtype.name) for tensor in model.inputs]
+    outputs = model(inputs if len(inputs) > 1 else inputs[0])
+
+    return Model(inputs=inputs, outputs=outputs)
+
+
+def benchmark(model, inputs, runs=20, warmup=3):
+    """
+    推理延迟
+    :param model: keras模型
+    :param inputs: 模型输入
+    :param runs: 计时次数
+    :param warmup: 预热次数，不计时
+    :return: 平均延迟(秒)，最后一次的输出
+    """
+    for _ in range(warmup):
+        model.predict_on_batch(inputs)
+
+    start = time.time()
+    for _ in range(runs):
+        outputs = model.predict_on_batch(inputs)
+
+    return (time.time() - start) / runs, outputs
+
+
+def fold_and_benchmark(model, inputs, runs=20, warmup=3, atol=1e-3, compare_layers=None):
+    """
+    折叠BN并对比折叠前后的输出和延迟
+    模型输出经过nms时，微小的数值误差就可能改变边框的顺序，应通过compare_layers对比nms之前的层
+    :param model: 已载入权重的keras模型
+    :param inputs: 模型输入
+    :param atol: 输出最大绝对误差的容许值
+    :param compare_layers: 对比输出的层名，None时对比模型的输出
+    :return: 折叠后的模型, 统计信息
+    """
+    probe = None
+    if compare_layers:
+        probe = Model(inputs=model.inputs, outputs=[model.get_layer(name).output for name in compare_layers])
+        outputs = probe.predict_on_batch(inputs)
+
+    latency, model_outputs = benchmark(model, inputs, runs, warmup)
+
+    folded_model, folded_num = fold_batch_norms(model)
+    folded_latency, folded_model_outputs = benchmark(folded_model, inputs, runs, warmup)
+
+    if probe is None:
+        compare_layers, outputs, folded_outputs = model.output_names, model_outputs, folded_model_outputs
+    else:
+        # probe与模型共用层，重新调用得到折叠后的图
+        folded_outputs = rebuild(probe).predict_on_batch(inputs)
+
+    if not isinstance(outputs, list):
+        outputs, folded_outputs = [outputs], [folded_outputs]
+
+    errors = {name: float(np.max(np.abs(a - b))) if a.size else 0. for name, a, b in zip(compare_layers, outputs, folded_outputs)}
+    max_error = max(errors.values())
+
+    stats = {'folded_num': folded_num,
+             'latency': latency,
+             'folded_latency': folded_latency,
+             'speedup': latency / max(folded_latency, 1e-12),
+             'errors': errors,
+             'max_error': max_error}
+
+    print('折叠BN:{folded_num} 延迟:{latency:.4f}s -> {folded_latency:.4f}s 加速:{speedup:.2f}x 最大误差:{max_error:.6f}'.format(**stats))
+    for name in compare_layers:
+        print('  {}: {:.6f}'.format(name, errors[name]))
+
+    if max_error > atol:
+        print('警告: 折叠后的输出误差超过{}'.format(atol))
+
+    return folded_model, stats
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+"""
+冻结的推理图，导出时变量转为常量并做常量折叠，推理时用普通的tf.Session运行，不需要重建keras模型和载入权重
+导出文件:
+    model.pb       冻结的GraphDef
+    model.pb.json  输入输出张量名
+"""
+
+import json
+import h5py
+import keras
+import tensorflow as tf
+from tensorflow.tools.graph_transforms import TransformGraph
+
+# 图变换，while循环(map_fn)中的Identity不能删除，所以不使用remove_nodes
+GRAPH_TRANSFORMS = ['fold_constants(ignore_errors=true)',
+                    'fold_batch_norms',
+                    'fold_old_batch_norms',
+                    'sort_by_execution_order']
+
+
+def freeze_model(model, output_path, transforms=GRAPH_TRANSFORMS):
+    """
+    冻结keras模型，只保留输出依赖的节点，训练用的目标层和损失层不会被导出
+    调用前应先keras.backend.set_learning_phase(0)再构建模型
+    :param model: 推理模型，权重已载入
+    :param output_path: pb文件路径
+    :param transforms: 图变换列表，None不做变换
+    :return: 节点数
+    """
+    session = keras.backend.get_session()
+
+    input_names = [tensor.op.name for tensor in model.inputs]
+    output_names = [tensor.op.name for tensor in model.outputs]
+
+    # 变量转为常量，同时去掉输出不依赖的节点
+    graph_def = tf.graph_util.convert_variables_to_constants(session,
+                                                             session.graph.as_graph_def(),
+                                                             output_names)
+
+    if transforms:
+        graph_def = TransformGraph(graph_def, input_names, output_names, transforms)
+
+    with tf.gfile.GFile(output_path, 'wb') as f:
+        f.write(graph_def.SerializeToString())
+
+    with open(output_path + '.json', 'w') as f:
+        json.dump({'inputs': [tensor.name for tensor in model.inputs],
+                   'outputs': [tensor.name for tensor in model.outputs]}, f, indent=2)
+
+    return len(graph_def.node)
+
+
+def missing_weight_layers(model, weight_path):
+    """
+    模型中有权重、但keras权重文件中没有的层；load_weights(by_name=True)会静默跳过这些层
+    :param model: keras模型
+    :param weight_path: save_weights或save保存的h5文件
+    :return: 层名列表
+    """
+    saved = set()
+
+    with h5py.File(weight_path, 'r') as f:
+        group = f['model_weights'] if 'layer_names' not in f.attrs and 'model_weights' in f else f
+
+        for name in group.attrs['layer_names']:
+            name = name.decode('utf8') if isinstance(name, bytes) else name
+            if len(group[name].attrs['weight_names']):
+                saved.add(name)
+
+    return [layer.name for layer in model.layers if layer.weights and layer.name not in saved]
+
+
+class FrozenGraph(object):
+    """
+    冻结推理图的载入和运行，predict与keras模型的predict输入输出一致
+    """
+
+    def __init__(self, graph_path, threads=0):
+        """
+        :param graph_path: freeze_model导出的pb文件路径
+        :param threads: intra-op线程数，0表示使用全部核
+        """
+        with open(graph_path + '.json') as f:
+            names = json.load(f)
+
+        graph_def = tf.GraphDef()
+        with tf.gfile.GFile(graph_path, 'rb') as f:
+            graph_def.ParseFromString(f.read())
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+
+        self.inputs = [self.graph.get_tensor_by_name(name) for name in names['inputs']]
+        self.outputs = [self.graph.get_tensor_by_name(name) for name in names['outputs']]
+
+        config = tf.ConfigProto(intra_op_parallelism_threads=threads, inter_op_parallelism_threads=threads)
+        config.gpu_options.allow_growth = True
+        self.session = tf.Session(graph=self.graph, config=config)
+
+    def predict(self, inputs):
+        """
+        :param inputs: 输入数组或数组列表，顺序与导出时模型的inputs一致
+        :return: 输出数组列表，只有一个输出时返回数组
+        """
+        if not isinstance(inputs, (list, tuple)):
+            inputs = [inputs]
+
+        outputs = self.session.run(self.outputs, feed_dict=dict(zip(self.inputs, inputs)))
+
+        return outputs[0] if len(outputs) == 1 else outputs
+
+    def predict_on_batch(self, inputs):
+        return self.predict(inputs)
+
+    def close(self):
+        self.session.close()
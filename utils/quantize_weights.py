@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# Author:Speciallan
+
+"""
+训练后的权重量化，减小权重文件和载入时的读盘量，载入时反量化为float32，计算图不变
+    int8     卷积和全连接的kernel按输出通道(最后一维)对称量化，每个通道一个float32的scale；
+             bias和BN等一维权重保持float32
+    float16  所有权重按float16保存
+文件为不压缩的npz，载入时逐层读取、反量化并set_weights，同一时刻只有一层的float32副本
+"""
+
+import os
+import time
+import resource
+import numpy as np
+
+QUANTIZE_MODES = ('int8', 'float16')
+
+
+def quantize_per_channel(weight):
+    """
+    按最后一维对称量化到int8
+    :param weight: float32数组，ndim>=2
+    :return: int8数组, scale [channels]
+    """
+    axes = tuple(range(weight.ndim - 1))
+    scale = np.max(np.abs(weight), axis=axes) / 127.
+    scale = np.where(scale > 0, scale, 1.).astype(np.float32)
+
+    quantized = np.clip(np.round(weight / scale), -127, 127).astype(np.int8)
+
+    return quantized, scale
+
+
+def dequantize_per_channel(quantized, scale):
+    return quantized.astype(np.float32) * scale
+
+
+def quantize_model_weights(model, output_path, mode='int8'):
+    """
+    量化模型权重并保存
+    :param model: 已载入权重的keras模型
+    :param output_path: npz文件路径
+    :param mode: int8或float16
+    :return: 统计信息
+    """
+    if mode not in QUANTIZE_MODES:
+        raise ValueError('不支持的量化方式: {}, 可选: {}'.format(mode, QUANTIZE_MODES))
+
+    arrays = {}
+    layer_names = []
+    float_bytes = 0
+    max_error = 0.
+
+    for layer in model.layers:
+        weights = layer.get_weights()
+        if not weights:
+            continue
+
+        layer_index = len(layer_names)
+        layer_names.append(layer.name)
+
+        for weight_index, weight in enumerate(weights):
+            key = '{}_{}'.format(layer_index, weight_index)
+            float_bytes += weight.nbytes
+
+            if mode == 'float16':
+                arrays[key] = weight.astype(np.float16)
+                restored = arrays[key].astype(np.float32)
+            elif weight.ndim >= 2:
+                arrays[key], arrays[key + '_scale'] = quantize_per_channel(weight)
+                restored = dequantize_per_channel(arrays[key], arrays[key + '_scale'])
+            else:
+                arrays[key] = weight
+                restored = weight
+
+            if weight.size:
+                max_error = max(max_error, float(np.max(np.abs(restored - weight))))
+
+        arrays['{}_num'.format(layer_index)] = np.array(len(weights), dtype=np.int32)
+
+    arrays['mode'] = np.array(mode)
+    arrays['layer_names'] = np.array(layer_names)
+
+    # 先写临时文件再替换，np.savez会给没有.npz后缀的路径补后缀，所以传入文件对象
+    tmp_path = '{}.{}.tmp'.format(output_path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, output_path)
+
+    stats = {'mode': mode,
+             'layers': len(layer_names),
+             'float_bytes': float_bytes,
+             'file_bytes': os.path.getsize(output_path),
+             'max_error': max_error}
+
+    print('量化({mode}) 层数:{layers} float32权重:{float_bytes} -> 文件:{file_bytes} 字节 最大误差:{max_error:.6f}'.format(**stats))
+
+    return stats
+
+
+def load_quantized_weights(model, path, skip_missing=True):
+    """
+    载入量化后的权重，按层名匹配，与load_weights(by_name=True)的行为一致
+    :param model: keras模型
+    :param path: quantize_model_weights保存的文件
+    :param skip_missing: 跳过文件中有而模型中没有的层
+    :return: 统计信息
+    """
+    start = time.time()
+    layers = {layer.name: layer for layer in model.layers}
+    loaded_num = 0
+
+    with np.load(path, allow_pickle=False) as data:
+        mode = str(data['mode'])
+
+        for layer_index, name in enumerate(data['layer_names']):
+            name = str(name)
+            if name not in layers:
+                if skip_missing:
+                    continue
+                raise ValueError('模型中没有层: {}'.format(name))
+
+            weights = []
+            for weight_index in range(int(data['{}_num'.format(layer_index)])):
+                key = '{}_{}'.format(layer_index, weight_index)
+                weight = data[key]
+
+                if mode == 'int8' and weight.dtype == np.int8:
+                    weight = dequantize_per_channel(weight, data[key + '_scale'])
+                else:
+                    weight = weight.astype(np.float32)
+
+                weights.append(weight)
+
+            layers[name].set_weights(weights)
+            loaded_num += 1
+
+    # ru_maxrss在linux下单位为KB
+    stats = {'mode': mode,
+             'layers': loaded_num,
+             'load_time': time.time() - start,
+             'file_bytes': os.path.getsize(path),
+             'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+
+    print('载入量化权重({mode}) 层数:{layers} 文件:{file_bytes} 字节 载入:{load_time:.3f}s 进程峰值内存:{max_rss} 字节'.format(**stats))
+
+    return stats